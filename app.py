@@ -1,13 +1,27 @@
 
 from flask import Flask, make_response, json, request
 
+from pycaptcha.config import AdmissionConfig
+from pycaptcha.strategy.captcha_registry import SIMPLE_CAPTCHA
 from pycaptcha.strategy.captcha_strategy import CaptchaStrategy
+from pycaptcha.utils.admission import AdmissionRejected
+from pycaptcha.utils.metrics import PrometheusSink, set_metrics_sink
 
 app = Flask(__name__)
 
 redis_url = 'redis://localhost:6379/0'
 
-captchaStrategy = CaptchaStrategy(redis_url)
+# 按客户端 IP 限速, 同时渲染数超过上限时直接返回 429
+class AppAdmissionConfig(AdmissionConfig):
+    admission_enabled = True
+
+captchaStrategy = CaptchaStrategy(redis_url, admissionConfigs=AppAdmissionConfig)
+# 验证码模块与资源在首次使用时加载, 启动时预热使首个请求不必等待
+captchaStrategy.warm_up()
+
+# 各阶段与 redis 调用耗时, 由 /metrics 以 Prometheus 文本格式输出
+metricsSink = PrometheusSink()
+set_metrics_sink(metricsSink)
 
 # 获取请求参数
 def get_request_params(request):
@@ -41,10 +55,26 @@ def response(data_dict, status=200):
 
 @app.route('/api/auth/captcha/gen', methods=['POST','GET'])
 def gen():  # put application's code here
-    data = captchaStrategy.get_captcha()
+    try:
+        data = captchaStrategy.get_captcha(client_key=request.remote_addr)
+    except AdmissionRejected as e:
+        resp = response({'code': 429, 'message': '请求过于频繁，请稍后重试'}, 429)
+        resp.headers['Retry-After'] = str(e.retry_after)
+        return resp
     #
     return response(data)
 
+# 图片按地址交付时 (image_delivery = "url") 返回图片字节, 每张图片只能读取一次
+@app.route('/captcha/<token>/<name>', methods=['GET'])
+def captcha_image(token, name):
+    image = captchaStrategy.take_image(token, name)
+    if image is None:
+        return response({'code': 404, 'message': '图片不存在或已过期'}, 404)
+    resp = make_response(image[0])
+    resp.headers['Content-Type'] = image[1]
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
 @app.route('/api/auth/captcha/login', methods=['POST','GET'])
 def login():  # put application's code here
     params_dict = get_request_params(request)
@@ -55,22 +85,40 @@ def login():  # put application's code here
     else:
         return response({'code':500,'message':'登录失败'})
 
+@app.route('/api/auth/captcha/login/batch', methods=['POST'])
+def login_batch():
+    params_dict = get_request_params(request)
+    captcha_ids = params_dict.get('captcha_ids')
+    if not isinstance(captcha_ids, list):
+        return response({'code': 500, 'message': '参数错误'})
+    results = captchaStrategy.second_verify_many(captcha_ids)
+    return response({'code': 200, 'data': [{'captcha_id': captcha_id, 'success': result}
+                                           for captcha_id, result in zip(captcha_ids, results)]})
+
 @app.route('/api/auth/captcha/check', methods=['POST'])
 def check():
     params_dict = get_request_params(request)
     token = params_dict.get('id')
     data = params_dict.get('data')
-    track_list = data.get("trackList")
-    if token is None or data is None or track_list is None or not isinstance(track_list,list):
+    if not isinstance(token, str) or not isinstance(data, dict):
         return response({'code':500,'message':'人机验证失败'})
     #
     points = []
-    for track in track_list:
-        if 'type' not in track:
-            continue
-        type = track.get('type')
-        if type == 'up' or type == 'click':
-            points.append({'x':track.get('x'),'y':track.get('y')})
+    if token.startswith(SIMPLE_CAPTCHA + '-'):
+        # 字符验证码 (type 为 SIMPLE_) 提交输入的字符: {"id": token, "data": {"code": "..."}}
+        code = data.get('code')
+        if isinstance(code, str) and code:
+            points.append({'code': code})
+    else:
+        track_list = data.get("trackList")
+        if not isinstance(track_list,list):
+            return response({'code':500,'message':'人机验证失败'})
+        for track in track_list:
+            if 'type' not in track:
+                continue
+            type = track.get('type')
+            if type == 'up' or type == 'click':
+                points.append({'x':track.get('x'),'y':track.get('y')})
     #
     if len(points) == 0:
         return response({'code': 500, 'message': '人机验证失败'})
@@ -83,6 +131,14 @@ def check():
     return response({'code': 200, 'message': '人机验证通过','data':{'id':captcha_id,'success':True}})
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    text = metricsSink.exposition() + captchaStrategy.selector.exposition()
+    if captchaStrategy.admission is not None:
+        text += captchaStrategy.admission.exposition()
+    resp = make_response(text)
+    resp.headers['Content-Type'] = metricsSink.content_type
+    return resp
 
 if __name__ == '__main__':
     app.run()
@@ -0,0 +1,98 @@
+from quart import Quart, make_response, json, request
+
+from pycaptcha.strategy.async_captcha_strategy import AsyncCaptchaStrategy
+
+app = Quart(__name__)
+
+redis_url = 'redis://localhost:6379/0'
+
+captchaStrategy = AsyncCaptchaStrategy(redis_url)
+
+# 获取请求参数
+async def get_request_params(request):
+    params_dict = {}
+    # 从QueryString取
+    try:
+        params_dict.update(dict(request.args))
+    except Exception:
+        pass
+    # 从form读取
+    try:
+        params_dict.update(dict(await request.form))
+    except Exception:
+        pass
+    # 从json中取
+    try:
+        params_dict.update(await request.get_json())
+    except Exception:
+        pass
+    #
+    return params_dict
+
+# 响应数据返回给前端，data可以是字典或类对象
+async def response(data_dict, status=200):
+    resp = await make_response(json.dumps(data_dict, ensure_ascii=False),status)
+    resp.headers['Content-Type'] = 'application/json'
+    return resp
+
+@app.route('/api/auth/captcha/gen', methods=['POST','GET'])
+async def gen():
+    data = await captchaStrategy.get_captcha()
+    #
+    return await response(data)
+
+# 图片按地址交付时 (image_delivery = "url") 返回图片字节, 每张图片只能读取一次
+@app.route('/captcha/<token>/<name>', methods=['GET'])
+async def captcha_image(token, name):
+    image = await captchaStrategy.take_image(token, name)
+    if image is None:
+        return await response({'code': 404, 'message': '图片不存在或已过期'}, 404)
+    resp = await make_response(image[0])
+    resp.headers['Content-Type'] = image[1]
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+@app.route('/api/auth/captcha/login', methods=['POST','GET'])
+async def login():
+    params_dict = await get_request_params(request)
+    captcha_id = params_dict.get('captcha_id')
+    result = await captchaStrategy.second_verify(captcha_id)
+    if result:
+        return await response({'code':200,'message':'登录成功'})
+    else:
+        return await response({'code':500,'message':'登录失败'})
+
+@app.route('/api/auth/captcha/check', methods=['POST'])
+async def check():
+    params_dict = await get_request_params(request)
+    token = params_dict.get('id')
+    data = params_dict.get('data')
+    if token is None or data is None or not isinstance(data.get("trackList"),list):
+        return await response({'code':500,'message':'人机验证失败'})
+    #
+    points = []
+    for track in data.get("trackList"):
+        if 'type' not in track:
+            continue
+        type = track.get('type')
+        if type == 'up' or type == 'click':
+            points.append({'x':track.get('x'),'y':track.get('y')})
+    #
+    if len(points) == 0:
+        return await response({'code': 500, 'message': '人机验证失败'})
+    #
+    captcha_id = await captchaStrategy.verify(token,points)
+    #
+    if captcha_id is None:
+        return await response({'code': 500, 'message': '人机验证失败'})
+    #
+    return await response({'code': 200, 'message': '人机验证通过','data':{'id':captcha_id,'success':True}})
+
+@app.after_serving
+async def shutdown():
+    await captchaStrategy.close()
+
+
+
+if __name__ == '__main__':
+    app.run()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+encode time against payload size for every image output preset and captcha image
+
+    python benchmarks/image_encoding.py -n 50
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from pycaptcha.strategy.block_puzzle_captcha import BlockPuzzleCaptcha
+from pycaptcha.strategy.click_word_captcha import ClickWordCaptcha
+from pycaptcha.strategy.simple_captcha import SimpleCaptcha
+from pycaptcha.utils.image_encoder import IMAGE_ENCODER_PRESETS, get_image_encoder
+
+
+def sample_images() -> dict:
+    """ 每种验证码各渲染一组图片, 不写缓存 """
+
+    block = BlockPuzzleCaptcha()
+    background_image = block.get_background_image()
+    template_image = block.get_template_image()
+    block.picture_templates_cut(background_image, template_image)
+
+    click = ClickWordCaptcha()
+    click_background = click.get_background_image()
+    _, word_list = click.get_image_data(click_background)
+
+    _, simple_image = SimpleCaptcha.draw_code()
+    return {
+        "slider background": background_image.rgba_image,
+        "slider piece": template_image.rgba_image,
+        "click background": click_background.rgba_image,
+        "click hint": click.draw_template_image(60, word_list),
+        "simple": simple_image,
+    }
+
+
+def measure(encoder, image, n: int) -> tuple:
+    size = len(encoder.encode(image))
+    start = time.perf_counter()
+    for _ in range(n):
+        encoder.encode(image)
+    return (time.perf_counter() - start) / n * 1e3, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=50, help="encodes per cell")
+    parser.add_argument("--presets", nargs="*", default=list(IMAGE_ENCODER_PRESETS))
+    args = parser.parse_args()
+
+    images = sample_images()
+    print(f"{'image':<18} {'preset':<17} {'ms':>7} {'bytes':>8} {'vs png':>7}")
+    for name, image in images.items():
+        _, png_size = measure(get_image_encoder("png"), image, 1)
+        for preset in args.presets:
+            encoder = get_image_encoder(preset)
+            if name == "slider piece" and encoder.format == "JPEG":
+                # 拼图块需要透明通道
+                continue
+            ms, size = measure(encoder, image, args.n)
+            print(f"{name:<18} {preset:<17} {ms:>7.2f} {size:>8} {size / png_size:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+cold-start time of a fresh interpreter: import, construct CaptchaStrategy, first verify and first render,
+with lazy loading and with everything loaded up front as before
+
+    python benchmarks/import_time.py -n 15
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在全新的解释器中运行, 各阶段时间从脚本开始累计
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+eager = sys.argv[1] == "eager"
+if eager:
+    import concurrent.futures.process
+    import PIL.Image, PIL.ImageChops, PIL.ImageDraw, PIL.ImageFilter, PIL.ImageFont
+from pycaptcha.strategy.captcha_strategy import CaptchaStrategy
+stages = {"import": time.perf_counter() - start}
+strategy = CaptchaStrategy("memory://")
+if eager:
+    for kind in ("SIMPLE_", "SLIDER", "WORD_IMAGE_CLICK"):
+        captcha = strategy.get_captcha_instance(kind)
+        getattr(captcha, "ensure_set_up", lambda: None)()
+stages["construct"] = time.perf_counter() - start
+strategy.verify("SLIDER-00000000000000000000000000000000", [{"x": 1, "y": 1}])
+stages["first_verify"] = time.perf_counter() - start
+pil_loaded = "PIL.Image" in sys.modules
+strategy.get_block_captcha()
+stages["first_render"] = time.perf_counter() - start
+print(json.dumps({"stages": stages, "pil_on_verify": pil_loaded, "modules": len(sys.modules)}))
+"""
+
+# 两种方式都需要的 redis-py 导入
+REDIS_CHILD = """
+import json, time
+start = time.perf_counter()
+import redis
+print(json.dumps({"stages": {"import": time.perf_counter() - start}, "pil_on_verify": False, "modules": 0}))
+"""
+
+
+def run_child(mode: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    source = REDIS_CHILD if mode == "redis" else CHILD
+    output = subprocess.run([sys.executable, "-c", source, mode], capture_output=True, text=True, check=True,
+                            env=env, cwd=ROOT).stdout
+    # get_block_captcha 会打印 token, 结果在最后一行
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(mode: str, n: int) -> dict:
+    runs = [run_child(mode) for _ in range(n)]
+    return {
+        "stages": {stage: statistics.median(run["stages"][stage] for run in runs) for stage in runs[0]["stages"]},
+        "pil_on_verify": runs[0]["pil_on_verify"],
+        "modules": runs[0]["modules"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=15, help="fresh interpreters per mode, the median is reported")
+    args = parser.parse_args()
+
+    results = {mode: measure(mode, args.n) for mode in ("eager", "lazy")}
+    redis_import = measure("redis", args.n)["stages"]["import"]
+    print(f"{'stage (cumulative ms)':<22}{'eager':>10}{'lazy':>10}{'saved':>10}")
+    for stage in results["eager"]["stages"]:
+        eager = results["eager"]["stages"][stage] * 1000
+        lazy = results["lazy"]["stages"][stage] * 1000
+        print(f"{stage:<22}{eager:>10.1f}{lazy:>10.1f}{eager - lazy:>10.1f}")
+    for mode, result in results.items():
+        print(f"{mode}: PIL imported before first render: {result['pil_on_verify']}, "
+              f"modules after first render: {result['modules']}")
+    print(f"import includes redis-py ({redis_import * 1000:.1f} ms), needed by both modes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+measure redis memory per outstanding challenge for the legacy and compact key/value schemas
+
+    python benchmarks/redis_memory.py --redis-url redis://localhost:6379/15 -n 100000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+
+import redis as rd
+
+from pycaptcha.config import BlockPuzzleCaptchaConfig, ClickWordCaptchaConfig
+from pycaptcha.strategy.block_puzzle_captcha import BlockPuzzleCaptcha
+from pycaptcha.strategy.click_word_captcha import ClickWordCaptcha
+from pycaptcha.utils.uuid_util import generate_uuid
+
+
+class LegacyBlockConfig(BlockPuzzleCaptchaConfig):
+    block_puzzle_captcha_value_codec = "json"
+
+
+class LegacyClickConfig(ClickWordCaptchaConfig):
+    click_word_captcha_value_codec = "json"
+
+
+class CompactBlockConfig(BlockPuzzleCaptchaConfig):
+    block_puzzle_captcha_cache_key = "bp"
+    block_puzzle_captcha_token_id_format = "base32"
+
+
+class CompactClickConfig(ClickWordCaptchaConfig):
+    click_word_captcha_cache_key = "cw"
+    click_word_captcha_token_id_format = "base32"
+
+
+def fill(client, captcha, answers: list) -> None:
+    pipeline = client.pipeline(transaction=False)
+    for data in answers:
+        token = captcha.new_token()
+        pipeline.set(captcha.get_cache_key(token), captcha.dump_answer({"token": token, "data": data}), ex=600)
+        # 一半挑战已通过校验, 保存 captcha_id
+        if random.random() < 0.5:
+            pipeline.set(captcha.get_cache_key(captcha.new_captcha_id()), captcha.dump_verified(token), ex=600)
+    pipeline.execute()
+    return None
+
+
+def measure(client, block, click, n: int) -> float:
+    client.flushdb()
+    before = client.info("memory")["used_memory"]
+    fill(client, block, [{"x": random.randint(50, 250), "y": 5, "secretKey": generate_uuid()} for _ in range(n)])
+    fill(client, click, [[{"x": random.randint(15, 285), "y": random.randint(30, 225)} for _ in range(4)]
+                         for _ in range(n)])
+    used = client.info("memory")["used_memory"] - before
+    client.flushdb()
+    return used / (2 * n)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("-n", type=int, default=100000)
+    args = parser.parse_args()
+
+    client = rd.StrictRedis.from_url(args.redis_url)
+    legacy = measure(client, BlockPuzzleCaptcha(None, LegacyBlockConfig), ClickWordCaptcha(None, LegacyClickConfig),
+                     args.n)
+    compact = measure(client, BlockPuzzleCaptcha(None, CompactBlockConfig), ClickWordCaptcha(None, CompactClickConfig),
+                      args.n)
+    print(f"legacy   {legacy:>7.1f} bytes/challenge")
+    print(f"compact  {compact:>7.1f} bytes/challenge  ({(1 - compact / legacy) * 100:.0f}% smaller)")
+
+
+if __name__ == "__main__":
+    main()
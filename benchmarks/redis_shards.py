@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+gen / verify / second_verify storage throughput against local redis-server shards
+
+    python benchmarks/redis_shards.py --shards 1 2 4
+    python benchmarks/redis_shards.py --shards 1 3 --cluster --clients-per-shard 8
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import redis as rd
+
+from pycaptcha.strategy.simple_captcha import SimpleCaptcha
+from pycaptcha.utils.redis_util import CLUSTER_SLOTS, RedisUtil
+from pycaptcha.utils.sharded_redis_util import ShardedRedisUtil
+
+
+def is_port_free(port: int) -> bool:
+    with socket.socket() as sock:
+        try:
+            sock.bind(("127.0.0.1", port))
+        except OSError:
+            return False
+    return True
+
+
+def get_free_port(cluster: bool = False) -> int:
+    """ 集群节点还要占用 port + 10000 作为集群总线端口, 从 20000-29999 中选取 """
+
+    if not cluster:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+    for _ in range(100):
+        port = random.randint(20000, 29999)
+        if is_port_free(port) and is_port_free(port + 10000):
+            return port
+    raise RuntimeError("no free port pair for a redis cluster node")
+
+
+class RedisServers:
+    """ 在临时目录中启动 count 个不落盘的 redis-server, 退出时全部停止 """
+
+    def __init__(self, count: int, cluster: bool = False, redis_server: str = "redis-server") -> None:
+        self.count = count
+        self.cluster = cluster
+        self.redis_server = shutil.which(redis_server) or redis_server
+        self.ports = []
+        self.processes = []
+        self.directory = None
+
+    def __enter__(self) -> RedisServers:
+        self.directory = tempfile.mkdtemp(prefix="pycaptcha-shards-")
+        try:
+            for _ in range(self.count):
+                self.start_one()
+            for index in range(self.count):
+                self.wait_ready(index)
+            if self.cluster:
+                self.create_cluster()
+        except BaseException:
+            self.stop()
+            raise
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+        return None
+
+    def start_one(self) -> None:
+        port = get_free_port(self.cluster)
+        command = [self.redis_server, "--port", str(port), "--bind", "127.0.0.1", "--save", "",
+                   "--appendonly", "no", "--dir", self.directory]
+        if self.cluster:
+            command += ["--cluster-enabled", "yes", "--cluster-config-file", f"nodes-{port}.conf"]
+        self.processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        self.ports.append(port)
+        return None
+
+    def wait_ready(self, index: int, timeout: float = 10.0) -> None:
+        client = rd.Redis(port=self.ports[index])
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                try:
+                    client.ping()
+                    return None
+                except rd.ConnectionError:
+                    if self.processes[index].poll() is not None:
+                        raise RuntimeError(f"redis-server on port {self.ports[index]} exited") from None
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.05)
+        finally:
+            client.close()
+
+    def create_cluster(self, timeout: float = 30.0) -> None:
+        """ 槽位平均分给每个节点, 不设副本 """
+
+        clients = [rd.Redis(port=port) for port in self.ports]
+        try:
+            for index, client in enumerate(clients):
+                start = CLUSTER_SLOTS * index // len(clients)
+                end = CLUSTER_SLOTS * (index + 1) // len(clients)
+                client.execute_command("CLUSTER ADDSLOTS", *range(start, end))
+            for port in self.ports[1:]:
+                clients[0].execute_command("CLUSTER MEET", "127.0.0.1", port)
+            deadline = time.monotonic() + timeout
+            while not all(client.cluster("INFO")["cluster_state"] == "ok" and
+                          int(client.cluster("INFO")["cluster_known_nodes"]) == len(clients) for client in clients):
+                if time.monotonic() > deadline:
+                    raise RuntimeError("redis cluster did not become ready")
+                time.sleep(0.1)
+        finally:
+            for client in clients:
+                client.close()
+        return None
+
+    def storage_spec(self):
+        """ CaptchaStrategy 的 redis 参数: 集群地址或分片地址列表 """
+
+        if self.cluster:
+            return f"redis+cluster://127.0.0.1:{self.ports[0]}"
+        return [f"redis://127.0.0.1:{port}/0" for port in self.ports]
+
+    def stop(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes = []
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+        return None
+
+
+def create_storage(spec):
+    if isinstance(spec, list):
+        return ShardedRedisUtil(spec)
+    return RedisUtil(None, spec)
+
+
+def run_client(spec, start_at: float, duration: float, results) -> None:
+    """ 一个客户端进程: 在 [start_at, start_at + duration) 内循环执行 写入答案 -> 校验 -> 二次校验 """
+
+    captcha = SimpleCaptcha(create_storage(spec))
+    answer = "abcd"
+    # 先建立连接, 不计入时间
+    captcha.second_verify(captcha.new_captcha_id())
+    time.sleep(max(start_at - time.time(), 0))
+    count = failures = 0
+    deadline = start_at + duration
+    while time.time() < deadline:
+        data = {"token": captcha.new_token(), "data": answer}
+        captcha.store(data)
+        captcha_id = captcha.verify(data["token"], {"code": answer})
+        if captcha_id is None or not captcha.second_verify(captcha_id):
+            failures += 1
+        count += 1
+    results.put((count, failures))
+    return None
+
+
+def measure_shards(count: int, cluster: bool, clients: int, duration: float, redis_server: str) -> dict:
+    with RedisServers(count, cluster, redis_server) as servers:
+        spec = servers.storage_spec()
+        results = multiprocessing.Queue()
+        start_at = time.time() + 1.0
+        processes = [multiprocessing.Process(target=run_client, args=(spec, start_at, duration, results))
+                     for _ in range(clients)]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    cycles = sum(cycles for cycles, _ in outcomes)
+    return {
+        "shards": count,
+        "clients": clients,
+        "cycles_per_second": cycles / duration,
+        "failures": sum(failures for _, failures in outcomes),
+    }
+
+
+def format_table(rows: list) -> str:
+    base = rows[0]["cycles_per_second"] / rows[0]["shards"] if rows and rows[0]["cycles_per_second"] else 0.0
+    lines = [f"{'shards':>6} {'clients':>7} {'cycles/s':>10} {'redis ops/s':>11} {'speedup':>7} {'efficiency':>10}"]
+    for row in rows:
+        speedup = row["cycles_per_second"] / rows[0]["cycles_per_second"] if base else 0.0
+        efficiency = row["cycles_per_second"] / (base * row["shards"]) if base else 0.0
+        lines.append(f"{row['shards']:>6} {row['clients']:>7} {row['cycles_per_second']:>10.0f} "
+                     f"{row['cycles_per_second'] * 3:>11.0f} {speedup:>7.2f} {efficiency:>10.0%}")
+    return "\n".join(lines)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="captcha storage throughput as redis shards are added")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4], help="shard counts to measure")
+    parser.add_argument("--cluster", action="store_true", help="run the shards as one redis cluster")
+    parser.add_argument("--clients-per-shard", type=int, default=4, help="client processes per shard")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds measured per shard count")
+    parser.add_argument("--redis-server", default="redis-server", help="redis-server executable")
+    args = parser.parse_args(argv)
+
+    rows = []
+    for count in args.shards:
+        rows.append(measure_shards(count, args.cluster, count * args.clients_per_shard, args.duration,
+                                   args.redis_server))
+    print(format_table(rows))
+    processes = max(args.shards) * (args.clients_per_shard + 1)
+    if processes > (os.cpu_count() or 1):
+        # 客户端与 redis-server 抢占同一批 CPU 时, 吞吐受限于本机而不是 redis
+        print(f"note: up to {processes} client and server processes share {os.cpu_count()} CPUs, "
+              f"scaling is bounded by this host")
+    return 1 if any(row["failures"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+slider piece compositing: the original per-pixel loop against the mask pastes of cut_by_template,
+checks both produce identical pixels for every bundled background/template pair
+
+    python benchmarks/slider_compositing.py -n 5
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+from pycaptcha.strategy.block_puzzle_captcha import BlockPuzzleCaptcha
+from pycaptcha.utils.image_util import ImageUtil, is_opcacity
+
+OFFSETS = (50, 137, 250)
+
+
+def legacy_cut_by_template(background_image: ImageUtil, template_image: ImageUtil, x1: int, y1: int) -> None:
+    """ 改为蒙版粘贴之前的逐像素实现 """
+
+    x_length = template_image.width
+    y_length = template_image.height
+    for x in range(0, x_length):
+        for y in range(0, y_length):
+            is_opacity = is_opcacity(template_image.rgba_image, x, y)
+            background_x = x + x1
+            background_y = y + y1
+            if not is_opacity:
+                background_image_rgba = background_image.rgba_image.getpixel((background_x, background_y))
+                template_image.rgba_image.putpixel((x, y), background_image_rgba)
+                background_image.rgba_image.putpixel((background_x, background_y), (105, 105, 105))
+            if x == (x_length - 1) or y == (y_length - 1):
+                continue
+            right_opcacity = is_opcacity(template_image.rgba_image, x + 1, y)
+            bottom_opcacity = is_opcacity(template_image.rgba_image, x, y + 1)
+            if (
+                    (is_opacity and not right_opcacity) or
+                    (not is_opacity and right_opcacity) or
+                    (is_opacity and not bottom_opcacity) or
+                    (not is_opacity and bottom_opcacity)
+            ):
+                template_image.set_rgba(template_image.rgba_image, x, y, (0xff, 0xff, 0xff, 0xff))
+                background_image.set_rgba(background_image.rgba_image, background_x, background_y,
+                                          (0xff, 0xff, 0xff, 0xff))
+    return None
+
+
+def image_copy(captcha: BlockPuzzleCaptcha, src: str) -> ImageUtil:
+    """ 资源缓存中的图片是共享的, 合成前复制一份 """
+
+    image = captcha.asset_catalog.get_image(src).copy()
+    return ImageUtil(src=src, src_image=image, rgba_image=image, width=image.size[0], height=image.size[1],
+                     font_path=None)
+
+
+def run(captcha: BlockPuzzleCaptcha, cut, background: str, template: str, x1: int, n: int) -> tuple:
+    """ 返回 (每次调用的中位耗时 ms, 合成后的背景与拼图) """
+
+    timings = []
+    for _ in range(n):
+        background_image, template_image = image_copy(captcha, background), image_copy(captcha, template)
+        start = time.perf_counter()
+        cut(background_image, template_image, x1, 0)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e3, background_image.rgba_image, template_image.rgba_image
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=5, help="calls per case, the median is reported")
+    args = parser.parse_args()
+
+    captcha = BlockPuzzleCaptcha()
+    captcha.ensure_set_up()
+    legacy_ms, mask_ms, mismatched, cases = [], [], [], 0
+    for background in captcha.background_image_list:
+        for template in captcha.template_image_root:
+            for x1 in OFFSETS:
+                legacy = run(captcha, legacy_cut_by_template, background, template, x1, args.n)
+                masked = run(captcha, captcha.cut_by_template, background, template, x1, args.n)
+                legacy_ms.append(legacy[0])
+                mask_ms.append(masked[0])
+                cases += 1
+                if legacy[1].tobytes() != masked[1].tobytes() or legacy[2].tobytes() != masked[2].tobytes():
+                    mismatched.append((background, template, x1))
+    legacy_median, mask_median = statistics.median(legacy_ms), statistics.median(mask_ms)
+    print(f"{'per-pixel loop':<16}{legacy_median:>10.2f} ms/call")
+    print(f"{'mask paste':<16}{mask_median:>10.2f} ms/call  ({legacy_median / mask_median:.0f}x)")
+    print(f"pixel-identical: {cases - len(mismatched)}/{cases} cases")
+    for case in mismatched:
+        print("mismatch", *case)
+    if mismatched:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
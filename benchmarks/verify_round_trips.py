@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+compare the legacy GET/DELETE/SETEX verify path with the scripted single round trip
+
+    python benchmarks/verify_round_trips.py --redis-url redis://localhost:6379/15 -n 20000
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+import redis as rd
+
+from pycaptcha.utils.redis_util import RedisUtil
+from pycaptcha.utils.uuid_util import generate_uuid
+
+
+def legacy_verify(redis_util: RedisUtil, token_key: str, id_key: str, token: str) -> bool:
+    if not redis_util.get(token_key):
+        return False
+    redis_util.delete(token_key)
+    redis_util.setex(id_key, token, 600)
+    return True
+
+
+def atomic_verify(redis_util: RedisUtil, token_key: str, id_key: str, token: str) -> bool:
+    return redis_util.consume(token_key, id_key, token, 600) is not None
+
+
+def run(redis_util: RedisUtil, verify, n: int) -> dict:
+    tokens = [generate_uuid() for _ in range(n)]
+    pipeline = redis_util.pipeline()
+    for token in tokens:
+        pipeline.setex(f"bench:{token}", '{"x": 100, "y": 5}', 600)
+    pipeline.execute()
+
+    # 每次 execute_command 即一次网络往返
+    client = redis_util.redis
+    execute_command = client.execute_command
+    calls = [0]
+
+    def counting_execute_command(*args, **options):
+        calls[0] += 1
+        return execute_command(*args, **options)
+
+    client.execute_command = counting_execute_command
+    start = time.perf_counter()
+    for token in tokens:
+        verify(redis_util, f"bench:{token}", f"bench:id:{token}", token)
+    elapsed = time.perf_counter() - start
+    del client.execute_command
+    return {"ops": n / elapsed, "round_trips": calls[0] / n, "us": elapsed / n * 1e6}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("-n", type=int, default=20000)
+    args = parser.parse_args()
+
+    redis_util = RedisUtil(rd.StrictRedis.from_url(args.redis_url))
+    redis_util.redis.flushdb()
+    for name, verify in (("legacy", legacy_verify), ("atomic", atomic_verify)):
+        result = run(redis_util, verify, args.n)
+        print(f"{name:<8} {result['ops']:>10.0f} ops/s {result['us']:>8.1f} us/op "
+              f"{result['round_trips']:.1f} round trips/op")
+    redis_util.redis.flushdb()
+
+
+if __name__ == "__main__":
+    main()
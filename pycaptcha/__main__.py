@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+"""
+pycaptcha command line
+
+    pycaptcha bank build --type slider --count 100000 --output slider.bank
+    python -m pycaptcha bank info slider.bank
+"""
+from __future__ import annotations
+
+import sys
+
+
+def main(argv: list = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["bank"]:
+        from pycaptcha.strategy.captcha_bank import main as bank_main
+
+        bank_main(argv[1:])
+        return 0
+    print("usage: pycaptcha bank {build,info} ...", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+micro benchmarks for generate / verify / second_verify and the rendering stages of every captcha type
+
+    python -m pycaptcha.bench
+    python -m pycaptcha.bench --storage redis://localhost:6379/15 --output bench.json
+    python -m pycaptcha.bench --baseline bench.json --ops-threshold 0.1 --p99-threshold 0.25
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+
+from pycaptcha.bench.cases import build_cases
+from pycaptcha.bench.report import METRICS, compare, dump, format_table, load
+from pycaptcha.bench.runner import measure
+from pycaptcha.strategy.captcha_strategy import CaptchaStrategy
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m pycaptcha.bench")
+    parser.add_argument("--storage", default="memory://", help="memory:// or a redis url")
+    parser.add_argument("-n", type=int, default=200, help="timed calls per case")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--memory-n", type=int, default=20, help="calls traced for peak memory, 0 disables")
+    parser.add_argument("--only", nargs="*", help="run cases whose name contains any of these strings")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against a JSON file written by --output")
+    for metric, (_, threshold) in METRICS.items():
+        parser.add_argument(f"--{metric.split('_')[0]}-threshold", type=float, default=threshold, dest=metric,
+                            help=f"allowed relative regression of {metric} (default {threshold})")
+    args = parser.parse_args(argv)
+
+    storage = CaptchaStrategy(args.storage).redis
+    cases = build_cases(storage)
+    if args.only:
+        cases = {name: case for name, case in cases.items() if any(part in name for part in args.only)}
+    results = dict()
+    for name, (setup, fn) in cases.items():
+        results[name] = measure(fn, setup, n=args.n, warmup=args.warmup, memory_n=args.memory_n)
+
+    baseline = load(args.baseline) if args.baseline else None
+    print(format_table(results, baseline))
+    if args.output:
+        dump(results, args.output, {"storage": args.storage.split("@")[-1], "n": args.n})
+    if baseline is None:
+        return 0
+    regressions = compare(results, baseline, {metric: getattr(args, metric) for metric in METRICS})
+    for regression in regressions:
+        print(f"REGRESSION {regression['name']} {regression['metric']}: {regression['baseline']:.1f} -> "
+              f"{regression['current']:.1f} ({regression['change']:+.1%})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
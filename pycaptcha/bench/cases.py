@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+import base64
+
+from pycaptcha.config import SimpleCaptchaConfig, BlockPuzzleCaptchaConfig, ClickWordCaptchaConfig
+from pycaptcha.strategy.block_puzzle_captcha import BlockPuzzleCaptcha
+from pycaptcha.strategy.captcha_registry import SIMPLE_CAPTCHA, BLOCK_PUZZLE_CAPTCHA, CLICK_WORD_CAPTCHA
+from pycaptcha.strategy.captcha_strategy import CaptchaStrategy
+from pycaptcha.strategy.click_word_captcha import ClickWordCaptcha
+from pycaptcha.strategy.simple_captcha import SimpleCaptcha
+
+
+def _stored(captcha, answer):
+    """ 生成并写入一个验证码, 返回 (token, 正确答案) """
+
+    def setup():
+        data = captcha.render()
+        params = answer(data)
+        captcha.store(data)
+        return data["token"], params
+    return setup
+
+
+def _verified(captcha, answer):
+    """ 生成并校验通过一个验证码, 返回 captcha_id """
+
+    stored = _stored(captcha, answer)
+
+    def setup():
+        return captcha.verify(*stored())
+    return setup
+
+
+def _common_cases(prefix: str, captcha, answer) -> dict:
+    return {
+        f"{prefix}.get": (None, lambda _: captcha.get()),
+        f"{prefix}.store": (captcha.render, captcha.store),
+        f"{prefix}.verify": (_stored(captcha, answer), lambda args: captcha.verify(*args)),
+        f"{prefix}.second_verify": (_verified(captcha, answer), captcha.second_verify),
+    }
+
+
+def simple_cases(storage, configs=SimpleCaptchaConfig) -> dict:
+    captcha = SimpleCaptcha(storage, configs)
+    encoder = captcha.image_encoder
+    cases = _common_cases("simple", captcha, lambda data: {"code": data["data"]})
+    cases.update({
+        "simple.compose": (None, lambda _: SimpleCaptcha.draw_code()),
+        "simple.noise": (lambda: SimpleCaptcha.draw_code()[1],
+                         lambda image: SimpleCaptcha.noise(image, fast=captcha.configs.simple_captcha_fast_render)),
+        "simple.encode": (lambda: SimpleCaptcha.draw_code()[1], encoder.encode),
+        "simple.base64": (lambda: encoder.encode(SimpleCaptcha.draw_code()[1]), base64.b64encode),
+    })
+    return cases
+
+
+def slider_cases(storage, configs=BlockPuzzleCaptchaConfig) -> dict:
+    captcha = BlockPuzzleCaptcha(storage, configs)
+
+    def load():
+        return captcha.get_background_image(), captcha.get_template_image()
+
+    def compose(images):
+        captcha.picture_templates_cut(*images)
+        return images[0].rgba_image, images[1].rgba_image
+
+    def encode(images):
+        return captcha.background_encoder.encode(images[0]), captcha.piece_encoder.encode(images[1])
+
+    cases = _common_cases("slider", captcha, lambda data: dict(data["data"]))
+    cases.update({
+        "slider.asset_load": (None, lambda _: load()),
+        "slider.compose": (load, compose),
+        "slider.encode": (lambda: compose(load()), encode),
+        "slider.base64": (lambda: encode(compose(load())), lambda encoded: [base64.b64encode(b) for b in encoded]),
+    })
+    return cases
+
+
+def click_cases(storage, configs=ClickWordCaptchaConfig) -> dict:
+    captcha = ClickWordCaptcha(storage, configs)
+
+    def compose(background_image):
+        _, word_list = captcha.get_image_data(background_image)
+        return background_image.rgba_image, captcha.draw_template_image(60, word_list)
+
+    def encode(images):
+        return captcha.background_encoder.encode(images[0]), captcha.hint_encoder.encode(images[1])
+
+    cases = _common_cases("click", captcha, lambda data: [dict(point) for point in data["data"]])
+    cases.update({
+        "click.asset_load": (None, lambda _: captcha.get_background_image()),
+        "click.compose": (captcha.get_background_image, compose),
+        "click.encode": (lambda: compose(captcha.get_background_image()), encode),
+        "click.base64": (lambda: encode(compose(captcha.get_background_image())),
+                         lambda encoded: [base64.b64encode(b) for b in encoded]),
+    })
+    return cases
+
+
+def batch_cases(storage, simpleConfigs=SimpleCaptchaConfig, blockConfigs=BlockPuzzleCaptchaConfig,
+                clickConfigs=ClickWordCaptchaConfig) -> dict:
+    strategy = CaptchaStrategy(storage, simpleConfigs, blockConfigs, clickConfigs)
+    slider = _stored(strategy.get_captcha_instance(BLOCK_PUZZLE_CAPTCHA), lambda data: dict(data["data"]))
+    click = _stored(strategy.get_captcha_instance(CLICK_WORD_CAPTCHA),
+                    lambda data: [dict(point) for point in data["data"]])
+    simple = _stored(strategy.get_captcha_instance(SIMPLE_CAPTCHA), lambda data: {"code": data["data"]})
+
+    def batch():
+        """ 每种验证码各一个正确答案, 与 verify_many 的参数格式相同 """
+
+        slider_token, slider_answer = slider()
+        click_token, click_answer = click()
+        simple_token, simple_answer = simple()
+        return [(slider_token, [slider_answer]), (click_token, click_answer), (simple_token, [simple_answer])]
+
+    return {"strategy.verify_many": (batch, strategy.verify_many)}
+
+
+def build_cases(storage, simpleConfigs=SimpleCaptchaConfig, blockConfigs=BlockPuzzleCaptchaConfig,
+                clickConfigs=ClickWordCaptchaConfig) -> dict:
+    """ 名称 -> (setup, fn), setup 不计时 """
+
+    cases = dict()
+    cases.update(simple_cases(storage, simpleConfigs))
+    cases.update(slider_cases(storage, blockConfigs))
+    cases.update(click_cases(storage, clickConfigs))
+    cases.update(batch_cases(storage, simpleConfigs, blockConfigs, clickConfigs))
+    return cases
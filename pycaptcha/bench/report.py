@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+import json
+import platform
+
+import PIL
+
+# 指标 -> (越大越好, 命令行参数默认阈值)
+METRICS = {
+    "ops": (True, 0.10),
+    "p99_us": (False, 0.25),
+    "peak_kib": (False, 0.50),
+}
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "pillow": PIL.__version__,
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+
+
+def dump(results: dict, path: str, meta: dict = None) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": dict(environment(), **(meta or {})), "results": results}, f, indent=2, sort_keys=True)
+    return None
+
+
+def load(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+def compare(results: dict, baseline: dict, thresholds: dict = None) -> list:
+    '''
+    compare results against a saved baseline
+    :param thresholds: metric -> allowed relative change, defaults to METRICS
+    :return: regressions as dicts with name, metric, baseline, current and change
+    '''
+    thresholds = dict({metric: threshold for metric, (_, threshold) in METRICS.items()}, **(thresholds or {}))
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, (higher_is_better, _) in METRICS.items():
+            before, after = base.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if higher_is_better else change
+            if worse > thresholds[metric]:
+                regressions.append({"name": name, "metric": metric, "baseline": before, "current": after,
+                                    "change": change})
+    return regressions
+
+
+def format_table(results: dict, baseline: dict = None) -> str:
+    lines = [f"{'case':<22} {'ops/s':>10} {'p50 us':>10} {'p99 us':>10} {'peak KiB':>9} {'vs base':>8}"]
+    for name, result in results.items():
+        base = (baseline or {}).get(name)
+        delta = f"{result['ops'] / base['ops'] - 1:>+8.1%}" if base and base.get("ops") else f"{'':>8}"
+        lines.append(f"{name:<22} {result['ops']:>10.1f} {result['p50_us']:>10.1f} {result['p99_us']:>10.1f} "
+                     f"{result['peak_kib']:>9.1f} {delta}")
+    return "\n".join(lines)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+import gc
+import time
+import tracemalloc
+
+
+def percentile(sorted_samples: list, q: float) -> float:
+    """ 最近秩百分位, sorted_samples 需已排序 """
+
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))]
+
+
+def measure(fn, setup=None, n: int = 200, warmup: int = 5, memory_n: int = 20) -> dict:
+    '''
+    time fn(setup()) n times, setup is not timed
+    :param fn: callable taking the value returned by setup (None without setup)
+    :param setup: callable preparing fresh input for every call
+    :param memory_n: calls traced with tracemalloc for the peak allocation per call, 0 disables
+    :return: ops, mean/p50/p99 in microseconds and peak_kib
+    '''
+    for _ in range(warmup):
+        fn(setup() if setup else None)
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(n):
+            arg = setup() if setup else None
+            start = time.perf_counter()
+            fn(arg)
+            samples.append(time.perf_counter() - start)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    samples.sort()
+    total = sum(samples)
+    result = {
+        "n": n,
+        "ops": n / total if total else 0.0,
+        "mean_us": total / n * 1e6 if n else 0.0,
+        "p50_us": percentile(samples, 0.50) * 1e6,
+        "p99_us": percentile(samples, 0.99) * 1e6,
+        "peak_kib": 0.0,
+    }
+    # 内存追踪会显著拖慢执行, 与计时分开运行
+    if memory_n:
+        peak = 0
+        tracemalloc.start()
+        try:
+            for _ in range(memory_n):
+                arg = setup() if setup else None
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                fn(arg)
+                peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+        finally:
+            tracemalloc.stop()
+        result["peak_kib"] = peak / 1024
+    return result
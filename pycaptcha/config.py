@@ -3,6 +3,9 @@ from __future__ import annotations
 
 __author__ = "summerrains"
 
+import dataclasses
+import threading
+
 
 class BaseConfig:
     """ Base Config """
@@ -15,6 +18,11 @@ class SimpleCaptchaConfig(BaseConfig):
 
     simple_captcha_cache_key = "SimpleCaptcha"  # simple pycaptcha redis cache key
     simple_captcha_cache_key_expire = 6000  # simple pycaptcha redis cache key expired time
+    simple_captcha_value_codec = "packed"  # redis value codec: packed or json (legacy)
+    simple_captcha_token_id_format = "hex"  # token id format: hex (32 chars) or base32 (26 chars)
+    simple_captcha_stateless_secret = None  # secret (or list, newest first) sealing the answer into the token, None stores answers in redis
+    simple_captcha_image_format = "png"  # image output preset (png, png-fast, png-small, png-palette, jpeg, webp, webp-lossless) or ImageEncoder kwargs
+    simple_captcha_fast_render = True  # paste pre-rendered code glyphs and blend speckle noise in one pass instead of per-point draw calls
 
 
 class BlockPuzzleCaptchaConfig(BaseConfig):
@@ -22,10 +30,20 @@ class BlockPuzzleCaptchaConfig(BaseConfig):
 
     block_puzzle_captcha_cache_key = "BlockPuzzleCaptcha"  # block puzzle pycaptcha redis cache key
     block_puzzle_captcha_cache_key_expire = 6000  # block puzzle pycaptcha redis cache key expired time
+    block_puzzle_captcha_value_codec = "packed"  # redis value codec: packed or json (legacy)
+    block_puzzle_captcha_token_id_format = "hex"  # token id format: hex (32 chars) or base32 (26 chars)
+    block_puzzle_captcha_stateless_secret = None  # secret (or list, newest first) sealing the answer into the token, None stores answers in redis
+    block_puzzle_captcha_background_format = "png"  # background image output preset or ImageEncoder kwargs, see pycaptcha.utils.image_encoder
+    block_puzzle_captcha_piece_format = "png"  # puzzle piece output preset, needs transparency: png, png-palette, webp
+    block_puzzle_captcha_image_delivery = "inline"  # inline: base64 data URIs in the JSON, url: images cached and read once by url
+    block_puzzle_captcha_image_url = "/captcha/{token}/{name}"  # image url template for url delivery, name is background or piece
+    block_puzzle_captcha_image_expire = 60  # seconds a delivered image stays readable
     block_puzzle_captcha_check_offsetX = 10  # block puzzle pycaptcha verify offset x
     background_image_root_path = "resource/defaultImages/jigsaw/original"  # block puzzle background images
     template_image_root_path = "resource/defaultImages/jigsaw/slidingBlock"  # block puzzle template images
+    template_index_path = None  # block puzzle template mask index file, None keeps the index in memory only
     pic_click_root_path = "resource/defaultImages/pic-click"  # block puzzle pic check images
+    asset_cache_max_bytes = 64 * 1024 * 1024  # block puzzle decoded image cache budget in bytes
     font_ttf_root_path = "resource/fonts/WenQuanZhengHei.ttf"  # block puzzle font.ttf
     font_water_text = "summerrains"  # block puzzle pycaptcha water text
     font_water_text_font_size = 22  # block puzzle pycaptcha water text font size
@@ -36,8 +54,101 @@ class ClickWordCaptchaConfig(BaseConfig):
 
     click_word_captcha_cache_key = "ClickWordCaptcha"  # click word pycaptcha redis cache key
     click_word_captcha_cache_key_expire = 6000  # click_word_captcha_cache_key expired time
+    click_word_captcha_value_codec = "packed"  # redis value codec: packed or json (legacy)
+    click_word_captcha_token_id_format = "hex"  # token id format: hex (32 chars) or base32 (26 chars)
+    click_word_captcha_stateless_secret = None  # secret (or list, newest first) sealing the answer into the token, None stores answers in redis
+    click_word_captcha_background_format = "png"  # background image output preset or ImageEncoder kwargs, see pycaptcha.utils.image_encoder
+    click_word_captcha_hint_format = "png"  # hint words image output preset
+    click_word_captcha_image_delivery = "inline"  # inline: base64 data URIs in the JSON, url: images cached and read once by url
+    click_word_captcha_image_url = "/captcha/{token}/{name}"  # image url template for url delivery, name is background or piece (hint words)
+    click_word_captcha_image_expire = 60  # seconds a delivered image stays readable
     font_ttf_root_path = "resource/fonts/WenQuanZhengHei.ttf"  # click word pycaptcha font.ttf
     click_word_captcha_font_number = 6
     click_word_captcha_font_size = 30
+    click_word_captcha_glyph_atlas = True  # draw words from pre-rendered glyph masks instead of FreeType per word
+    click_word_captcha_glyph_atlas_max_glyphs = 2048  # glyph atlas size bound
+    click_word_captcha_fast_render = True  # blend hint image noise in one pass instead of per-point draw calls
     background_image_root_path = "resource/defaultImages/jigsaw/original"  # click word pycaptcha background images
+    asset_cache_max_bytes = 64 * 1024 * 1024  # click word decoded image cache budget in bytes
     click_word_captcha_text = "的一了是我不在人们有来他这上着个地到大里说就去子得也和那要下看天时过出小么起你都把好还多没为又可家学只以主会样年想生同老中十从自面前头道它后然走很像见两用她国动进成回什边作对开而己些现山民候经发工向事命给长水几义三声于高手知理眼志点心战二问但身方实吃做叫当住听革打呢真全才四已所敌之最光产情路分总条白话东席次亲如被花口放儿常气五第使写军吧文运再果怎定许快明行因别飞外树物活部门无往船望新带队先力完却站代员机更九您每风级跟笑啊孩万少直意夜比阶连车重便斗马哪化太指变社似士者干石满日决百原拿群究各六本思解立河村八难早论吗根共让相研今其书坐接应关信觉步反处记将千找争领或师结块跑谁草越字加脚紧爱等习阵怕月青半火法题建赶位唱海七女任件感准张团屋离色脸片科倒睛利世刚且由送切星导晚表够整认响雪流未场该并底深刻平伟忙提确近亮轻讲农古黑告界拉名呀土清阳照办史改历转画造嘴此治北必服雨穿内识验传业菜爬睡兴形量咱观苦体众通冲合破友度术饭公旁房极南枪读沙岁线野坚空收算至政城劳落钱特围弟胜教热展包歌类渐强数乡呼性音答哥际旧神座章帮啦受系令跳非何牛取入岸敢掉忽种装顶急林停息句区衣般报叶压慢叔背细"
+
+
+class CaptchaPoolConfig(BaseConfig):
+    """ 验证码预生成池配置 """
+
+    captcha_pool_enabled = False  # render captchas ahead of time in background threads
+    captcha_pool_low_watermark = 16  # start refilling a pool when it holds fewer captchas than this
+    captcha_pool_high_watermark = 64  # stop refilling a pool once it holds this many captchas
+    captcha_pool_workers = 1  # background render threads per captcha type
+    captcha_batch_workers = None  # generate_batch worker processes, None uses os.cpu_count()
+    captcha_batch_chunk_size = 16  # captchas rendered per generate_batch task
+    captcha_bank_paths = ()  # bank files written by `pycaptcha bank build`, served before the pool and synchronous rendering
+    captcha_bank_cursor_key = "CaptchaBank"  # storage key prefix of the bank cursor shared by every node
+    captcha_bank_reserve = 32  # bank entries a process reserves per cursor increment
+
+
+class AdmissionConfig(BaseConfig):
+    """ 生成验证码的准入控制配置 """
+
+    admission_enabled = False  # limit captcha generation per client and cap concurrent renders
+    admission_rate = 1.0  # captchas a client (IP or API key) regains per second, 0 disables rate limiting
+    admission_burst = 10  # captchas a client may generate at once
+    admission_storage = "memory"  # token buckets: memory (per process) or redis (the captcha storage, shared by every node)
+    admission_cache_key = "Admission"  # token bucket key prefix
+    admission_max_clients = 100000  # in-process token bucket table bound
+    admission_max_in_flight = None  # renders running at once per process, None uses 2 * os.cpu_count(), 0 disables
+    admission_retry_after = 1  # Retry-After seconds when the render cap is reached
+
+
+class CaptchaSelectionConfig(BaseConfig):
+    """ get_captcha 类型选择配置 """
+
+    selection_weights = {"SLIDER": 1.0, "WORD_IMAGE_CLICK": 1.0}  # captcha type -> share of get_captcha under normal load
+    selection_fallback = None  # type served under extreme load (e.g. "SIMPLE_"), None keeps the weighted mix
+    selection_latency_budget = 0.1  # seconds a get_captcha call may take on average before the mix shifts toward cheaper types
+    selection_extreme_pressure = 4.0  # load (latency / budget or in-flight / max in-flight) that switches every request to the fallback
+    selection_max_in_flight = None  # get_captcha calls in progress counted as full load, None uses 2 * os.cpu_count()
+    selection_ewma_alpha = 0.2  # weight of the newest sample in the render time and latency moving averages
+
+
+# 配置项后缀 -> (校验, 说明)
+_config_rules = (
+    ("_expire", lambda value: isinstance(value, int) and value > 0, "a positive int"),
+    ("_font_size", lambda value: isinstance(value, int) and value > 0, "a positive int"),
+    ("_font_number", lambda value: isinstance(value, int) and value > 0, "a positive int"),
+    ("_offsetX", lambda value: isinstance(value, (int, float)) and value >= 0, "a non-negative number"),
+    ("_image_delivery", lambda value: value in ("inline", "url"), "inline or url"),
+    ("_token_id_format", lambda value: value in ("hex", "base32"), "hex or base32"),
+    ("_storage", lambda value: value in ("memory", "redis"), "memory or redis"),
+    ("_budget", lambda value: isinstance(value, (int, float)) and value > 0, "a positive number"),
+    ("_alpha", lambda value: isinstance(value, (int, float)) and 0 < value <= 1, "a number in (0, 1]"),
+)
+
+_frozen_configs = dict()
+_frozen_configs_lock = threading.Lock()
+
+
+def validate_config(configs, values: dict) -> None:
+    for name, value in values.items():
+        for suffix, check, expected in _config_rules:
+            if name.endswith(suffix) and not check(value):
+                raise ValueError(f"{configs.__name__}.{name} must be {expected}, got {value!r}")
+    return None
+
+
+def freeze_config(configs):
+    """
+    配置类(含父类)全部配置项的只读快照, 每个配置类只读取并校验一次;
+    快照为 frozen dataclass, 修改时抛出 dataclasses.FrozenInstanceError
+    """
+    frozen = _frozen_configs.get(configs)
+    if frozen is not None:
+        return frozen
+    values = {name: getattr(configs, name) for name in dir(configs)
+              if not name.startswith("_") and not callable(getattr(configs, name))}
+    validate_config(configs, values)
+    frozen_class = dataclasses.make_dataclass(f"Frozen{configs.__name__}", list(values), frozen=True,
+                                              namespace={"__slots__": tuple(values)})
+    frozen = frozen_class(**values)
+    with _frozen_configs_lock:
+        return _frozen_configs.setdefault(configs, frozen)
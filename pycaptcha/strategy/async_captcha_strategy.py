@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+__author__ = "summerrains"
+
+import asyncio
+
+from pycaptcha.config import SimpleCaptchaConfig, BlockPuzzleCaptchaConfig, ClickWordCaptchaConfig
+from pycaptcha.strategy.captcha_batch import render_one
+from pycaptcha.strategy.captcha_registry import SIMPLE_CAPTCHA, BLOCK_PUZZLE_CAPTCHA, CLICK_WORD_CAPTCHA, \
+    get_captcha_class
+from pycaptcha.strategy.image_delivery import ImageDeliveryMixin
+from pycaptcha.strategy.stateless_token import SEALED_CHALLENGE, SEALED_VERIFIED
+from pycaptcha.utils.ramdom_util import get_random
+from pycaptcha.utils.async_redis_util import AsyncRedisUtil
+
+
+class AsyncCaptchaStrategy:
+    """ CaptchaStrategy 的 asyncio 版本: 缓存读写使用 redis.asyncio, 图片渲染交给 executor, 不阻塞事件循环 """
+
+    def __init__(self, redis=None, simpleConfigs: SimpleCaptchaConfig = SimpleCaptchaConfig,
+                 blockConfigs: BlockPuzzleCaptchaConfig = BlockPuzzleCaptchaConfig,
+                 clickConfigs: ClickWordCaptchaConfig = ClickWordCaptchaConfig,
+                 executor=None, typeConfigs: dict = None):
+        '''
+
+        :param redis: redis.asyncio client or redis url
+        :param executor: concurrent.futures executor for rendering, None uses the event loop default executor
+        :param typeConfigs: captcha type prefix -> config class for types added with register_captcha_type
+        '''
+        if redis is not None and isinstance(redis, str):
+            self.redis = AsyncRedisUtil(None, redis)
+        else:
+            self.redis = AsyncRedisUtil(redis, None)
+        #
+        self.simpleConfigs = simpleConfigs
+        self.blockConfigs = blockConfigs
+        self.clickConfigs = clickConfigs
+        self.executor = executor
+        self.configs = {
+            SIMPLE_CAPTCHA: simpleConfigs,
+            BLOCK_PUZZLE_CAPTCHA: blockConfigs,
+            CLICK_WORD_CAPTCHA: clickConfigs,
+            **(typeConfigs or dict()),
+        }
+        # 只用于缓存key与答案校验, 不用于渲染, 首次使用时创建
+        self.captchas = dict()
+
+    def get_captcha_instance(self, kind: str):
+        """ 类型前缀对应的验证码对象, 未注册的前缀返回 None """
+
+        captcha = self.captchas.get(kind)
+        if captcha is None:
+            captcha_class = get_captcha_class(kind)
+            if captcha_class is None:
+                return None
+            captcha = self.captchas[kind] = captcha_class(None, self.configs.get(kind))
+        return captcha
+
+    async def _get(self, kind: str) -> dict:
+        captcha = self.get_captcha_instance(kind)
+        if captcha is None:
+            raise ValueError(f"unknown captcha type: {kind}")
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(self.executor, render_one, kind, self.configs.get(kind))
+        if not captcha.seal_answer(data):
+            await self.redis.setex(captcha.get_cache_key(data.get("token")), captcha.dump_answer(data),
+                                   captcha.get_cache_expire())
+        if isinstance(captcha, ImageDeliveryMixin):
+            for cache_key, image_bytes, expire_time in captcha.pending_images(data):
+                await self.redis.setex(cache_key, image_bytes, expire_time)
+        data.update({'data': None})
+        return data
+
+    async def get_simple_captcha(self) -> dict:
+        return await self._get(SIMPLE_CAPTCHA)
+
+    async def get_block_captcha(self) -> dict:
+        return await self._get(BLOCK_PUZZLE_CAPTCHA)
+
+    async def get_click_captcha(self) -> dict:
+        return await self._get(CLICK_WORD_CAPTCHA)
+
+    async def get_captcha(self) -> dict:
+        n = get_random().randint(0, 1000)
+        if n % 2 == 0:
+            data = await self.get_block_captcha()
+        else:
+            data = await self.get_click_captcha()
+        return {
+            'id': data.get('token'),
+            'captcha': data,
+        }
+
+    async def verify(self, token=None, params: list = None) -> str | None:
+        '''
+        verify code
+        :param token:
+        :param params: same as CaptchaStrategy.verify
+        :return: return captcha_id if verify success , else return None
+        '''
+        captcha = self.get_captcha_instance(token.partition("-")[0])
+        if captcha is None:
+            return None
+        if not getattr(captcha, "verify_all_params", False):
+            params = params[0]
+        if captcha.is_sealed(token):
+            return await self._verify_sealed(captcha, token, params)
+        #
+        captcha_id = captcha.new_captcha_id(token)
+        captcha_id_key = captcha.get_cache_key(captcha_id)
+        cache_value_bytes = await self.redis.consume(captcha.get_cache_key(token), captcha_id_key,
+                                                     captcha.dump_verified(token),
+                                                     captcha.get_cache_expire())
+        if not captcha.safe_match(cache_value_bytes, params):
+            if cache_value_bytes:
+                await self.redis.delete(captcha_id_key)
+            return None
+        return captcha_id
+
+    async def second_verify(self, captcha_id) -> bool:
+        captcha_id = captcha_id or ""
+        captcha = self.get_captcha_instance(captcha_id.partition("-")[0]) or \
+            self.get_captcha_instance(SIMPLE_CAPTCHA)
+        if captcha.is_sealed(captcha_id):
+            opened = captcha.open_sealed(captcha_id, SEALED_VERIFIED)
+            return opened is not None and await self.redis.set_nx(opened[0], "1", opened[1])
+        #
+        return await self.redis.pop(captcha.get_cache_key(captcha_id))
+
+    async def take_image(self, token: str, name: str) -> tuple | None:
+        captcha = self.get_captcha_instance((token or "").partition("-")[0])
+        if not isinstance(captcha, ImageDeliveryMixin):
+            return None
+        mime_type = captcha.get_image_mime_type(name)
+        if mime_type is None:
+            return None
+        image_bytes = await self.redis.take(captcha.get_image_cache_key(token, name))
+        return (image_bytes, mime_type) if image_bytes is not None else None
+
+    async def _verify_sealed(self, captcha, token: str, params) -> str | None:
+        """ 无状态 token: 签名与过期时间在本地校验, 只访问一次缓存防止重放 """
+
+        opened = captcha.open_sealed(token, SEALED_CHALLENGE)
+        if opened is None:
+            return None
+        replay_key, ttl, answer = opened
+        if not await self.redis.set_nx(replay_key, "1", ttl) or not captcha.safe_match(answer, params):
+            return None
+        return captcha.seal(SEALED_VERIFIED, b"")
+
+    async def close(self) -> None:
+        await self.redis.close()
+        return None
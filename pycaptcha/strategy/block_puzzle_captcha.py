@@ -3,118 +3,131 @@ from __future__ import annotations
 
 __author__ = "summerrains"
 import os
-import json
+import threading
 from pycaptcha import BASE_DIR
-from pycaptcha.utils.ramdom_util import generate_random_int
-from pycaptcha.utils.image_util import ImageUtil, image_to_rgba, open_image, is_opcacity
-from pycaptcha.utils.uuid_util import generate_uuid
-from pycaptcha.config import BlockPuzzleCaptchaConfig
-
-
-class BlockPuzzleCaptcha:
+from pycaptcha.utils.ramdom_util import RandomSource, generate_random_int, get_random
+from pycaptcha.utils.asset_catalog import get_asset_catalog
+from pycaptcha.utils.image_util import ImageUtil
+from pycaptcha.utils.image_encoder import get_image_encoder
+from pycaptcha.utils.template_index import get_template_index
+from pycaptcha.strategy.image_delivery import ImageDeliveryMixin
+from pycaptcha.strategy.stateless_token import StatelessTokenMixin
+from pycaptcha.utils.codec import get_value_codec
+from pycaptcha.utils.metrics import lap, start_timer, timed
+from pycaptcha.utils.uuid_util import generate_uuid, generate_token_id, get_hash_tag, get_tagged_key
+from pycaptcha.config import BlockPuzzleCaptchaConfig, freeze_config
+
+
+class BlockPuzzleCaptcha(StatelessTokenMixin, ImageDeliveryMixin):
     """ 滑块拼图验证码 """
 
     __CAPTCHA_TYPE__ = "SLIDER"
 
-    base64_image_prefix = "data:image/jpeg;base64,{data}"
+    base64_image_prefix = "data:image/png;base64,{data}"
     base64_image_prefix_png = "data:image/png;base64,{data}"
     _data_encoding = "utf-8"
+    _hole_color = (105, 105, 105, 255)
+    _outline_color = (0xff, 0xff, 0xff, 0xff)
+    # 注入的随机数生成器, 例如固定种子的 RandomSource
+    random_source = None
 
     def __init__(self, redis=None, configs=None):
         self.redis = redis
-        self.__init_configs(configs)
+        self.configs = freeze_config(configs or BlockPuzzleCaptchaConfig)
+        self.value_codec = get_value_codec(self.configs.block_puzzle_captcha_value_codec)
+        self.sealer = self.new_sealer(self.configs.block_puzzle_captcha_stateless_secret)
+        self.background_encoder = get_image_encoder(self.configs.block_puzzle_captcha_background_format)
+        self.piece_encoder = get_image_encoder(self.configs.block_puzzle_captcha_piece_format)
+        self.image_delivery = self.configs.block_puzzle_captcha_image_delivery
+        self.image_url = self.configs.block_puzzle_captcha_image_url
+        self.image_expire = self.configs.block_puzzle_captcha_image_expire
+        self.asset_catalog = get_asset_catalog(configs or BlockPuzzleCaptchaConfig)
         self.background_image_list = list()
         self.template_image_root = list()
         self.click_background_image_root = list()
-        self.points = dict()
-        self.set_up()
-
-    def __init_configs(self, configs: BlockPuzzleCaptchaConfig = None) -> None:
-        if not configs:
-            self.block_puzzle_captcha_cache_key = BlockPuzzleCaptchaConfig.block_puzzle_captcha_cache_key
-            self.block_puzzle_captcha_cache_key_expire = BlockPuzzleCaptchaConfig.block_puzzle_captcha_cache_key_expire
-            self.block_puzzle_captcha_check_offsetX = BlockPuzzleCaptchaConfig.block_puzzle_captcha_check_offsetX
-            self.background_image_root_path = BlockPuzzleCaptchaConfig.background_image_root_path
-            self.template_image_root_path = BlockPuzzleCaptchaConfig.template_image_root_path
-            self.pic_click_root_path = BlockPuzzleCaptchaConfig.pic_click_root_path
-            self.font_ttf_root_path = BlockPuzzleCaptchaConfig.font_ttf_root_path
-            self.font_water_text = BlockPuzzleCaptchaConfig.font_water_text
-            self.font_water_text_font_size = BlockPuzzleCaptchaConfig.font_water_text_font_size
-            return None
-        self.block_puzzle_captcha_cache_key = configs.block_puzzle_captcha_cache_key
-        self.block_puzzle_captcha_cache_key_expire = configs.block_puzzle_captcha_cache_key_expire
-        self.block_puzzle_captcha_check_offsetX = configs.block_puzzle_captcha_check_offsetX
-        self.background_image_root_path = configs.background_image_root_path
-        self.template_image_root_path = configs.template_image_root_path
-        self.pic_click_root_path = configs.pic_click_root_path
-        self.font_ttf_root_path = configs.font_ttf_root_path
-        self.font_water_text = configs.font_water_text
-        self.font_water_text_font_size = configs.font_water_text_font_size
-        return None
+        # 资源目录与模板索引在首次渲染时加载, 只做校验的进程不会加载
+        self.ready = False
+        self._set_up_lock = threading.Lock()
+
+    @property
+    def rng(self) -> RandomSource:
+        """ 注入的 random_source, 未设置时使用当前线程的生成器 """
+
+        return self.random_source or get_random()
 
     def get_resources(self, path_str: str) -> os.path:
         return os.path.join(BASE_DIR, path_str)
 
+    @timed("slider.set_up")
     def set_up(self) -> None:
-        backgroundImageRoot = self.get_resources(self.background_image_root_path)
-        templateImageRoot = self.get_resources(self.template_image_root_path)
-        clickBackgroundImageRoot = self.get_resources(self.pic_click_root_path)
-
-        def process_file(res, path, info=None, err=None):
-            if os.path.isdir(path):
-                return
-            res.append(path)
-
-        for root, dirs, files in os.walk(backgroundImageRoot):
-            for file in files:
-                path = os.path.join(root, file)
-                process_file(self.background_image_list, path)
-
-        for root, dirs, files in os.walk(templateImageRoot):
-            for file in files:
-                path = os.path.join(root, file)
-                process_file(self.template_image_root, path)
-
-        for root, dirs, files in os.walk(clickBackgroundImageRoot):
-            for file in files:
-                path = os.path.join(root, file)
-                process_file(self.click_background_image_root, path)
+        backgroundImageRoot = self.get_resources(self.configs.background_image_root_path)
+        templateImageRoot = self.get_resources(self.configs.template_image_root_path)
+        clickBackgroundImageRoot = self.get_resources(self.configs.pic_click_root_path)
+        # 模板蒙版索引进程内共享, 仅首次加载
+        self.template_index = get_template_index(
+            self.get_resources(self.configs.template_index_path) if self.configs.template_index_path else None)
+
+        # 目录扫描结果与解码后的图片由同一配置类共享
+        self.background_image_list = self.asset_catalog.list_files(backgroundImageRoot)
+        self.template_image_root = self.asset_catalog.list_files(templateImageRoot)
+        self.click_background_image_root = self.asset_catalog.list_files(clickBackgroundImageRoot)
+        return None
+
+    def ensure_set_up(self) -> None:
+        if not self.ready:
+            with self._set_up_lock:
+                if not self.ready:
+                    self.set_up()
+                    self.ready = True
+        return None
 
+    def warm_up(self) -> None:
+        """ 预先加载资源目录与模板索引(补全后写回索引文件), 解码背景与模板图片(受资源缓存字节上限约束), 并渲染一次 """
+
+        self.ensure_set_up()
+        for src in self.background_image_list + self.template_image_root:
+            self.asset_catalog.get_image(src)
+        # 一次算出缺少的模板蒙版并写回索引文件
+        if self.template_index.build(self.template_image_root):
+            self.template_index.persist()
+        self.render()
         return None
 
     def get_background_image(self) -> ImageUtil:
+        self.ensure_set_up()
         max = len(self.background_image_list) - 1
         if max <= 0:
             max = 1
-        src = self.background_image_list[generate_random_int(0, max)]
-        src_image = open_image(src)
+        src = self.background_image_list[generate_random_int(0, max, self.rng)]
+        src_image = self.asset_catalog.get_image(src)
         image_util_obj = ImageUtil(
             src=src,
             src_image=src_image,
-            rgba_image=image_to_rgba(src_image),
+            rgba_image=src_image,
             width=src_image.size[0],
             height=src_image.size[1],
-            font_path=self.get_resources(self.font_ttf_root_path),
+            font_path=self.get_resources(self.configs.font_ttf_root_path),
         )
         return image_util_obj
 
     def get_template_image(self) -> ImageUtil:
+        self.ensure_set_up()
         max = len(self.template_image_root) - 1
         if max <= 0:
             max = 1
-        src = self.template_image_root[generate_random_int(0, max)]
-        src_image = open_image(src)
+        src = self.template_image_root[generate_random_int(0, max, self.rng)]
+        src_image = self.asset_catalog.get_image(src)
         image_util_obj = ImageUtil(
             src=src,
             src_image=src_image,
-            rgba_image=image_to_rgba(src_image),
+            rgba_image=src_image,
             width=src_image.size[0],
             height=src_image.size[1],
-            font_path=self.get_resources(self.font_ttf_root_path),
+            font_path=self.get_resources(self.configs.font_ttf_root_path),
         )
         return image_util_obj
 
-    def generate_picture_points(self, background_image: ImageUtil, template_image: ImageUtil) -> None:
+    def generate_picture_points(self, background_image: ImageUtil, template_image: ImageUtil) -> dict:
         x, y = 0, 0
         width_diff = background_image.width - template_image.width
         height_diff = background_image.height - template_image.height
@@ -122,116 +135,99 @@ class BlockPuzzleCaptcha:
         if width_diff <= 0:
             x = 5
         else:
-            x = generate_random_int(50, background_image.width - 50)
+            x = generate_random_int(50, background_image.width - 50, self.rng)
 
         if height_diff <= 0:
             y = 5
         else:
-            y = generate_random_int(5, height_diff)
+            y = generate_random_int(5, height_diff, self.rng)
 
-        self.points = {'x': x, 'y': y, 'secretKey': generate_uuid()}
-        return None
+        return {'x': x, 'y': y, 'secretKey': generate_uuid()}
 
     def cut_by_template(self, background_image: ImageUtil, template_image: ImageUtil, x1: float, y1: float) -> None:
-        x_length = template_image.width
-        y_length = template_image.height
-
-        for x in range(0, x_length):
-            for y in range(0, y_length):
-                # 如果模板图像当前像素点不是透明色 copy源文件信息到目标图片中
-                is_opacity = is_opcacity(template_image.rgba_image, x, y)
-
-                background_x = x + x1
-                background_y = y + y1
-
-                if not is_opacity:
-                    # 获取原图像素
-                    background_image_rgba = background_image.rgba_image.getpixel((background_x, background_y))
-                    # 将原图的像素扣到模板图上
-                    template_image.rgba_image.putpixel((x, y), background_image_rgba)
-                    # # 背景图区域模糊
-                    background_image.rgba_image.putpixel((background_x, background_y), (105, 105, 105))
-
-                if x == (x_length - 1) or y == (y_length - 1):
-                    continue
-
-                right_opcacity = is_opcacity(template_image.rgba_image, x + 1, y)
-                bottom_opcacity = is_opcacity(template_image.rgba_image, x, y + 1)
-
-                # 描边处理，,取带像素和无像素的界点，判断该点是不是临界轮廓点,如果是设置该坐标像素是白色
-                if (
-                        (is_opacity and not right_opcacity) or
-                        (not is_opacity and right_opcacity) or
-                        (is_opacity and not bottom_opcacity) or
-                        (not is_opacity and bottom_opcacity)
-                ):
-                    template_image.set_rgba(template_image.rgba_image, x, y, (0xff, 0xff, 0xff, 0xff))
-                    background_image.set_rgba(background_image.rgba_image, background_x, background_y, (0xff, 0xff, 0xff, 0xff))
+        x1, y1 = int(x1), int(y1)
+        box = (x1, y1, x1 + template_image.width, y1 + template_image.height)
+        # 模板不透明区域与描边, 取自模板索引
+        entry = self.template_index.get(template_image.src)
+        mask, outline = entry.mask, entry.outline
+
+        # 将原图的像素扣到模板图上
+        template_image.rgba_image.paste(background_image.rgba_image.crop(box), (0, 0), mask)
+        # 背景图区域模糊
+        background_image.rgba_image.paste(self._hole_color, box, mask)
+        # 描边处理, 临界轮廓点设置为白色
+        template_image.rgba_image.paste(self._outline_color, (0, 0) + template_image.rgba_image.size, outline)
+        background_image.rgba_image.paste(self._outline_color, box, outline)
         return None
 
     def interference_by_template(self, background_image: ImageUtil, template_image: ImageUtil, x1: float, y1: float) -> None:
-        x_length = template_image.width
-        y_length = template_image.height
-
-        for x in range(0, x_length):
-            for y in range(0, y_length):
-                # 如果模板图像当前像素点不是透明色 copy源文件信息到目标图片中
-                is_opacity = is_opcacity(template_image.rgba_image, x, y)
-                background_x = x + x1
-                background_y = y + y1
-
-                if not is_opacity:
-                    background_image.rgba_image.putpixel((background_x, background_y), (105, 105, 105))
-
-                if x == (x_length - 1) or y == (y_length - 1):
-                    continue
-
-                right_opcacity = is_opcacity(template_image.rgba_image, x + 1, y)
-                bottom_opcacity = is_opcacity(template_image.rgba_image, x, y + 1)
-                if (
-                        (is_opacity and not right_opcacity) or
-                        (not is_opacity and right_opcacity) or
-                        (is_opacity and not bottom_opcacity) or
-                        (not is_opacity and bottom_opcacity)
-                ):
-                    background_image.set_rgba(background_image.rgba_image, background_x, background_y, (0xff, 0xff, 0xff, 0xff))
+        x1, y1 = int(x1), int(y1)
+        box = (x1, y1, x1 + template_image.width, y1 + template_image.height)
+        entry = self.template_index.get(template_image.src)
+        mask, outline = entry.mask, entry.outline
+
+        background_image.rgba_image.paste(self._hole_color, box, mask)
+        background_image.rgba_image.paste(self._outline_color, box, outline)
         return None
 
-    def picture_templates_cut(self, background_image: ImageUtil, template_image: ImageUtil, need_notice=False):
+    def picture_templates_cut(self, background_image: ImageUtil, template_image: ImageUtil, need_notice=False) -> dict:
+        """ 裁剪拼图并返回答案坐标, 坐标只保存在返回值中, 同一对象可被多个线程同时使用 """
+
         # 生成拼图坐标点位
-        self.generate_picture_points(background_image, template_image)
+        points = self.generate_picture_points(background_image, template_image)
         # 裁剪模板图
-        self.cut_by_template(background_image, template_image, self.points['x'],0)
+        self.cut_by_template(background_image, template_image, points['x'],0)
 
         if need_notice:
             while True:
                 newTemplateImage = self.get_template_image()
                 if newTemplateImage.src != template_image.src:
-                    offset_x = generate_random_int(0, background_image.width - newTemplateImage.width - 5)
+                    offset_x = generate_random_int(0, background_image.width - newTemplateImage.width - 5, self.rng)
                     res = float(newTemplateImage.width - offset_x) > float(newTemplateImage.width / 2)
                     if abs(res):
-                        self.interference_by_template(background_image, newTemplateImage, offset_x, self.points['y'])
+                        self.interference_by_template(background_image, newTemplateImage, offset_x, points['y'])
                         break
 
-        return None
+        return points
 
     def get_cache_key(self, token: str) -> str:
-        return f"{self.block_puzzle_captcha_cache_key}:{token}"
+        return get_tagged_key(self.configs.block_puzzle_captcha_cache_key, token)
 
-    def get(self) -> dict:
+    def get_cache_expire(self) -> int:
+        return self.configs.block_puzzle_captcha_cache_key_expire
+
+    def new_token(self) -> str:
+        return "{}-{}".format(BlockPuzzleCaptcha.__CAPTCHA_TYPE__, generate_token_id(self.configs.block_puzzle_captcha_token_id_format))
+
+    def new_captcha_id(self, token: str = "") -> str:
+        """ captcha_id 与 token 带有相同的 hash tag, 校验时两个 key 在同一 redis 槽位/分片内原子地更新 """
+
+        token_id = generate_token_id(self.configs.block_puzzle_captcha_token_id_format, get_hash_tag(token))
+        return "{}-{}".format(BlockPuzzleCaptcha.__CAPTCHA_TYPE__, token_id)
 
+    def dump_verified(self, token: str) -> str:
+        """ captcha_id 对应的缓存值 """
+
+        return self.value_codec.dump_verified(token)
+
+    def render(self) -> dict:
+        """ 生成验证码图片与答案, 不写缓存 """
+
+        start = start_timer()
         # 初始化
         background_image = self.get_background_image()
         # 设置水印
-        # background_image.set_text(background_image.rgba_image, self.font_water_text, self.font_water_text_font_size,
+        # background_image.set_text(background_image.rgba_image, self.configs.font_water_text, self.configs.font_water_text_font_size,
         #     (255, 255, 255, 255))
         # 初始化模板图片
         template_image = self.get_template_image()
+        start = lap("slider.asset_load", start)
         # 构造前端所需图片
-        self.picture_templates_cut(background_image, template_image, need_notice=False)
-
-        originalImageBase64 = background_image.base64_encode_image(background_image.rgba_image)
-        jigsawImageBase64 = template_image.base64_encode_image(template_image.rgba_image)
+        points = self.picture_templates_cut(background_image, template_image, need_notice=False)
+        start = lap("slider.compose", start)
+        backgroundImage = self.deliver_image(self.background_encoder, background_image.rgba_image)
+        templateImage = self.deliver_image(self.piece_encoder, template_image.rgba_image)
+        lap("slider.encode", start)
 
         data = {
             "type": BlockPuzzleCaptcha.__CAPTCHA_TYPE__,
@@ -239,30 +235,52 @@ class BlockPuzzleCaptcha:
             'backgroundImageHeight':background_image.height,
             'templateImageWidth': template_image.width,
             'templateImageHeight': template_image.height,
-            'token': "{}-{}".format(BlockPuzzleCaptcha.__CAPTCHA_TYPE__,generate_uuid()),
-            'data':self.points,
-            'backgroundImage': self.base64_image_prefix.format(data=originalImageBase64),
-            'templateImage': self.base64_image_prefix_png.format(data=jigsawImageBase64),
+            'token': self.new_token(),
+            'data':points,
+            'backgroundImage': backgroundImage,
+            'templateImage': templateImage,
             'templateImageTag':'default',
             'backgroundImageTag':'default',
         }
+        return data
+
+    @timed("slider.store")
+    def store(self, data: dict) -> None:
+        """ 将答案写入缓存, 过期时间从此刻开始计算 """
+
+        if not self.seal_answer(data):
+            cache_key = self.get_cache_key(data.get("token"))
+            self.redis.setex(cache_key, self.dump_answer(data), self.get_cache_expire())
+        # 图片按地址交付时, 在 token 确定后写入图片
+        self.store_images(data)
+        return None
+
+    def dump_answer(self, data: dict) -> bytes | str:
+        return self.value_codec.dump_point(data.get("data"))
+
+    def get(self) -> dict:
+        data = self.render()
         # 设置redis缓存
-        cache_key = self.get_cache_key(data.get("token"))
-        self.redis.setex(cache_key, json.dumps(self.points), self.block_puzzle_captcha_cache_key_expire)
+        self.store(data)
         return data
 
     def check(self, token: str, point_json: dict) -> bool:
 
         cache_key = self.get_cache_key(token)
         cache_value_bytes = self.redis.get(cache_key)
+        return self.safe_match(cache_value_bytes, point_json)
+
+    def match(self, cache_value_bytes: bytes | None, point_json: dict) -> bool:
+        """ 校验缓存中的答案, 不访问缓存 """
+
         if not cache_value_bytes:
             return False
 
-        cache_value = json.loads(cache_value_bytes.decode(self._data_encoding))
+        cache_value = self.value_codec.load_point(cache_value_bytes)
         # 验证位置
         diff = (
                 abs(float(cache_value.get('x') - point_json.get('x'))) <=
-                float(self.block_puzzle_captcha_check_offsetX)
+                float(self.configs.block_puzzle_captcha_check_offsetX)
         )
         # if (
         #     diff and
@@ -273,6 +291,7 @@ class BlockPuzzleCaptcha:
             return True
         return False
 
+    @timed("slider.second_verify")
     def second_verify(self,captcha_id) -> bool:
         '''
         verify captcha_id
@@ -280,28 +299,29 @@ class BlockPuzzleCaptcha:
         :return: return true if verify success
         '''
         captcha_id = captcha_id or ""
+        if self.is_sealed(captcha_id):
+            return self.second_verify_sealed(captcha_id)
         cache_key = self.get_cache_key(captcha_id)
-        cache_value_bytes = self.redis.get(cache_key)
-        if not cache_value_bytes:
-            return False
-        self.redis.delete(cache_key)
-        return True
+        return self.redis.pop(cache_key)
 
+    @timed("slider.verify")
     def verify(self, token: str, point_json: dict) -> str | None:
         '''
         verify block , x offset in 10 , y is equal
         :param params:
         :return: return captcha_id if verify success , else return None
         '''
-        flag = self.check(token, point_json)
-        if not flag:
+        if self.is_sealed(token):
+            return self.verify_sealed(token, point_json)
+        # token 无论校验成功与否都只能使用一次, 成功时 captcha_id 在同一次往返中写入
+        captcha_id = self.new_captcha_id(token)
+        captcha_id_key = self.get_cache_key(captcha_id)
+        cache_value_bytes = self.redis.consume(self.get_cache_key(token), captcha_id_key, self.dump_verified(token),
+                                               self.get_cache_expire())
+        if not self.safe_match(cache_value_bytes, point_json):
+            if cache_value_bytes:
+                self.redis.delete(captcha_id_key)
             return None
-        cache_key = self.get_cache_key(token)
-        self.redis.delete(cache_key)
-        # create captcha_id
-        captcha_id = "{}-{}".format(BlockPuzzleCaptcha.__CAPTCHA_TYPE__,generate_uuid())
-        cache_key = self.get_cache_key(captcha_id)
-        self.redis.setex(cache_key, token, self.block_puzzle_captcha_cache_key_expire)
         return captcha_id
 
 
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+"""
+offline captcha bank: challenges rendered ahead of time into one file and served by memory mapping it
+
+    pycaptcha bank build --type slider --count 100000 --output /srv/captcha/slider.bank
+    pycaptcha bank info /srv/captcha/slider.bank
+"""
+from __future__ import annotations
+
+__author__ = "summerrains"
+
+import argparse
+import base64
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+from pycaptcha.config import SimpleCaptchaConfig, BlockPuzzleCaptchaConfig, ClickWordCaptchaConfig
+from pycaptcha.strategy.captcha_batch import split_chunks
+from pycaptcha.strategy.captcha_registry import get_captcha_class, load_target
+from pycaptcha.strategy.image_delivery import ImageDeliveryMixin
+from pycaptcha.utils.uuid_util import generate_uuid
+
+# 文件格式: 文件头 | 定长索引 | 记录
+# 文件头: magic, 头部 JSON 长度, 头部 JSON (类型, 数量, bank_id, 各图片字段的 mime 类型)
+# 索引: 每条 (记录偏移, 记录长度)
+# 记录: JSON 长度, 不含图片的验证码 JSON, 按头部顺序的 (图片长度, 图片字节)
+BANK_MAGIC = b"PYCBANK1"
+_header = struct.Struct("<8sI")
+_index_entry = struct.Struct("<QI")
+_length = struct.Struct("<I")
+
+# 命令行中的类型简称
+BANK_TYPES = {
+    "simple": "SIMPLE_",
+    "slider": "SLIDER",
+    "click": "WORD_IMAGE_CLICK",
+}
+
+DEFAULT_CONFIGS = {
+    "SIMPLE_": SimpleCaptchaConfig,
+    "SLIDER": BlockPuzzleCaptchaConfig,
+    "WORD_IMAGE_CLICK": ClickWordCaptchaConfig,
+}
+
+# 子进程内常驻的验证码对象, 图片固定以字节输出
+_workers = dict()
+
+
+def get_bank_captcha(kind: str, configs):
+    captcha = _workers.get((kind, configs))
+    if captcha is None:
+        captcha = get_captcha_class(kind)(None, configs)
+        if isinstance(captcha, ImageDeliveryMixin):
+            captcha.image_delivery = ImageDeliveryMixin.IMAGE_DELIVERY_URL
+        _workers[(kind, configs)] = captcha
+    return captcha
+
+
+def get_image_types(captcha) -> dict:
+    """ 图片字段 -> mime 类型, 没有图片字段的验证码为空 """
+
+    if not isinstance(captcha, ImageDeliveryMixin):
+        return dict()
+    return {field: captcha.get_image_mime_type(name) for name, (field, _) in captcha.image_fields.items()}
+
+
+def encode_entry(data: dict, image_fields: list) -> bytes:
+    images = [data.pop(field) for field in image_fields]
+    meta = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    parts = [_length.pack(len(meta)), meta]
+    for image in images:
+        parts.append(_length.pack(len(image)))
+        parts.append(image)
+    return b"".join(parts)
+
+
+def render_bank_chunk(kind: str, configs, count: int) -> list:
+    """ 在子进程中渲染 count 个验证码, 返回编码后的记录 """
+
+    captcha = get_bank_captcha(kind, configs)
+    image_fields = list(get_image_types(captcha))
+    return [encode_entry(captcha.render(), image_fields) for _ in range(count)]
+
+
+def build_bank(path: str, kind: str, count: int, configs=None, workers: int = None, chunk_size: int = 64) -> dict:
+    '''
+    render count captchas into a bank file, the file is replaced atomically when complete
+    :param kind: SIMPLE_ / SLIDER / WORD_IMAGE_CLICK
+    :param workers: render processes, None uses os.cpu_count(), 0 renders in this process
+    :return: bank header
+    '''
+    if get_captcha_class(kind) is None:
+        raise ValueError(f"unknown captcha type: {kind}")
+    configs = configs or DEFAULT_CONFIGS.get(kind)
+    header = {
+        "version": 1,
+        "type": kind,
+        "count": count,
+        "bank_id": generate_uuid(),
+        "created": int(time.time()),
+        "images": get_image_types(get_bank_captcha(kind, configs)),
+    }
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    index_offset = _header.size + len(header_bytes)
+    index = bytearray(_index_entry.size * count)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    # 进程池模块导入较慢, 只在生成库时导入
+    from concurrent.futures import ProcessPoolExecutor
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    try:
+        with open(tmp_path, "wb") as bank_file:
+            bank_file.write(_header.pack(BANK_MAGIC, len(header_bytes)))
+            bank_file.write(header_bytes)
+            bank_file.write(index)
+            offset = index_offset + len(index)
+            position = 0
+            for records in _render_chunks(executor, 2 * workers, kind, configs, split_chunks(count, chunk_size)):
+                for record in records:
+                    bank_file.write(record)
+                    _index_entry.pack_into(index, position * _index_entry.size, offset, len(record))
+                    offset += len(record)
+                    position += 1
+            bank_file.seek(index_offset)
+            bank_file.write(index)
+            bank_file.flush()
+            os.fsync(bank_file.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return header
+
+
+def _render_chunks(executor, window: int, kind: str, configs, chunks: list):
+    """ 按顺序产出每块的记录, 同时提交的任务数不超过 window, 避免整批结果驻留内存 """
+
+    if executor is None:
+        for count in chunks:
+            yield render_bank_chunk(kind, configs, count)
+        return None
+    futures = deque()
+    for count in chunks:
+        futures.append(executor.submit(render_bank_chunk, kind, configs, count))
+        if len(futures) >= window:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+    return None
+
+
+def read_header(buffer) -> tuple:
+    """ 返回 (头部, 索引起始偏移) """
+
+    magic, header_length = _header.unpack_from(buffer, 0)
+    if magic != BANK_MAGIC:
+        raise ValueError("not a captcha bank file")
+    header = json.loads(bytes(buffer[_header.size:_header.size + header_length]))
+    return header, _header.size + header_length
+
+
+class CaptchaBank:
+    """
+    只读映射的验证码库: 条目按存储中的共享游标分配, 同一个库文件在多个节点与重启之间不会重复交付;
+    每次从游标预留 reserve 条, 减少存储往返
+    """
+
+    def __init__(self, path: str, storage, cursor_key: str = "CaptchaBank", reserve: int = 32) -> None:
+        self.path = path
+        self.storage = storage
+        self.reserve = max(reserve, 1)
+        with open(path, "rb") as bank_file:
+            self._mmap = mmap.mmap(bank_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header, self._index_offset = read_header(self._mmap)
+        self.kind = self.header["type"]
+        self.count = self.header["count"]
+        self.images = self.header["images"]
+        # 游标按 bank_id 区分, 重新生成的库从头开始
+        self.cursor_key = f"{cursor_key}:{self.header['bank_id']}"
+        self.handed_out = 0
+        self.exhausted = False
+        self._next = self._end = 0
+        self._lock = threading.Lock()
+
+    def next_index(self) -> int | None:
+        """ 分配下一条, 库已发完时返回 None """
+
+        with self._lock:
+            if self.exhausted:
+                return None
+            if self._next >= self._end:
+                self._end = self.storage.incr(self.cursor_key, self.reserve)
+                self._next = self._end - self.reserve
+            index = self._next
+            self._next += 1
+            if index >= self.count:
+                self.exhausted = True
+                return None
+            self.handed_out += 1
+        return index
+
+    def read(self, index: int, inline: bool = True) -> dict:
+        '''
+        decode one entry
+        :param inline: turn image bytes into data URIs, otherwise keep the bytes for url delivery
+        '''
+        offset, length = _index_entry.unpack_from(self._mmap, self._index_offset + index * _index_entry.size)
+        record = memoryview(self._mmap)[offset:offset + length]
+        try:
+            (meta_length,) = _length.unpack_from(record, 0)
+            position = _length.size + meta_length
+            data = json.loads(bytes(record[_length.size:position]))
+            for field, mime_type in self.images.items():
+                (image_length,) = _length.unpack_from(record, position)
+                position += _length.size
+                image = bytes(record[position:position + image_length])
+                position += image_length
+                if inline:
+                    image = f"data:{mime_type};base64,{base64.b64encode(image).decode('utf-8')}"
+                data[field] = image
+        finally:
+            record.release()
+        return data
+
+    def get(self, inline: bool = True) -> dict | None:
+        """ 取出下一个未交付的验证码, 与 render() 的返回一致, 答案由调用方在交付时写入缓存 """
+
+        index = self.next_index()
+        if index is None:
+            return None
+        return self.read(index, inline)
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "count": self.count,
+            "handed_out": self.handed_out,
+            "exhausted": self.exhausted,
+        }
+
+    def close(self) -> None:
+        self._mmap.close()
+        return None
+
+
+def load_configs(spec: str):
+    """ module:Class 形式的配置类 """
+
+    return load_target(spec)
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(prog="pycaptcha bank", description="build and inspect offline captcha banks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="render captchas into a bank file")
+    build.add_argument("--type", required=True, help="simple, slider, click or a captcha type prefix")
+    build.add_argument("--count", type=int, required=True)
+    build.add_argument("--output", help="bank file to write, default <type>.bank")
+    build.add_argument("--config", help="config class as module:Class, default the built-in config of the type")
+    build.add_argument("--workers", type=int, default=None, help="render processes, 0 renders in this process")
+    build.add_argument("--chunk-size", type=int, default=64, help="captchas rendered per task")
+    info = commands.add_parser("info", help="print the header of a bank file")
+    info.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        bank = CaptchaBank(args.path, None)
+        print(json.dumps(bank.header, ensure_ascii=False, indent=2))
+        bank.close()
+        return None
+    kind = BANK_TYPES.get(args.type, args.type)
+    configs = load_configs(args.config) if args.config else None
+    output = args.output or f"{args.type}.bank"
+    start = time.perf_counter()
+    header = build_bank(output, kind, args.count, configs, args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"rendered {header['count']} {kind} captchas in {elapsed:.1f}s -> {output} "
+          f"({os.path.getsize(output) / 1024 / 1024:.1f} MiB)")
+    return None
+
+
+if __name__ == "__main__":
+    main()
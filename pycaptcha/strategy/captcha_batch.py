@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+__author__ = "summerrains"
+
+from pycaptcha.strategy.captcha_registry import get_captcha_class
+
+# 常驻的验证码对象(子进程或渲染线程池共用), 资源目录/字体/模板索引随之保持预热
+_workers = dict()
+
+
+def get_worker_captcha(kind: str, configs):
+    captcha = _workers.get((kind, configs))
+    if captcha is None:
+        captcha = get_captcha_class(kind)(None, configs)
+        _workers[(kind, configs)] = captcha
+    return captcha
+
+
+def render_chunk(kind: str, configs, count: int) -> list:
+    """ 在子进程中渲染 count 个验证码, 返回已编码的结果, 不返回PIL对象 """
+
+    captcha = get_worker_captcha(kind, configs)
+    return [captcha.render() for _ in range(count)]
+
+
+def split_chunks(n: int, chunk_size: int) -> list:
+    chunks = [chunk_size] * (n // chunk_size)
+    if n % chunk_size:
+        chunks.append(n % chunk_size)
+    return chunks
+
+
+def render_one(kind: str, configs) -> dict:
+    """ 渲染单个验证码, 验证码对象不保存单次请求的状态, 可安全地在线程池中并发调用 """
+
+    return get_worker_captcha(kind, configs).render()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+__author__ = "summerrains"
+
+import threading
+import time
+from collections import deque
+
+
+class CaptchaPool:
+    """ 验证码预生成池: 后台线程在数量低于低水位时补充到高水位, 请求线程只负责取出 """
+
+    error_backoff = 0.5
+
+    def __init__(self, render, low_watermark: int = 16, high_watermark: int = 64, workers: int = 1,
+                 name: str = "captcha") -> None:
+        '''
+
+        :param render: 无参可调用对象, 返回一个已渲染但未写缓存的验证码
+        :param low_watermark: 池内数量低于该值时开始补充
+        :param high_watermark: 补充到该数量后停止
+        :param workers: 后台渲染线程数
+        :param name: 线程名前缀
+        '''
+        self.render = render
+        self.low_watermark = low_watermark
+        self.high_watermark = max(high_watermark, low_watermark)
+        self.workers = workers
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.rendered = 0
+        self.errors = 0
+        self._items = deque()
+        self._pending = 0
+        self._filling = True
+        self._render_times = deque(maxlen=128)
+        self._condition = threading.Condition()
+        self._threads = []
+        self._running = False
+
+    def start(self) -> CaptchaPool:
+        with self._condition:
+            if self._running:
+                return self
+            self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-pool-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: float = None) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        return None
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                # 达到高水位后停止补充, 直到低于低水位
+                while self._running and not self._filling:
+                    self._condition.wait()
+                if not self._running:
+                    return None
+                self._pending += 1
+                if len(self._items) + self._pending >= self.high_watermark:
+                    self._filling = False
+            item, failed = None, False
+            try:
+                item = self.render()
+            except Exception:
+                failed = True
+            with self._condition:
+                self._pending -= 1
+                if failed:
+                    self.errors += 1
+                if item is not None:
+                    self._items.append(item)
+                    self.rendered += 1
+                    self._render_times.append(time.monotonic())
+                elif len(self._items) + self._pending < self.high_watermark:
+                    self._filling = True
+            if failed:
+                # 渲染失败时退避, 避免空转
+                time.sleep(self.error_backoff)
+
+    def get(self) -> dict | None:
+        """ 取出一个预生成的验证码, 池为空时返回 None 并计为未命中 """
+
+        with self._condition:
+            try:
+                item = self._items.popleft()
+            except IndexError:
+                self.misses += 1
+                item = None
+            else:
+                self.hits += 1
+            if not self._filling and len(self._items) + self._pending < self.low_watermark:
+                self._filling = True
+                self._condition.notify_all()
+        return item
+
+    def refill_rate(self) -> float:
+        """ 最近补充速率, 个/秒 """
+
+        times = list(self._render_times)
+        if len(times) < 2:
+            return 0.0
+        elapsed = time.monotonic() - times[0]
+        return len(times) / elapsed if elapsed > 0 else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self._items),
+            "low_watermark": self.low_watermark,
+            "high_watermark": self.high_watermark,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rendered": self.rendered,
+            "errors": self.errors,
+            "refill_rate": self.refill_rate(),
+        }
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+captcha type registry: token prefix -> captcha class, modules are imported on first use
+
+third-party types register in code or through the "pycaptcha.captcha_types" entry point group:
+
+    [project.entry-points."pycaptcha.captcha_types"]
+    ROTATE = "my_package.rotate_captcha:RotateCaptcha"
+"""
+from __future__ import annotations
+
+__author__ = "summerrains"
+
+import importlib
+import threading
+
+ENTRY_POINT_GROUP = "pycaptcha.captcha_types"
+
+SIMPLE_CAPTCHA = "SIMPLE_"
+BLOCK_PUZZLE_CAPTCHA = "SLIDER"
+CLICK_WORD_CAPTCHA = "WORD_IMAGE_CLICK"
+
+# 内置类型: 前缀 -> module:Class
+BUILTIN_TYPES = {
+    SIMPLE_CAPTCHA: "pycaptcha.strategy.simple_captcha:SimpleCaptcha",
+    BLOCK_PUZZLE_CAPTCHA: "pycaptcha.strategy.block_puzzle_captcha:BlockPuzzleCaptcha",
+    CLICK_WORD_CAPTCHA: "pycaptcha.strategy.click_word_captcha:ClickWordCaptcha",
+}
+
+# 前缀 -> 验证码类或尚未导入的 module:Class
+_targets = dict(BUILTIN_TYPES)
+# 前缀 -> 已导入的验证码类
+_classes = dict()
+_entry_points_loaded = False
+_lock = threading.Lock()
+
+
+def register_captcha_type(prefix: str, target) -> None:
+    '''
+    register a captcha type, an existing registration of the prefix is replaced
+    :param prefix: token prefix, the part of the token before the first "-"
+    :param target: captcha class or "module:Class", a string is imported on first use
+    '''
+    if not prefix or "-" in prefix:
+        raise ValueError(f"captcha type prefix must be non-empty and must not contain '-': {prefix!r}")
+    with _lock:
+        _targets[prefix] = target
+        _classes.pop(prefix, None)
+    return None
+
+
+def _load_entry_points() -> None:
+    """ 读取已安装包声明的验证码类型, 只在首次遇到未注册的前缀时读取一次; 代码中的注册优先 """
+
+    global _entry_points_loaded
+    from importlib.metadata import entry_points
+
+    try:
+        found = entry_points(group=ENTRY_POINT_GROUP)
+    except TypeError:
+        # python < 3.10
+        found = entry_points().get(ENTRY_POINT_GROUP, ())
+    for entry_point in found:
+        _targets.setdefault(entry_point.name, entry_point.value)
+    _entry_points_loaded = True
+    return None
+
+
+def _lookup(prefix: str):
+    with _lock:
+        if prefix not in _targets and not _entry_points_loaded:
+            _load_entry_points()
+        return _targets.get(prefix)
+
+
+def load_target(target: str):
+    """ module:Class 形式的类 """
+
+    module_name, _, attr = target.partition(":")
+    value = importlib.import_module(module_name)
+    for name in attr.split("."):
+        value = getattr(value, name)
+    return value
+
+
+def has_captcha_type(prefix: str) -> bool:
+    """ 前缀是否已注册, 不导入验证码模块 """
+
+    return prefix in _classes or _lookup(prefix) is not None
+
+
+def get_captcha_class(prefix: str):
+    '''
+    captcha class of a token prefix, imported on first use
+    :return: None if the prefix is not registered
+    '''
+    captcha_class = _classes.get(prefix)
+    if captcha_class is not None:
+        return captcha_class
+    target = _lookup(prefix)
+    if target is None:
+        return None
+    # 在锁外导入, 被导入的模块可以再调用 register_captcha_type
+    captcha_class = load_target(target) if isinstance(target, str) else target
+    with _lock:
+        return _classes.setdefault(prefix, captcha_class)
+
+
+def captcha_types() -> list:
+    """ 已注册的全部前缀, 包含入口点声明的类型 """
+
+    with _lock:
+        if not _entry_points_loaded:
+            _load_entry_points()
+        return list(_targets)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+__author__ = "summerrains"
+
+import contextlib
+import os
+import threading
+import time
+from collections import namedtuple
+
+from pycaptcha.utils.ramdom_util import RandomSource, get_random
+
+# kind: 验证码类型前缀, reason: 选择原因, pressure: 选择时的负载 (1 为刚好达到延迟预算)
+Choice = namedtuple("Choice", ["kind", "reason", "pressure"])
+
+
+class CaptchaSelector:
+    """
+    get_captcha 的类型选择: 跟踪各类型渲染耗时与整体延迟的滑动平均以及进行中的请求数;
+    负载在预算内时按配置权重随机选择, 超出预算时权重按耗时向便宜的类型倾斜, 极端负载时全部退化为 fallback (设置了时)
+    """
+
+    REASON_WEIGHTS = "weights"
+    REASON_OVER_BUDGET = "over_budget"
+    REASON_EXTREME_LOAD = "extreme_load"
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+    metric_name = "pycaptcha_selection"
+
+    def __init__(self, weights: dict, fallback: str = None, latency_budget: float = 0.1, extreme_pressure: float = 4.0,
+                 max_in_flight: int = None, alpha: float = 0.2) -> None:
+        '''
+
+        :param weights: captcha type -> share under normal load
+        :param fallback: captcha type served when the pressure reaches extreme_pressure, None keeps the weighted mix
+        :param latency_budget: seconds a get_captcha call may take on average before the mix shifts
+        :param extreme_pressure: pressure (latency / budget or in-flight / max_in_flight) that switches to fallback
+        :param max_in_flight: get_captcha calls in progress counted as full load, None uses 2 * os.cpu_count()
+        :param alpha: weight of the newest sample in the moving averages
+        '''
+        self.weights = {kind: weight for kind, weight in weights.items() if weight > 0}
+        if not self.weights:
+            raise ValueError("at least one captcha type needs a positive weight")
+        self.fallback = fallback
+        self.latency_budget = latency_budget
+        self.extreme_pressure = extreme_pressure
+        self.max_in_flight = max_in_flight or 2 * (os.cpu_count() or 1)
+        self.alpha = alpha
+        # 类型 -> 渲染耗时滑动平均(秒), 未渲染过的类型不在其中
+        self.costs = dict()
+        self.latency = 0.0
+        self.in_flight = 0
+        # (类型, 原因) -> 次数
+        self.counts = dict()
+        self.last_choice = None
+        self._lock = threading.Lock()
+
+    def _average(self, average: float | None, sample: float) -> float:
+        return sample if not average else average + self.alpha * (sample - average)
+
+    def observe_render(self, kind: str, seconds: float) -> None:
+        """ 记录一次同步渲染的耗时 """
+
+        with self._lock:
+            self.costs[kind] = self._average(self.costs.get(kind), seconds)
+        return None
+
+    def pressure(self) -> float:
+        return max(self.latency / self.latency_budget, self.in_flight / self.max_in_flight)
+
+    def mix(self, pressure: float) -> dict:
+        """
+        当前负载下各类型的权重: 预算内为配置权重; 超出预算后乘以 (最低耗时 / 该类型耗时) ** (pressure - 1),
+        负载越高越偏向便宜的类型; 没有耗时记录的类型按已知耗时的平均值计算
+        """
+        if pressure <= 1 or not self.costs:
+            return dict(self.weights)
+        costs = self.costs
+        default_cost = sum(costs.values()) / len(costs)
+        cheapest = min(costs.get(kind, default_cost) for kind in self.weights)
+        exponent = pressure - 1
+        return {kind: weight * (cheapest / costs.get(kind, default_cost)) ** exponent
+                for kind, weight in self.weights.items()}
+
+    def choose(self, rng: RandomSource = None) -> Choice:
+        with self._lock:
+            pressure = self.pressure()
+            if self.fallback is not None and pressure >= self.extreme_pressure:
+                choice = Choice(self.fallback, self.REASON_EXTREME_LOAD, pressure)
+            else:
+                mix = self.mix(pressure)
+                kind = (rng or get_random()).choices(list(mix), list(mix.values()))[0]
+                choice = Choice(kind, self.REASON_WEIGHTS if pressure <= 1 else self.REASON_OVER_BUDGET, pressure)
+            key = (choice.kind, choice.reason)
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.last_choice = choice
+        return choice
+
+    @contextlib.contextmanager
+    def track(self):
+        """ 计入进行中的请求数, 正常返回时记录耗时; 被拒绝或出错的请求不计入延迟 """
+
+        with self._lock:
+            self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            yield None
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.latency = self._average(self.latency, seconds)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            last_choice = self.last_choice
+            return {
+                "pressure": self.pressure(),
+                "latency": self.latency,
+                "in_flight": self.in_flight,
+                "costs": dict(self.costs),
+                "choices": [{"kind": kind, "reason": reason, "count": count}
+                            for (kind, reason), count in sorted(self.counts.items())],
+                "last_choice": last_choice._asdict() if last_choice is not None else None,
+            }
+
+    def exposition(self) -> str:
+        """ 选择次数、渲染耗时与负载以 Prometheus 文本格式输出 """
+
+        stats = self.stats()
+        name = self.metric_name
+        lines = [
+            f"# HELP {name}_choices_total Captcha types chosen by get_captcha, by reason.",
+            f"# TYPE {name}_choices_total counter",
+        ]
+        for choice in stats["choices"]:
+            lines.append(f'{name}_choices_total{{kind="{choice["kind"]}",reason="{choice["reason"]}"}} '
+                         f'{choice["count"]}')
+        lines += [
+            f"# HELP {name}_render_seconds Moving average render time by captcha type.",
+            f"# TYPE {name}_render_seconds gauge",
+        ]
+        for kind, cost in sorted(stats["costs"].items()):
+            lines.append(f'{name}_render_seconds{{kind="{kind}"}} {cost!r}')
+        lines += [
+            f"# HELP {name}_pressure Load relative to the latency budget, 1 means at budget.",
+            f"# TYPE {name}_pressure gauge",
+            f"{name}_pressure {stats['pressure']!r}",
+        ]
+        return "\n".join(lines) + "\n"
@@ -3,58 +3,327 @@ from __future__ import annotations
 
 __author__ = "summerrains"
 
-import random
+import threading
+import time
 
-from pycaptcha.config import SimpleCaptchaConfig, BlockPuzzleCaptchaConfig, ClickWordCaptchaConfig
-from pycaptcha.strategy.block_puzzle_captcha import BlockPuzzleCaptcha
-from pycaptcha.strategy.click_word_captcha import ClickWordCaptcha
-from pycaptcha.strategy.simple_captcha import SimpleCaptcha
+from pycaptcha.config import SimpleCaptchaConfig, BlockPuzzleCaptchaConfig, ClickWordCaptchaConfig, CaptchaPoolConfig, \
+    AdmissionConfig, CaptchaSelectionConfig, freeze_config
+from pycaptcha.strategy.captcha_batch import render_chunk, split_chunks
+from pycaptcha.strategy.captcha_pool import CaptchaPool
+from pycaptcha.strategy.captcha_registry import SIMPLE_CAPTCHA, BLOCK_PUZZLE_CAPTCHA, CLICK_WORD_CAPTCHA, \
+    get_captcha_class, has_captcha_type
+from pycaptcha.strategy.captcha_selector import CaptchaSelector
+from pycaptcha.strategy.image_delivery import ImageDeliveryMixin
+from pycaptcha.utils.admission import AdmissionController
+from pycaptcha.utils.memory_storage import MemoryStorage
+from pycaptcha.utils.metrics import InstrumentedStorage, timed
 from pycaptcha.utils.redis_util import RedisUtil
+from pycaptcha.utils.sharded_redis_util import ShardedRedisUtil
+from pycaptcha.utils.storage import BaseStorage
 
 
 class CaptchaStrategy:
 
     def __init__(self,redis=None,simpleConfigs: SimpleCaptchaConfig = SimpleCaptchaConfig,
                  blockConfigs: BlockPuzzleCaptchaConfig = BlockPuzzleCaptchaConfig,
-                 clickConfigs: ClickWordCaptchaConfig = ClickWordCaptchaConfig):
+                 clickConfigs: ClickWordCaptchaConfig = ClickWordCaptchaConfig,
+                 poolConfigs: CaptchaPoolConfig = CaptchaPoolConfig,
+                 admissionConfigs: AdmissionConfig = AdmissionConfig,
+                 selectionConfigs: CaptchaSelectionConfig = CaptchaSelectionConfig,
+                 typeConfigs: dict = None):
+        '''
+
+        :param redis: redis client, redis url, "redis+cluster://host:port" for a redis cluster,
+            a list of redis urls / clients sharded by consistent hashing,
+            "memory://?shards=16&max_entries=1000000" or a BaseStorage instance
+        :param typeConfigs: captcha type prefix -> config class for types added with register_captcha_type
+        '''
         self.redis = redis
-        if redis is not None and isinstance(redis, str):
+        if isinstance(redis, BaseStorage):
+            self.redis = redis
+        elif isinstance(redis, (list, tuple)):
+            self.redis = ShardedRedisUtil(list(redis))
+        elif redis is not None and isinstance(redis, str) and redis.startswith("memory://"):
+            self.redis = MemoryStorage.from_url(redis)
+        elif redis is not None and isinstance(redis, str):
             self.redis = RedisUtil(None,redis)
         else:
             self.redis = RedisUtil(redis,None)
+        # 存储调用耗时, 未设置 metrics sink 时直接透传
+        self.redis = InstrumentedStorage(self.redis)
         #
         self.simpleConfigs = simpleConfigs
         self.blockConfigs = blockConfigs
         self.clickConfigs = clickConfigs
+        self.poolConfigs = poolConfigs
+        self.typeConfigs = {
+            SIMPLE_CAPTCHA: simpleConfigs,
+            BLOCK_PUZZLE_CAPTCHA: blockConfigs,
+            CLICK_WORD_CAPTCHA: clickConfigs,
+            **(typeConfigs or dict()),
+        }
+        # 每种验证码只创建一次且在首次使用时创建: 配置冻结, 单次请求的状态都在局部变量中, 同一对象可被多个线程同时使用
+        self.captchas = dict()
+        self._captchas_lock = threading.Lock()
         #
+        self.pools = dict()
+        self.banks = dict()
+        self.executor = None
+        self.admission = self.create_admission(admissionConfigs)
+        self.selector = self.create_selector(selectionConfigs)
+        self.getters = {
+            SIMPLE_CAPTCHA: self.get_simple_captcha,
+            BLOCK_PUZZLE_CAPTCHA: self.get_block_captcha,
+            CLICK_WORD_CAPTCHA: self.get_click_captcha,
+        }
+        if poolConfigs.captcha_bank_paths:
+            self.open_banks()
+        if poolConfigs.captcha_pool_enabled:
+            self.start_pools()
 
-    def get_simple_captcha(self) -> dict:
-        simpleCaptcha = SimpleCaptcha(self.redis,self.simpleConfigs)
-        data = simpleCaptcha.get()
-        print("{}_{}".format(data.get("token"),data.get("data")))
-        data.update({'data': None})
-        return data
+    def get_captcha_instance(self, kind: str):
+        '''
+        captcha object of a type prefix, the module is imported and the object created on first use
+        :return: None if the prefix is not a registered captcha type
+        '''
+        captcha = self.captchas.get(kind)
+        if captcha is not None:
+            return captcha
+        captcha_class = get_captcha_class(kind)
+        if captcha_class is None:
+            return None
+        with self._captchas_lock:
+            captcha = self.captchas.get(kind)
+            if captcha is None:
+                captcha = captcha_class(self.redis, self.get_configs(kind))
+                self.captchas[kind] = captcha
+        return captcha
 
-    def get_block_captcha(self) -> dict:
-        blockPuzzleCaptcha = BlockPuzzleCaptcha(self.redis, self.blockConfigs)
-        data = blockPuzzleCaptcha.get()
-        print("{}_{}".format(data.get("token"), data.get("data")))
-        data.update({'data': None})
+    @property
+    def simpleCaptcha(self):
+        return self.get_captcha_instance(SIMPLE_CAPTCHA)
+
+    @property
+    def blockPuzzleCaptcha(self):
+        return self.get_captcha_instance(BLOCK_PUZZLE_CAPTCHA)
+
+    @property
+    def clickWordCaptcha(self):
+        return self.get_captcha_instance(CLICK_WORD_CAPTCHA)
+
+    def warm_up(self, kinds: list = None) -> dict:
+        '''
+        import, set up and render each captcha type once, so the first requests do not pay for it
+        :param kinds: type prefixes, default all configured types
+        :return: type prefix -> seconds taken
+        '''
+        timings = dict()
+        for kind in kinds or list(self.typeConfigs):
+            start = time.perf_counter()
+            captcha = self.get_captcha_instance(kind)
+            if captcha is None:
+                raise ValueError(f"unknown captcha type: {kind}")
+            if hasattr(captcha, "warm_up"):
+                captcha.warm_up()
+            timings[kind] = time.perf_counter() - start
+        return timings
+
+    def create_admission(self, admissionConfigs) -> AdmissionController | None:
+        """ 未开启时返回 None, 生成验证码不做任何检查 """
+
+        configs = freeze_config(admissionConfigs)
+        if not configs.admission_enabled:
+            return None
+        return AdmissionController(
+            storage=self.redis if configs.admission_storage == "redis" else None,
+            rate=configs.admission_rate,
+            burst=configs.admission_burst,
+            max_in_flight=configs.admission_max_in_flight,
+            retry_after=configs.admission_retry_after,
+            cache_key=configs.admission_cache_key,
+            max_clients=configs.admission_max_clients,
+        )
+
+    def create_selector(self, selectionConfigs) -> CaptchaSelector:
+        configs = freeze_config(selectionConfigs)
+        kinds = list(configs.selection_weights)
+        if configs.selection_fallback is not None:
+            kinds.append(configs.selection_fallback)
+        for kind in kinds:
+            if not has_captcha_type(kind):
+                raise ValueError(f"unknown captcha type in {selectionConfigs.__name__}: {kind}")
+        return CaptchaSelector(
+            weights=configs.selection_weights,
+            fallback=configs.selection_fallback,
+            latency_budget=configs.selection_latency_budget,
+            extreme_pressure=configs.selection_extreme_pressure,
+            max_in_flight=configs.selection_max_in_flight,
+            alpha=configs.selection_ewma_alpha,
+        )
+
+    def selection_stats(self) -> dict:
+        return self.selector.stats()
+
+    def admission_stats(self) -> dict:
+        return self.admission.stats() if self.admission is not None else dict()
+
+    def open_banks(self) -> None:
+        """ 映射预生成的验证码库, 同一类型的多个库按配置顺序交付 """
+
+        from pycaptcha.strategy.captcha_bank import CaptchaBank
+
+        for path in self.poolConfigs.captcha_bank_paths:
+            bank = CaptchaBank(path, self.redis, self.poolConfigs.captcha_bank_cursor_key,
+                               self.poolConfigs.captcha_bank_reserve)
+            self.banks.setdefault(bank.kind, []).append(bank)
+        return None
+
+    def close_banks(self) -> None:
+        for banks in self.banks.values():
+            for bank in banks:
+                bank.close()
+        self.banks = dict()
+        return None
+
+    def bank_stats(self) -> dict:
+        return {captcha_type: [bank.stats() for bank in banks] for captcha_type, banks in self.banks.items()}
+
+    def _take_banked(self, captcha, captcha_type: str) -> dict | None:
+        inline = getattr(captcha, "image_delivery", None) != ImageDeliveryMixin.IMAGE_DELIVERY_URL
+        for bank in self.banks.get(captcha_type, ()):
+            data = bank.get(inline)
+            if data is not None:
+                return data
+        return None
+
+    def start_pools(self) -> None:
+        """ 为每种验证码启动后台预生成池 """
+
+        for captcha_type in self.typeConfigs:
+            if captcha_type in self.pools:
+                continue
+            self.pools[captcha_type] = CaptchaPool(
+                self.get_captcha_instance(captcha_type).render,
+                low_watermark=self.poolConfigs.captcha_pool_low_watermark,
+                high_watermark=self.poolConfigs.captcha_pool_high_watermark,
+                workers=self.poolConfigs.captcha_pool_workers,
+                name=captcha_type,
+            ).start()
+        return None
+
+    def stop_pools(self) -> None:
+        for pool in self.pools.values():
+            pool.stop()
+        self.pools = dict()
+        return None
+
+    def pool_stats(self) -> dict:
+        return {captcha_type: pool.stats() for captcha_type, pool in self.pools.items()}
+
+    def _take(self, captcha, captcha_type: str, client_key: str = None) -> dict:
+        """
+        依次从验证码库、预生成池取出, 都为空时同步渲染, 在交付时写入缓存;
+        开启准入控制时先检查 client_key 的令牌桶, 同步渲染需占用渲染名额, 名额已满时放回令牌; 被拒绝时抛出 AdmissionRejected
+        """
+        admission = self.admission
+        if admission is not None:
+            admission.check_rate(client_key)
+        data = self._take_banked(captcha, captcha_type) if self.banks else None
+        pool = self.pools.get(captcha_type)
+        if data is None and pool is not None:
+            data = pool.get()
+        if data is None:
+            start = time.perf_counter()
+            if admission is not None:
+                with admission.render_slot(client_key):
+                    data = captcha.render()
+            else:
+                data = captcha.render()
+            self.selector.observe_render(captcha_type, time.perf_counter() - start)
+        if admission is not None:
+            admission.record_admitted()
+        captcha.store(data)
         return data
 
-    def get_click_captcha(self) -> dict:
-        clickWordCaptcha = ClickWordCaptcha(self.redis, self.clickConfigs)
-        data = clickWordCaptcha.get()
+    def get_configs(self, kind: str):
+        """ 未配置的类型返回 None, 使用验证码类自己的默认配置 """
+
+        return self.typeConfigs.get(kind)
+
+    @timed("strategy.generate_batch")
+    def generate_batch(self, kind: str, n: int, store: bool = True) -> list:
+        '''
+        render captchas across worker processes
+        :param kind: SIMPLE_ / SLIDER / WORD_IMAGE_CLICK
+        :param n: number of captchas
+        :param store: write the answers with one redis pipeline and strip them from the result
+        :return: rendered captchas, answers are kept in 'data' when store is False
+        '''
+        captcha_class = get_captcha_class(kind)
+        if captcha_class is None:
+            raise ValueError(f"unknown captcha type: {kind}")
+        if self.executor is None:
+            # 进程池模块导入较慢, 只在首次批量生成时导入
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(max_workers=self.poolConfigs.captcha_batch_workers)
+        configs = self.get_configs(kind)
+        futures = [
+            self.executor.submit(render_chunk, kind, configs, count)
+            for count in split_chunks(n, self.poolConfigs.captcha_batch_chunk_size)
+        ]
+        result = []
+        for future in futures:
+            result.extend(future.result())
+        if store:
+            pipeline = self.redis.pipeline()
+            captcha = captcha_class(pipeline, configs)
+            for data in result:
+                captcha.store(data)
+            pipeline.execute()
+            for data in result:
+                data.update({'data': None})
+        return result
+
+    def shutdown_batch(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        return None
+
+    def get_typed_captcha(self, kind: str, client_key: str = None) -> dict:
+        '''
+        generate a captcha of any registered type
+        :param kind: type prefix, e.g. SLIDER or a type added with register_captcha_type
+        '''
+        captcha = self.get_captcha_instance(kind)
+        if captcha is None:
+            raise ValueError(f"unknown captcha type: {kind}")
+        data = self._take(captcha, kind, client_key)
         print("{}_{}".format(data.get("token"), data.get("data")))
         data.update({'data': None})
         return data
 
-    def get_captcha(self) -> dict:
-        n = random.randint(0, 1000)
-        if n % 2 == 0:
-            data = self.get_block_captcha()
-        else:
-            data = self.get_click_captcha()
+    @timed("simple.get")
+    def get_simple_captcha(self, client_key: str = None) -> dict:
+        return self.get_typed_captcha(SIMPLE_CAPTCHA, client_key)
+
+    @timed("slider.get")
+    def get_block_captcha(self, client_key: str = None) -> dict:
+        return self.get_typed_captcha(BLOCK_PUZZLE_CAPTCHA, client_key)
+
+    @timed("click.get")
+    def get_click_captcha(self, client_key: str = None) -> dict:
+        return self.get_typed_captcha(CLICK_WORD_CAPTCHA, client_key)
+
+    def get_captcha(self, client_key: str = None) -> dict:
+        '''
+        :param client_key: client IP or API key for admission control, None skips the per-client rate limit
+        '''
+        # 按负载与各类型渲染耗时选择类型, 选择结果与原因见 selection_stats()
+        choice = self.selector.choose()
+        getter = self.getters.get(choice.kind)
+        with self.selector.track():
+            data = getter(client_key) if getter is not None else self.get_typed_captcha(choice.kind, client_key)
         data.update({'data': None})
         return {
             'id': data.get('token'),
@@ -68,33 +337,90 @@ class CaptchaStrategy:
         :param params: BlockPuzzleCaptcha is [{'x':x,'y':y}] ,ClickWordCaptcha is ['x':x1,'y':y1,'x':x2,'y':y2] , SimpleCaptcha is [{'code':code}]
         :return: return captcha_id if verify success , else return None
         '''
-        prefix = token.split("-")[0]
-        #
-        if prefix == SimpleCaptcha.__CAPTCHA_TYPE__:
-            simpleCaptcha = SimpleCaptcha(self.redis, self.simpleConfigs)
-            return simpleCaptcha.verify(token, params[0])
-        #
-        if prefix == BlockPuzzleCaptcha.__CAPTCHA_TYPE__:
-            blockPuzzleCaptcha = BlockPuzzleCaptcha(self.redis, self.blockConfigs)
-            return blockPuzzleCaptcha.verify(token,params[0])
-        #
-        if prefix == ClickWordCaptcha.__CAPTCHA_TYPE__:
-            clickWordCaptcha = ClickWordCaptcha(self.redis, self.clickConfigs)
-            return clickWordCaptcha.verify(token,params)
-        #
-        return None
+        captcha = self.get_captcha_instance(token.partition("-")[0])
+        if captcha is None:
+            return None
+        # 点选验证码校验全部坐标
+        return captcha.verify(token, params if getattr(captcha, "verify_all_params", False) else params[0])
 
 
     def second_verify(self,captcha_id) -> bool:
-        prefix = captcha_id.split("-")[0]
-        #
-        if prefix == BlockPuzzleCaptcha.__CAPTCHA_TYPE__:
-            blockPuzzleCaptcha = BlockPuzzleCaptcha(self.redis, self.blockConfigs)
-            return blockPuzzleCaptcha.second_verify(captcha_id)
-        #
-        if prefix == ClickWordCaptcha.__CAPTCHA_TYPE__:
-            clickWordCaptcha = ClickWordCaptcha(self.redis, self.clickConfigs)
-            return clickWordCaptcha.second_verify(captcha_id)
+        captcha = self.get_captcha_instance((captcha_id or "").partition("-")[0]) or self.simpleCaptcha
+        return captcha.second_verify(captcha_id)
+
+    def take_image(self, token: str, name: str) -> tuple | None:
+        '''
+        read an image delivered by url once
+        :param name: background or piece
+        :return: (image bytes, mime type), None if missing, expired or already read
+        '''
+        captcha = self.get_captcha_instance((token or "").partition("-")[0])
+        if not isinstance(captcha, ImageDeliveryMixin):
+            return None
+        return captcha.take_image(token, name)
+
+    @timed("strategy.verify_many")
+    def verify_many(self, items: list) -> list:
+        '''
+        verify many tokens with one redis round trip
+        :param items: [(token, params)], params is the same as verify
+        :return: captcha_id or None for each item, in order
+        '''
+        results = [None] * len(items)
+        pending = []
+        consume_items = []
+        for index, item in enumerate(items):
+            try:
+                token, params = item
+                captcha = self.get_captcha_instance((token or "").partition("-")[0])
+                if captcha is None or not params:
+                    continue
+                if not getattr(captcha, "verify_all_params", False):
+                    params = params[0]
+                if captcha.is_sealed(token):
+                    # 无状态 token 只需一次 SET NX, 不进入批量脚本
+                    results[index] = captcha.verify_sealed(token, params)
+                    continue
+            except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+                # 单个请求格式错误不影响同批次其它请求, 该项结果为 None
+                continue
+            captcha_id = captcha.new_captcha_id(token)
+            captcha_id_key = captcha.get_cache_key(captcha_id)
+            pending.append((index, captcha, params, captcha_id, captcha_id_key))
+            consume_items.append((captcha.get_cache_key(token), captcha_id_key, captcha.dump_verified(token),
+                                  captcha.get_cache_expire()))
         #
-        simpleCaptcha = SimpleCaptcha(self.redis, self.simpleConfigs)
-        return simpleCaptcha.second_verify(captcha_id)
+        values = self.redis.consume_many(consume_items)
+        failed_keys = []
+        for (index, captcha, params, captcha_id, captcha_id_key), value in zip(pending, values):
+            # 单个请求参数格式错误不影响同批次其它请求
+            if captcha.safe_match(value, params):
+                results[index] = captcha_id
+            elif value:
+                failed_keys.append(captcha_id_key)
+        self.redis.delete_many(failed_keys)
+        return results
+
+    @timed("strategy.second_verify_many")
+    def second_verify_many(self, captcha_ids: list) -> list:
+        '''
+        second verify many captcha_id with one redis round trip
+        :param captcha_ids: values returned by verify
+        :return: bool for each captcha_id, in order
+        '''
+        results = [False] * len(captcha_ids)
+        pending = []
+        cache_keys = []
+        for index, captcha_id in enumerate(captcha_ids):
+            if not isinstance(captcha_id, str):
+                # 单个 captcha_id 格式错误不影响同批次其它请求, 该项结果为 False
+                continue
+            captcha = self.get_captcha_instance(captcha_id.partition("-")[0]) or self.simpleCaptcha
+            if captcha.is_sealed(captcha_id):
+                results[index] = captcha.second_verify_sealed(captcha_id)
+                continue
+            pending.append(index)
+            cache_keys.append(captcha.get_cache_key(captcha_id))
+        for index, deleted in zip(pending, self.redis.pop_many(cache_keys)):
+            results[index] = deleted
+        return results
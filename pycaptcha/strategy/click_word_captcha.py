@@ -3,160 +3,172 @@ from __future__ import annotations
 
 __author__ = "summerrains"
 
-import base64
 import os
-import json
-from io import BytesIO
-
-from PIL import Image, ImageDraw, ImageFont
+import threading
 
 from pycaptcha import BASE_DIR
 from pycaptcha.strategy.simple_captcha import SimpleCaptcha
-from pycaptcha.utils.image_util import ImageUtil, open_image, image_to_rgba, set_art_text
-from pycaptcha.utils.ramdom_util import generate_random_int, generate_random_background_color
-from pycaptcha.utils.uuid_util import generate_uuid
-from pycaptcha.config import ClickWordCaptchaConfig
-
-
-class ClickWordCaptcha:
+from pycaptcha.utils.asset_catalog import get_asset_catalog
+from pycaptcha.utils.glyph_atlas import get_glyph_atlas
+from pycaptcha.utils.image_util import ImageUtil, set_art_text, get_font, get_font_path
+from pycaptcha.utils.image_encoder import get_image_encoder
+from pycaptcha.utils.ramdom_util import RandomSource, generate_random_int, get_random
+from pycaptcha.strategy.image_delivery import ImageDeliveryMixin
+from pycaptcha.strategy.stateless_token import StatelessTokenMixin
+from pycaptcha.utils.codec import get_value_codec
+from pycaptcha.utils.metrics import lap, start_timer, timed
+from pycaptcha.utils.uuid_util import generate_token_id, get_hash_tag, get_tagged_key
+from pycaptcha.utils.word_layout import get_word_layout
+from pycaptcha.config import ClickWordCaptchaConfig, freeze_config
+from pycaptcha.utils.lazy_import import lazy_import
+
+Image = lazy_import("PIL.Image")
+ImageDraw = lazy_import("PIL.ImageDraw")
+
+
+class ClickWordCaptcha(StatelessTokenMixin, ImageDeliveryMixin):
     """ 点击文字行为验证码 """
 
     __CAPTCHA_TYPE__ = "WORD_IMAGE_CLICK"
 
-    base64_image_prefix = "data:image/jpeg;base64,{data}"
+    base64_image_prefix = "data:image/png;base64,{data}"
     base64_image_prefix_png = "data:image/png;base64,{data}"
     base64_image__type = "png"
     _data_encoding = "utf-8"
+    # 注入的随机数生成器, 例如固定种子的 RandomSource
+    random_source = None
+    # verify 的参数为全部点击坐标, 其它类型只取第一个参数
+    verify_all_params = True
+    image_fields = {
+        "background": ("backgroundImage", "background_encoder"),
+        "piece": ("templateImage", "hint_encoder"),
+    }
 
     def __init__(self, redis=None, configs: ClickWordCaptchaConfig = ClickWordCaptchaConfig) -> None:
         self.redis = redis
         self.background_image_list = list()
-        self.__init_configs(configs)
-        self.set_up()
-
-    def __init_configs(self, configs: ClickWordCaptchaConfig = ClickWordCaptchaConfig) -> None:
-        if not configs:
-            self.click_word_captcha_cache_key = ClickWordCaptchaConfig.click_word_captcha_cache_key
-            self.click_word_captcha_cache_key_expire = ClickWordCaptchaConfig.click_word_captcha_cache_key_expire
-            self.font_ttf_root_path = ClickWordCaptchaConfig.font_ttf_root_path
-            self.click_word_captcha_font_number = ClickWordCaptchaConfig.click_word_captcha_font_number
-            self.click_word_captcha_text = ClickWordCaptchaConfig.click_word_captcha_text
-            self.click_word_captcha_font_size = ClickWordCaptchaConfig.click_word_captcha_font_size
-            self.background_image_root_path = ClickWordCaptchaConfig.background_image_root_path
-        self.click_word_captcha_cache_key = configs.click_word_captcha_cache_key
-        self.click_word_captcha_cache_key_expire = configs.click_word_captcha_cache_key_expire
-        self.font_ttf_root_path = configs.font_ttf_root_path
-        self.click_word_captcha_font_number = configs.click_word_captcha_font_number
-        self.click_word_captcha_text = configs.click_word_captcha_text
-        self.click_word_captcha_font_size = configs.click_word_captcha_font_size
-        self.background_image_root_path = configs.background_image_root_path
+        self.configs = freeze_config(configs or ClickWordCaptchaConfig)
+        self.value_codec = get_value_codec(self.configs.click_word_captcha_value_codec)
+        self.sealer = self.new_sealer(self.configs.click_word_captcha_stateless_secret)
+        self.background_encoder = get_image_encoder(self.configs.click_word_captcha_background_format)
+        self.hint_encoder = get_image_encoder(self.configs.click_word_captcha_hint_format)
+        self.image_delivery = self.configs.click_word_captcha_image_delivery
+        self.image_url = self.configs.click_word_captcha_image_url
+        self.image_expire = self.configs.click_word_captcha_image_expire
+        self.asset_catalog = get_asset_catalog(configs or ClickWordCaptchaConfig)
+        # 资源目录与字形在首次渲染时加载, 只做校验的进程不会加载
+        self.ready = False
+        self._set_up_lock = threading.Lock()
+
+    @timed("click.set_up")
+    def set_up(self) -> None:
+        backgroundImageRoot = self.get_resources(self.configs.background_image_root_path)
+        # 目录扫描结果与解码后的图片由同一配置类共享
+        self.background_image_list = self.asset_catalog.list_files(backgroundImageRoot)
+        # 字符表与字形边界框按配置共享
+        self.word_layout = get_word_layout(self.configs.click_word_captcha_text, get_font_path(),
+                                           self.configs.click_word_captcha_font_size)
+        self.glyph_atlas = None
+        if self.configs.click_word_captcha_glyph_atlas:
+            self.glyph_atlas = get_glyph_atlas(get_font_path(), self.configs.click_word_captcha_font_size,
+                                               self.configs.click_word_captcha_glyph_atlas_max_glyphs)
         return None
 
-    def set_up(self) -> None:
-        backgroundImageRoot = self.get_resources(self.background_image_root_path)
+    def ensure_set_up(self) -> None:
+        if not self.ready:
+            with self._set_up_lock:
+                if not self.ready:
+                    self.set_up()
+                    self.ready = True
+        return None
 
-        def process_file(res, path, info=None, err=None):
-            if os.path.isdir(path):
-                return
-            res.append(path)
+    def warm_up(self) -> None:
+        """ 预先加载资源目录、字符表与字形图集, 解码背景图片(受资源缓存字节上限约束), 并渲染一次加载字体与编码器 """
 
-        for root, dirs, files in os.walk(backgroundImageRoot):
-            for file in files:
-                path = os.path.join(root, file)
-                process_file(self.background_image_list, path)
+        self.ensure_set_up()
+        for src in self.background_image_list:
+            self.asset_catalog.get_image(src)
+        self.render()
         return None
 
+    @property
+    def rng(self) -> RandomSource:
+        """ 注入的 random_source, 未设置时使用当前线程的生成器 """
+
+        return self.random_source or get_random()
+
     def get_resources(self, path_str: str) -> os.path:
         return os.path.join(BASE_DIR, path_str)
 
     def get_background_image(self) -> ImageUtil:
+        self.ensure_set_up()
         max = len(self.background_image_list) - 1
         if max <= 0:
             max = 1
-        src = self.background_image_list[generate_random_int(0, max)]
-        src_image = open_image(src)
+        src = self.background_image_list[generate_random_int(0, max, self.rng)]
+        src_image = self.asset_catalog.get_image(src)
         image_util_obj = ImageUtil(
             src=src,
             src_image=src_image,
-            rgba_image=image_to_rgba(src_image),
+            rgba_image=src_image,
             width=src_image.size[0],
             height=src_image.size[1],
-            font_path=self.get_resources(self.font_ttf_root_path),
+            font_path=self.get_resources(self.configs.font_ttf_root_path),
         )
         return image_util_obj
 
     def get_random_words(self, word_count: int) -> list:
-        word_list = []
-        word_set = set()
-        list_words = list(self.click_word_captcha_text)
-        length = len(list_words)
-        while True:
-            word = list_words[generate_random_int(0, length - 1)]
-            word_set.add(word)
-            if len(word_set) >= word_count:
-                for w in word_set:
-                    word_list.append(w)
-                break
-        return word_list
-
-    def random_word_points(self, width: int, height: int, i: int, count: int) -> dict:
-        avg_width = width / (count + 1)
-        font_size_half = self.click_word_captcha_font_size / 2
-        x = y = 0
-        if avg_width < font_size_half:
-            x = generate_random_int(int(1+font_size_half), int(width))
-        else:
-            if i == 0:
-                x = generate_random_int(int(1+font_size_half), int(avg_width*(i+1)-font_size_half))
-            else:
-                x = generate_random_int(int(avg_width*i+font_size_half), int(avg_width*(i+1)-font_size_half))
-        y = generate_random_int(int(self.click_word_captcha_font_size), int(height-font_size_half))
-        return {"x": x, "y": y}
+        self.ensure_set_up()
+        return self.word_layout.sample(word_count, self.rng)
 
     def get_image_data(self, background_image: ImageUtil) -> tuple:
-        word_count = self.click_word_captcha_font_number
+        self.ensure_set_up()
+        word_count = self.configs.click_word_captcha_font_number
         if word_count < 6:
             word_count += 6
-        # nums 要排除的
-        nums = []
-        while True:
-            if len(nums) == word_count - 4:
-                break
-            num = generate_random_int(0, word_count-1)
-            #
-            exists = False
-            for n in nums:
-                if n == num:
-                    exists = True
-                    break
-            if not exists:
-                nums.append(num)
+        word_count = min(word_count, self.word_layout.capacity(background_image.width, background_image.height))
         #
+        rng = self.rng
         current_words = self.get_random_words(word_count)
+        points = self.word_layout.place(current_words, background_image.width, background_image.height, rng)
+        # 除 4 个需要点击的字以外都是干扰字
+        nums = set(rng.sample(range(len(points)), max(len(points) - 4, 0)))
+        colors = rng.colors(len(points))
 
         points_list = []
         word_list = []
 
-        i = 0
-        for _, word in enumerate(current_words):
-            point = self.random_word_points(background_image.width, background_image.height, i, word_count)
-            set_art_text(background_image, word, self.click_word_captcha_font_size, point,generate_random_background_color())
-
-            exists = False
-            for n in nums:
-                if n == i:
-                    exists = True
-                    break
-            if not exists:
+        for i, (word, point, color) in enumerate(zip(current_words, points, colors)):
+            if self.glyph_atlas is not None:
+                self.glyph_atlas.draw(background_image.rgba_image, word, point, color)
+            else:
+                set_art_text(background_image, word, self.configs.click_word_captcha_font_size, point, color)
+
+            if i not in nums:
                 points_list.append(point)
                 word_list.append(word)
 
-            i = i+1
-
         return points_list, word_list
 
     def get_cache_key(self, token: str) -> str:
-        return f"{self.click_word_captcha_cache_key}:{token}"
+        return get_tagged_key(self.configs.click_word_captcha_cache_key, token)
+
+    def get_cache_expire(self) -> int:
+        return self.configs.click_word_captcha_cache_key_expire
+
+    def new_token(self) -> str:
+        return "{}-{}".format(ClickWordCaptcha.__CAPTCHA_TYPE__, generate_token_id(self.configs.click_word_captcha_token_id_format))
+
+    def new_captcha_id(self, token: str = "") -> str:
+        """ captcha_id 与 token 带有相同的 hash tag, 校验时两个 key 在同一 redis 槽位/分片内原子地更新 """
+
+        token_id = generate_token_id(self.configs.click_word_captcha_token_id_format, get_hash_tag(token))
+        return "{}-{}".format(ClickWordCaptcha.__CAPTCHA_TYPE__, token_id)
+
+    def dump_verified(self, token: str) -> str:
+        """ captcha_id 对应的缓存值 """
+
+        return self.value_codec.dump_verified(token)
 
     def generate_background_size_picture(self,width: int = 120, height: int = 35) -> Image:
         """ 生成制定大小背景图 """
@@ -164,33 +176,39 @@ class ClickWordCaptcha:
 
     def get_template_image(self,font_size: int = 35, word_list: list = None, width: int = 286, height: int = 76):
         """ 提示文字 """
+        im = self.draw_template_image(font_size, word_list, width, height)
+        # 编码输出
+        return self.deliver_image(self.hint_encoder, im)
+
+    def draw_template_image(self, font_size: int = 35, word_list: list = None, width: int = 286,
+                            height: int = 76) -> Image:
         im = self.generate_background_size_picture(width, height)
         dio = ImageDraw.Draw(im)
-        font_family = ImageFont.truetype(SimpleCaptcha.get_font_size_resource(), size=font_size)
+        font_family = get_font(SimpleCaptcha.get_font_size_resource(), font_size)
         temp = []
         for i in range(len(word_list)):
             random_code_str = word_list[i]
             dio.text((10 + i * 66, 0), random_code_str, (128,128,128), font=font_family)
             temp.append(random_code_str)
         #
-        im = SimpleCaptcha.noise(im,width,height,20,50)
-        # 转base64
-        f = BytesIO()
-        im.save(f, self.base64_image__type)
-        data = f.getvalue()
-        f.close()
-        encode_data = base64.b64encode(data)
-        data = str(encode_data, encoding=self._data_encoding)
-        return self.base64_image_prefix_png.format(data=data)
+        im = SimpleCaptcha.noise(im,width,height,20,50,self.rng,fast=self.configs.click_word_captcha_fast_render)
+        return im
 
-    def get(self) -> dict:
+    def render(self) -> dict:
+        """ 生成验证码图片与答案, 不写缓存 """
+
+        start = start_timer()
         background_image = self.get_background_image()
+        start = lap("click.asset_load", start)
         points_list, word_list = self.get_image_data(background_image=background_image)
         #
-        originalImageBase64 = background_image.base64_encode_image(background_image.rgba_image)
         templateImageWidth = 286
         templateImageHeight = 76
-        jigsawImageBase64 = self.get_template_image(60,word_list,templateImageWidth,templateImageHeight)
+        template_image = self.draw_template_image(60, word_list, templateImageWidth, templateImageHeight)
+        start = lap("click.compose", start)
+        backgroundImage = self.deliver_image(self.background_encoder, background_image.rgba_image)
+        jigsawImageBase64 = self.deliver_image(self.hint_encoder, template_image)
+        lap("click.encode", start)
         #
         result = {
             "type": ClickWordCaptcha.__CAPTCHA_TYPE__,
@@ -198,29 +216,51 @@ class ClickWordCaptcha:
             'backgroundImageHeight': background_image.height,
             'templateImageWidth': templateImageWidth,
             'templateImageHeight': templateImageHeight,
-            'token': "{}-{}".format(ClickWordCaptcha.__CAPTCHA_TYPE__,generate_uuid()),
+            'token': self.new_token(),
             'data': points_list,
-            'backgroundImage': self.base64_image_prefix.format(data=originalImageBase64),
+            'backgroundImage': backgroundImage,
             'templateImage': jigsawImageBase64,
             'backgroundImageTag':'default',
             'templateImageTag':'default',
         }
+        return result
+
+    @timed("click.store")
+    def store(self, data: dict) -> None:
+        """ 将答案写入缓存, 过期时间从此刻开始计算 """
+
+        if not self.seal_answer(data):
+            cache_key = self.get_cache_key(data["token"])
+            self.redis.set(cache_key, self.dump_answer(data), self.get_cache_expire())
+        # 图片按地址交付时, 在 token 确定后写入图片
+        self.store_images(data)
+        return None
+
+    def dump_answer(self, data: dict) -> bytes | str:
+        return self.value_codec.dump_points(data["data"])
+
+    def get(self) -> dict:
+        result = self.render()
         #
-        cache_key = self.get_cache_key(result["token"])
-        self.redis.set(cache_key, json.dumps(points_list), self.click_word_captcha_cache_key_expire)
+        self.store(result)
         return result
 
     def check(self, token: str, point_jsons: list) -> bool:
         cache_key = self.get_cache_key(token)
         cache_value_bytes = self.redis.get(cache_key)
+        return self.safe_match(cache_value_bytes, point_jsons)
+
+    def match(self, cache_value_bytes: bytes | None, point_jsons: list) -> bool:
+        """ 校验缓存中的答案, 不访问缓存 """
+
         if not cache_value_bytes:
             return False
 
-        cache_value = json.loads(cache_value_bytes.decode(self._data_encoding))
+        cache_value = self.value_codec.load_points(cache_value_bytes)
 
         for index, point in enumerate(cache_value):
             target_point = point_jsons[index]
-            font_size = self.click_word_captcha_font_size
+            font_size = self.configs.click_word_captcha_font_size
             if (
                 target_point.get("x")-font_size > point.get("x") or
                 target_point.get("x") > point.get("x")+font_size or
@@ -230,6 +270,7 @@ class ClickWordCaptcha:
                 return False
         return True
 
+    @timed("click.second_verify")
     def second_verify(self,captcha_id) -> bool:
         '''
         verify captcha_id
@@ -237,26 +278,27 @@ class ClickWordCaptcha:
         :return: return true if verify success
         '''
         captcha_id = captcha_id or ""
+        if self.is_sealed(captcha_id):
+            return self.second_verify_sealed(captcha_id)
         cache_key = self.get_cache_key(captcha_id)
-        cache_value_bytes = self.redis.get(cache_key)
-        if not cache_value_bytes:
-            return False
-        self.redis.delete(cache_key)
-        return True
+        return self.redis.pop(cache_key)
 
+    @timed("click.verify")
     def verify(self, token: str, point_jsons: list) -> str | None:
         '''
         verify click, x and y offset in 25
         :param params:
         :return: return captcha_id if verify success , else return None
         '''
-        flag = self.check(token, point_jsons)
-        if not flag:
+        if self.is_sealed(token):
+            return self.verify_sealed(token, point_jsons)
+        # token 无论校验成功与否都只能使用一次, 成功时 captcha_id 在同一次往返中写入
+        captcha_id = self.new_captcha_id(token)
+        captcha_id_key = self.get_cache_key(captcha_id)
+        cache_value_bytes = self.redis.consume(self.get_cache_key(token), captcha_id_key, self.dump_verified(token),
+                                               self.get_cache_expire())
+        if not self.safe_match(cache_value_bytes, point_jsons):
+            if cache_value_bytes:
+                self.redis.delete(captcha_id_key)
             return None
-        cache_key = self.get_cache_key(token)
-        self.redis.delete(cache_key)
-        # create captcha_id
-        captcha_id = "{}-{}".format(ClickWordCaptcha.__CAPTCHA_TYPE__,generate_uuid())
-        cache_key = self.get_cache_key(captcha_id)
-        self.redis.setex(cache_key, token, self.click_word_captcha_cache_key_expire)
         return captcha_id
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+__author__ = "summerrains"
+
+
+class ImageDeliveryMixin:
+    """
+    图片交付方式: inline 在 JSON 中返回 base64 data URI; url 将编码后的图片字节短时缓存,
+    JSON 中只返回地址, 图片按地址读取一次后删除
+    """
+
+    IMAGE_DELIVERY_INLINE = "inline"
+    IMAGE_DELIVERY_URL = "url"
+
+    # 图片名称 -> (返回字段, 输出引擎属性名)
+    image_fields = {
+        "background": ("backgroundImage", "background_encoder"),
+        "piece": ("templateImage", "piece_encoder"),
+    }
+
+    image_delivery = IMAGE_DELIVERY_INLINE
+    image_url = "/captcha/{token}/{name}"
+    image_expire = 60
+
+    def deliver_image(self, encoder, image) -> str | bytes:
+        """ inline 返回 data URI, url 返回待缓存的图片字节 """
+
+        if self.image_delivery == self.IMAGE_DELIVERY_URL:
+            return encoder.encode(image)
+        return encoder.data_uri(image)
+
+    def get_image_cache_key(self, token: str, name: str) -> str:
+        return self.get_cache_key(f"{token}:{name}")
+
+    def pending_images(self, data: dict) -> list:
+        """ 将 data 中的图片字节替换为地址, 返回需要写入缓存的 (key, 图片字节, 过期时间) """
+
+        pending = []
+        token = data.get("token")
+        for name, (field, _) in self.image_fields.items():
+            image_bytes = data.get(field)
+            if not isinstance(image_bytes, bytes):
+                continue
+            pending.append((self.get_image_cache_key(token, name), image_bytes, self.image_expire))
+            data[field] = self.image_url.format(token=token, name=name)
+        return pending
+
+    def store_images(self, data: dict) -> None:
+        for cache_key, image_bytes, expire_time in self.pending_images(data):
+            self.redis.setex(cache_key, image_bytes, expire_time)
+        return None
+
+    def get_image_mime_type(self, name: str) -> str | None:
+        field = self.image_fields.get(name)
+        return getattr(self, field[1]).mime_type if field else None
+
+    def take_image(self, token: str, name: str) -> tuple | None:
+        '''
+        read a delivered image once
+        :return: (image bytes, mime type), None if missing, expired or already read
+        '''
+        mime_type = self.get_image_mime_type(name)
+        if mime_type is None:
+            return None
+        image_bytes = self.redis.take(self.get_image_cache_key(token or "", name))
+        if image_bytes is None:
+            return None
+        return image_bytes, mime_type
@@ -2,65 +2,106 @@
 # -*- coding:utf-8 -*-
 from __future__ import annotations
 
-import base64
 import os
-import random
-from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
+import string
+from functools import lru_cache
+from pycaptcha.utils.lazy_import import lazy_import
 from pycaptcha import BASE_DIR
-from pycaptcha.utils.uuid_util import generate_uuid
-from pycaptcha.utils.ramdom_util import generate_random_background_color, generate_code_chr
-from pycaptcha.config import SimpleCaptchaConfig
+from pycaptcha.utils.glyph_atlas import get_glyph_atlas
+from pycaptcha.utils.image_util import get_font
+from pycaptcha.utils.image_encoder import get_image_encoder
+from pycaptcha.strategy.stateless_token import StatelessTokenMixin
+from pycaptcha.utils.codec import get_value_codec
+from pycaptcha.utils.metrics import lap, start_timer, timed
+from pycaptcha.utils.uuid_util import generate_token_id, get_hash_tag, get_tagged_key
+from pycaptcha.utils.ramdom_util import RandomSource, generate_random_background_color, generate_code_chr, get_random
+from pycaptcha.config import SimpleCaptchaConfig, freeze_config
 
+Image = lazy_import("PIL.Image")
+ImageChops = lazy_import("PIL.ImageChops")
+ImageDraw = lazy_import("PIL.ImageDraw")
+ImageFilter = lazy_import("PIL.ImageFilter")
 
-class SimpleCaptcha:
+
+class SimpleCaptcha(StatelessTokenMixin):
     """ 简单验证码 """
 
     __CAPTCHA_TYPE__ = "SIMPLE_"
 
-    base64_image_prefix = "data:image/jpeg;base64,{data}"
+    base64_image_prefix = "data:image/png;base64,{data}"
     base64_image__type = "png"
     _data_encoding = "utf-8"
+    # generate_code_chr 可能生成的全部字符, 快速渲染时预先渲染字形
+    code_chars = string.digits + string.ascii_lowercase
+    # 干扰色块边长, 噪点与圆弧的颜色取自按此大小放大的随机色图
+    noise_color_block = 4
+    # 注入的随机数生成器, 例如固定种子的 RandomSource
+    random_source = None
 
     def __init__(self, redis=None, configs=None):
         self.redis = redis
-        self.__init_configs(configs)
-
-    def __init_configs(self, configs: SimpleCaptchaConfig = None) -> None:
-        if configs:
-            self.simple_captcha_cache_key = configs.simple_captcha_cache_key
-            self.simple_captcha_cache_key_expire = configs.simple_captcha_cache_key_expire
-        else:
-            self.simple_captcha_cache_key = SimpleCaptchaConfig.simple_captcha_cache_key
-            self.simple_captcha_cache_key_expire = SimpleCaptchaConfig.simple_captcha_cache_key_expire
-        return None
+        self.configs = freeze_config(configs or SimpleCaptchaConfig)
+        self.value_codec = get_value_codec(self.configs.simple_captcha_value_codec)
+        self.sealer = self.new_sealer(self.configs.simple_captcha_stateless_secret)
+        self.image_encoder = get_image_encoder(self.configs.simple_captcha_image_format)
+
+    @property
+    def rng(self) -> RandomSource:
+        """ 注入的 random_source, 未设置时使用当前线程的生成器 """
+
+        return self.random_source or get_random()
 
     @staticmethod
     def get_font_size_resource() -> os.path:
         return os.path.join(BASE_DIR, 'resource', 'fonts', 'WenQuanZhengHei.ttf')
 
     @staticmethod
-    def generate_background_size_picture(width: int = 120, height: int = 35) -> Image:
+    def generate_background_size_picture(width: int = 120, height: int = 35, rng: RandomSource = None) -> Image:
         """ 生成制定大小背景图 """
 
-        return Image.new('RGB', (width, height), generate_random_background_color())
+        return Image.new('RGB', (width, height), generate_random_background_color(rng))
 
     @staticmethod
-    def draw_code(font_size: int = 35, code_length: int = 4, width: int = 120, height: int = 35):
-        """ 画验证码 """
+    def draw_code(font_size: int = 35, code_length: int = 4, width: int = 120, height: int = 35,
+                  rng: RandomSource = None, fast: bool = True):
+        """ 画验证码, fast 时从预渲染的字形蒙版粘贴, 结果与逐字 ImageDraw.text 一致 """
 
-        im = SimpleCaptcha.generate_background_size_picture(width, height)
+        rng = rng or get_random()
+        im = SimpleCaptcha.generate_background_size_picture(width, height, rng)
+        colors = rng.colors(code_length)
+        temp = [generate_code_chr(rng) for _ in range(code_length)]
+        if fast:
+            atlas = SimpleCaptcha.get_code_glyphs(font_size)
+            for i, random_code_str in enumerate(temp):
+                atlas.draw(im, random_code_str, {"x": 10 + i * 30, "y": -2}, colors[i])
+            return ''.join(temp), im
         dio = ImageDraw.Draw(im)
-        font_family = ImageFont.truetype(SimpleCaptcha.get_font_size_resource(), size=font_size)
-        temp = []
-        for i in range(code_length):
-            random_code_str = generate_code_chr()
-            dio.text((10 + i * 30, -2), random_code_str, generate_random_background_color(), font=font_family)
-            temp.append(random_code_str)
+        font_family = get_font(SimpleCaptcha.get_font_size_resource(), font_size)
+        for i, random_code_str in enumerate(temp):
+            dio.text((10 + i * 30, -2), random_code_str, colors[i], font=font_family)
         return ''.join(temp), im
 
+    @staticmethod
+    def get_code_glyphs(font_size: int):
+        """ 验证码字符的字形图集, 首次使用时渲染全部字符 """
+
+        atlas = get_glyph_atlas(SimpleCaptcha.get_font_size_resource(), font_size)
+        if len(atlas.glyphs) < len(SimpleCaptcha.code_chars):
+            atlas.warm_up(SimpleCaptcha.code_chars)
+        return atlas
+
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def get_arc_filter() -> ImageFilter.Kernel:
+        """ 把单个像素扩展成 (x, y, x + 4, y + 4) 0~90 度圆弧的卷积核 """
+
+        arc = Image.new("L", (5, 5))
+        ImageDraw.Draw(arc).arc((0, 0, 4, 4), 0, 90, fill=1)
+        return ImageFilter.Kernel((5, 5), list(arc.tobytes()), scale=1)
+
     @classmethod
-    def noise(cls, image, width=120, height=35, line_count=3, point_count=20) -> Image:
+    def noise(cls, image, width=120, height=35, line_count=3, point_count=20, rng: RandomSource = None,
+              fast: bool = False) -> Image:
         """
 
         :param image: 图片对象
@@ -68,45 +109,125 @@ class SimpleCaptcha:
         :param height: 图片高度
         :param line_count: 线条数量
         :param point_count: 点的数量
+        :param rng: 随机数生成器, 默认使用当前线程的生成器
+        :param fast: 噪点与圆弧合成一张蒙版后一次粘贴, 否则逐个绘制
         :return:
         """
+        rng = rng or get_random()
+        if fast:
+            return cls.fast_noise(image, width, height, line_count, point_count, rng)
         draw = ImageDraw.Draw(image)
+        # 坐标与颜色一次批量生成: 每条线 2 个点, 每个干扰点与圆弧各 1 个点
+        draws = line_count * (2 + 2 * point_count)
+        xs = iter(rng.ints(0, width, draws))
+        ys = iter(rng.ints(0, height, draws))
+        colors = iter(rng.colors(line_count * (1 + 2 * point_count)))
         for i in range(line_count):
-            x1 = random.randint(0, width)
-            x2 = random.randint(0, width)
-            y1 = random.randint(0, height)
-            y2 = random.randint(0, height)
-            draw.line((x1, y1, x2, y2), fill=generate_random_background_color())
+            x1, x2 = next(xs), next(xs)
+            y1, y2 = next(ys), next(ys)
+            draw.line((x1, y1, x2, y2), fill=next(colors))
 
             # 画点
             for i in range(point_count):
-                draw.point([random.randint(0, width), random.randint(0, height)],
-                           fill=generate_random_background_color())
-                x = random.randint(0, width)
-                y = random.randint(0, height)
-                draw.arc((x, y, x + 4, y + 4), 0, 90, fill=generate_random_background_color())
+                draw.point([next(xs), next(ys)], fill=next(colors))
+                x = next(xs)
+                y = next(ys)
+                draw.arc((x, y, x + 4, y + 4), 0, 90, fill=next(colors))
+        return image
+
+    @classmethod
+    def fast_noise(cls, image, width: int, height: int, line_count: int, point_count: int,
+                   rng: RandomSource) -> Image:
+        """ 线条与 noise 相同; 噪点和圆弧起点写入蒙版, 圆弧由卷积展开, 最后与随机色图一次合成 """
+
+        draw = ImageDraw.Draw(image)
+        xs = rng.ints(0, width, 2 * line_count)
+        ys = rng.ints(0, height, 2 * line_count)
+        for i, color in enumerate(rng.colors(line_count)):
+            draw.line((xs[2 * i], ys[2 * i], xs[2 * i + 1], ys[2 * i + 1]), fill=color)
+
+        size = image.size
+        pixels = size[0] * size[1]
+        count = line_count * point_count
+        if not count or not pixels:
+            return image
+        points = bytearray(pixels)
+        for offset in rng.ints(0, pixels - 1, count):
+            points[offset] = 255
+        arcs = bytearray(pixels)
+        for offset in rng.ints(0, pixels - 1, count):
+            arcs[offset] = 255
+        mask = ImageChops.lighter(Image.frombytes("L", size, bytes(points)),
+                                  Image.frombytes("L", size, bytes(arcs)).filter(cls.get_arc_filter()))
+        block = cls.noise_color_block
+        block_size = (-(-size[0] // block), -(-size[1] // block))
+        colors = Image.frombytes("RGB", block_size, rng.randbytes(3 * block_size[0] * block_size[1]))
+        image.paste(colors.resize(size, Image.NEAREST).convert(image.mode), (0, 0), mask)
         return image
 
     def get_cache_key(self, token: str) -> str:
-        return f'{self.simple_captcha_cache_key}:{token}'
+        return get_tagged_key(self.configs.simple_captcha_cache_key, token)
 
-    def get(self, font_size: int = 35, code_length: int = 4, width: int = 120,
+    def get_cache_expire(self) -> int:
+        return self.configs.simple_captcha_cache_key_expire
+
+    def new_token(self) -> str:
+        return "{}-{}".format(SimpleCaptcha.__CAPTCHA_TYPE__, generate_token_id(self.configs.simple_captcha_token_id_format))
+
+    def new_captcha_id(self, token: str = "") -> str:
+        """ captcha_id 与 token 带有相同的 hash tag, 校验时两个 key 在同一 redis 槽位/分片内原子地更新 """
+
+        token_id = generate_token_id(self.configs.simple_captcha_token_id_format, get_hash_tag(token))
+        return "{}-{}".format(SimpleCaptcha.__CAPTCHA_TYPE__, token_id)
+
+    def dump_verified(self, token: str) -> str:
+        """ captcha_id 对应的缓存值 """
+
+        return self.value_codec.dump_verified(token)
+
+    def render(self, font_size: int = 35, code_length: int = 4, width: int = 120,
                                     height: int = 35, need_noise: bool = False) -> dict:
-        token = "{}-{}".format(SimpleCaptcha.__CAPTCHA_TYPE__,generate_uuid())
-        code, im = self.draw_code(font_size, code_length, width, height)
+        """ 生成验证码图片与答案, 不写缓存 """
+
+        token = self.new_token()
+        start = start_timer()
+        rng = self.rng
+        fast = self.configs.simple_captcha_fast_render
+        code, im = self.draw_code(font_size, code_length, width, height, rng, fast)
         if need_noise:
-            im = self.noise(im)
-        f = BytesIO()
-        im.save(f, self.base64_image__type)
-        data = f.getvalue()
-        f.close()
-        encode_data = base64.b64encode(data)
-        data = str(encode_data, encoding=self._data_encoding)
-        img_data = self.base64_image_prefix.format(data=data)
-        cache_key = self.get_cache_key(token)
-        self.redis.setex(cache_key, code, self.simple_captcha_cache_key_expire)
-        return {"base64ImageString": img_data, "token": token, "imageWidth": width, "imageHeight": height,'data':code}
+            im = self.noise(im, width, height, rng=rng, fast=fast)
+        start = lap("simple.compose", start)
+        img_data = self.image_encoder.data_uri(im)
+        lap("simple.encode", start)
+        return {"base64ImageString": img_data, "token": token, "imageWidth": width, "imageHeight": height,'data':code,
+                "type": SimpleCaptcha.__CAPTCHA_TYPE__}
+
+    def warm_up(self) -> None:
+        """ 渲染一次, 预先加载字体与字形图集 """
+
+        self.render()
+        return None
+
+    @timed("simple.store")
+    def store(self, data: dict) -> None:
+        """ 将答案写入缓存, 过期时间从此刻开始计算 """
+
+        if self.seal_answer(data):
+            return None
+        cache_key = self.get_cache_key(data["token"])
+        self.redis.setex(cache_key, self.dump_answer(data), self.get_cache_expire())
+        return None
+
+    def dump_answer(self, data: dict) -> str:
+        return data["data"]
 
+    def get(self, font_size: int = 35, code_length: int = 4, width: int = 120,
+                                    height: int = 35, need_noise: bool = False) -> dict:
+        data = self.render(font_size, code_length, width, height, need_noise)
+        self.store(data)
+        return data
+
+    @timed("simple.second_verify")
     def second_verify(self,captcha_id) -> bool:
         '''
         verify captcha_id
@@ -114,13 +235,20 @@ class SimpleCaptcha:
         :return: return true if verify success
         '''
         captcha_id = captcha_id or ""
+        if self.is_sealed(captcha_id):
+            return self.second_verify_sealed(captcha_id)
         cache_key = self.get_cache_key(captcha_id)
-        cache_value_bytes = self.redis.get(cache_key)
+        return self.redis.pop(cache_key)
+
+    def match(self, cache_value_bytes: bytes | None, params: dict) -> bool:
+        """ 校验缓存中的答案, 不访问缓存 """
+
+        code = params.get("code") or ""
         if not cache_value_bytes:
             return False
-        self.redis.delete(cache_key)
-        return True
+        return cache_value_bytes.decode() == code
 
+    @timed("simple.verify")
     def verify(self, token, params: dict) -> str | None:
         '''
         verify code
@@ -128,17 +256,15 @@ class SimpleCaptcha:
         :return: return captcha_id if verify success , else return None
         '''
         # token = params.get("token") or ""
-        code = params.get("code") or ""
-
-        cache_key = self.get_cache_key(token)
-        cache_value_bytes = self.redis.get(cache_key)
-        if not cache_value_bytes:
+        if self.is_sealed(token):
+            return self.verify_sealed(token, params)
+        # token 无论校验成功与否都只能使用一次, 成功时 captcha_id 在同一次往返中写入
+        captcha_id = self.new_captcha_id(token)
+        captcha_id_key = self.get_cache_key(captcha_id)
+        cache_value_bytes = self.redis.consume(self.get_cache_key(token), captcha_id_key, self.dump_verified(token),
+                                               self.get_cache_expire())
+        if not self.safe_match(cache_value_bytes, params):
+            if cache_value_bytes:
+                self.redis.delete(captcha_id_key)
             return None
-        if cache_value_bytes.decode() == code:
-            self.redis.delete(cache_key)
-            # create captcha_id
-            captcha_id = "{}-{}".format(SimpleCaptcha.__CAPTCHA_TYPE__,generate_uuid())
-            cache_key = self.get_cache_key(captcha_id)
-            self.redis.setex(cache_key, token, self.simple_captcha_cache_key_expire)
-            return captcha_id
-        return None
+        return captcha_id
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+__author__ = "summerrains"
+
+import time
+
+from pycaptcha.utils.sealed_token import TokenSealer
+from pycaptcha.utils.uuid_util import SEALED_TOKEN_MARKER
+
+SEALED_CHALLENGE = 1  # token, 载荷为答案
+SEALED_VERIFIED = 2  # verify 成功后返回的 captcha_id, 载荷为空
+
+
+class StatelessTokenMixin:
+    """
+    无状态 token: 答案与过期时间加密签名后放入 token 本身, 生成时不访问缓存
+    校验时只做一次 SET NX 防止重放, 形如 SLIDER-s.<sealed>, 与普通 token 可同时使用
+    """
+
+    _sealed_marker = SEALED_TOKEN_MARKER
+
+    sealer = None
+    # match 遇到格式错误的参数(缺少坐标、类型不对)时抛出的异常
+    malformed_params_errors = (AttributeError, IndexError, KeyError, TypeError, ValueError)
+
+    def safe_match(self, cache_value_bytes, params) -> bool:
+        """ 与 match 相同, 参数格式错误时按校验失败处理, 不抛出异常 """
+
+        try:
+            return self.match(cache_value_bytes, params)
+        except self.malformed_params_errors:
+            return False
+
+    @staticmethod
+    def new_sealer(secret) -> TokenSealer | None:
+        return TokenSealer(secret) if secret else None
+
+    def is_sealed(self, token: str) -> bool:
+        return (token or "").partition("-")[2].startswith(self._sealed_marker)
+
+    def seal(self, kind: int, payload: bytes) -> str:
+        expires_at = int(time.time()) + self.get_cache_expire()
+        sealed = self.sealer.seal(kind, expires_at, payload, self.__CAPTCHA_TYPE__.encode())
+        return f"{self.__CAPTCHA_TYPE__}-{self._sealed_marker}{sealed}"
+
+    def seal_answer(self, data: dict) -> bool:
+        """ 开启无状态 token 时把答案封装进 data['token'], 返回 True 表示无需写缓存 """
+
+        if self.sealer is None:
+            return False
+        answer = self.dump_answer(data)
+        if isinstance(answer, str):
+            answer = answer.encode("utf-8")
+        data["token"] = self.seal(SEALED_CHALLENGE, answer)
+        return True
+
+    def open_sealed(self, token: str, kind: int) -> tuple | None:
+        """ 校验签名与过期时间, 返回 (防重放key, 剩余秒数, 答案) """
+
+        if self.sealer is None:
+            return None
+        captcha_type, _, body = (token or "").partition("-")
+        if captcha_type != self.__CAPTCHA_TYPE__:
+            return None
+        opened = self.sealer.unseal(body[len(self._sealed_marker):], captcha_type.encode())
+        if opened is None:
+            return None
+        sealed_kind, expires_at, nonce, payload = opened
+        ttl = expires_at - int(time.time())
+        if sealed_kind != kind or ttl <= 0:
+            return None
+        # nonce 在前, 防重放 key 按 nonce 分散到各 redis 槽位/分片
+        return self.get_cache_key(f"{captcha_type}-{nonce.hex()}.used"), ttl, payload
+
+    def verify_sealed(self, token: str, params) -> str | None:
+        # 与普通 token 一致, 无论校验成功与否都只能使用一次
+        opened = self.open_sealed(token, SEALED_CHALLENGE)
+        if opened is None:
+            return None
+        replay_key, ttl, answer = opened
+        if not self.redis.set_nx(replay_key, "1", ttl) or not self.safe_match(answer, params):
+            return None
+        return self.seal(SEALED_VERIFIED, b"")
+
+    def second_verify_sealed(self, captcha_id: str) -> bool:
+        opened = self.open_sealed(captcha_id, SEALED_VERIFIED)
+        if opened is None:
+            return False
+        replay_key, ttl, _ = opened
+        return self.redis.set_nx(replay_key, "1", ttl)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+import contextlib
+import math
+import os
+import threading
+
+from pycaptcha.utils.memory_storage import MemoryStorage
+
+
+class AdmissionRejected(Exception):
+    """ 请求被准入控制拒绝, retry_after 为建议的重试等待秒数 (HTTP Retry-After) """
+
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(f"captcha request rejected ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    生成验证码的准入控制: 按客户端 (IP 或 API key) 的令牌桶限速, 令牌桶保存在进程内分片表或 redis 脚本中;
+    同时渲染的数量有全局上限, 超出时立即拒绝而不是排队
+    """
+
+    REASON_RATE = "rate"
+    REASON_CONCURRENCY = "concurrency"
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+    metric_name = "pycaptcha_admission"
+
+    def __init__(self, storage=None, rate: float = 1.0, burst: int = 10, max_in_flight: int = None,
+                 retry_after: int = 1, cache_key: str = "Admission", max_clients: int = 100000) -> None:
+        '''
+
+        :param storage: BaseStorage holding the token buckets, None keeps them in this process
+        :param rate: tokens a client regains per second, 0 disables rate limiting
+        :param burst: bucket size, the requests a client may make at once
+        :param max_in_flight: renders running at once in this process, None uses 2 * os.cpu_count(), 0 disables
+        :param retry_after: Retry-After seconds when the render cap is reached
+        :param max_clients: bound of the in-process bucket table
+        '''
+        self.storage = storage if storage is not None else MemoryStorage(max_entries=max_clients)
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = 2 * (os.cpu_count() or 1) if max_in_flight is None else max_in_flight
+        self.retry_after = retry_after
+        self.cache_key = cache_key
+        self.admitted = 0
+        self.shed_rate = 0
+        self.shed_concurrency = 0
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(self.max_in_flight) if self.max_in_flight > 0 else None
+        self._lock = threading.Lock()
+
+    def check_rate(self, client_key: str | None, cost: int = 1) -> None:
+        """ 从 client_key 的令牌桶取出 cost 个令牌, 不足时抛出 AdmissionRejected; client_key 为空时不限速 """
+
+        if not client_key or self.rate <= 0:
+            return None
+        wait = self.storage.take_tokens(f"{self.cache_key}:{client_key}", self.rate, self.burst, cost)
+        if wait > 0:
+            with self._lock:
+                self.shed_rate += 1
+            raise AdmissionRejected(self.REASON_RATE, max(math.ceil(wait), 1))
+        return None
+
+    def refund_rate(self, client_key: str | None, cost: int = 1) -> None:
+        """ 放回 check_rate 取出的令牌, 请求随后因其它原因被拒绝时不消耗客户端的配额 """
+
+        if not client_key or self.rate <= 0:
+            return None
+        self.storage.take_tokens(f"{self.cache_key}:{client_key}", self.rate, self.burst, -cost)
+        return None
+
+    @contextlib.contextmanager
+    def render_slot(self, client_key: str = None, cost: int = 1):
+        """ 占用一个渲染名额, 已满时放回 client_key 已取出的 cost 个令牌并立即抛出 AdmissionRejected """
+
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.shed_concurrency += 1
+            self.refund_rate(client_key, cost)
+            raise AdmissionRejected(self.REASON_CONCURRENCY, self.retry_after)
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield None
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+    def record_admitted(self) -> None:
+        with self._lock:
+            self.admitted += 1
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "admitted": self.admitted,
+                "shed_rate": self.shed_rate,
+                "shed_concurrency": self.shed_concurrency,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+            }
+
+    def exposition(self) -> str:
+        """ 计数以 Prometheus 文本格式输出 """
+
+        stats = self.stats()
+        name = self.metric_name
+        lines = [
+            f"# HELP {name}_requests_total Captcha generation requests by admission result.",
+            f"# TYPE {name}_requests_total counter",
+            f'{name}_requests_total{{result="admitted"}} {stats["admitted"]}',
+            f'{name}_requests_total{{result="shed_rate"}} {stats["shed_rate"]}',
+            f'{name}_requests_total{{result="shed_concurrency"}} {stats["shed_concurrency"]}',
+            f"# HELP {name}_in_flight Captcha renders running in this process.",
+            f"# TYPE {name}_in_flight gauge",
+            f"{name}_in_flight {stats['in_flight']}",
+        ]
+        return "\n".join(lines) + "\n"
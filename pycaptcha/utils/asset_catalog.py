@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+
+from pycaptcha.utils.image_util import image_to_rgba, open_image
+from pycaptcha.utils.lazy_import import lazy_import
+
+Image = lazy_import("PIL.Image")
+
+
+class AssetCatalog:
+    """ 图片资源目录: 目录只扫描一次, 解码后的RGBA图片按LRU缓存, 超出字节预算时淘汰最久未使用的图片 """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._files = dict()
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def list_files(self, root: str) -> list:
+        """ 获取目录下的全部文件, 结果缓存 """
+
+        files = self._files.get(root)
+        if files is None:
+            files = []
+            for dir_path, dirs, names in os.walk(root):
+                for name in names:
+                    path = os.path.join(dir_path, name)
+                    if not os.path.isdir(path):
+                        files.append(path)
+            self._files[root] = files
+        return files
+
+    def get_image(self, src: str) -> Image:
+        """ 获取图片的RGBA副本, 调用方可以随意修改 """
+
+        with self._lock:
+            image = self._images.get(src)
+            if image is not None:
+                self._images.move_to_end(src)
+                self.hits += 1
+                return image.copy()
+            self.misses += 1
+
+        image = image_to_rgba(open_image(src))
+        image.load()
+        size = self.image_bytes(image)
+        with self._lock:
+            if size <= self.max_bytes and src not in self._images:
+                self._images[src] = image
+                self.current_bytes += size
+                while self.current_bytes > self.max_bytes:
+                    _, evicted = self._images.popitem(last=False)
+                    self.current_bytes -= self.image_bytes(evicted)
+                    self.evictions += 1
+        return image.copy()
+
+    @staticmethod
+    def image_bytes(image: Image) -> int:
+        return image.width * image.height * len(image.getbands())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._files.clear()
+            self._images.clear()
+            self.current_bytes = 0
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "images": len(self._images),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_catalogs = dict()
+_catalogs_lock = threading.Lock()
+
+
+def get_asset_catalog(configs) -> AssetCatalog:
+    """ 每个配置类共享一个资源目录 """
+
+    catalog = _catalogs.get(configs)
+    if catalog is None:
+        with _catalogs_lock:
+            catalog = _catalogs.get(configs)
+            if catalog is None:
+                catalog = AssetCatalog(configs.asset_cache_max_bytes)
+                _catalogs[configs] = catalog
+    return catalog
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+import threading
+
+from pycaptcha.utils.image_util import get_font
+from pycaptcha.utils.lazy_import import lazy_import
+
+Image = lazy_import("PIL.Image")
+ImageDraw = lazy_import("PIL.ImageDraw")
+
+
+class GlyphAtlas:
+    """ 字形图集: 预渲染单个字符的alpha蒙版, 绘制时用颜色加蒙版粘贴, 结果与 ImageDraw.text 一致 """
+
+    _default_fill = (0xff, 0xff, 0xff, 0xff)
+
+    def __init__(self, font_path: str, font_size: int, max_glyphs: int = 2048) -> None:
+        self.font_path = font_path
+        self.font_size = font_size
+        self.max_glyphs = max_glyphs
+        self.font = get_font(font_path, font_size)
+        self.glyphs = dict()
+        self._lock = threading.Lock()
+
+    def render(self, char: str) -> tuple:
+        """ 渲染字符蒙版, 返回 (mask, left, top), left/top 为相对绘制坐标的偏移 """
+
+        left, top, right, bottom = self.font.getbbox(char)
+        mask = Image.new("L", (max(right - left, 0), max(bottom - top, 0)))
+        ImageDraw.Draw(mask).text((-left, -top), char, fill=255, font=self.font)
+        return mask, left, top
+
+    def get(self, char: str) -> tuple:
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            glyph = self.render(char)
+            with self._lock:
+                if len(self.glyphs) < self.max_glyphs:
+                    self.glyphs[char] = glyph
+        return glyph
+
+    def warm_up(self, text: str) -> GlyphAtlas:
+        for char in text:
+            self.get(char)
+        return self
+
+    def draw(self, image: Image, word: str, point: dict, fill=None) -> None:
+        """ 在 point 处绘制文字, 多字符文字交给 ImageDraw 处理字距 """
+
+        x, y = point.get("x"), point.get("y")
+        if len(word) != 1:
+            ImageDraw.Draw(image).text((x, y), word, fill=fill, font=self.font)
+            return None
+        mask, left, top = self.get(word)
+        if mask.width and mask.height:
+            x, y = x + left, y + top
+            image.paste(fill or self._default_fill, (x, y, x + mask.width, y + mask.height), mask)
+        return None
+
+
+_atlases = dict()
+_atlases_lock = threading.Lock()
+
+
+def get_glyph_atlas(font_path: str, font_size: int, max_glyphs: int = 2048) -> GlyphAtlas:
+    """ 按(字体路径, 字号)共享字形图集 """
+
+    key = (font_path, font_size)
+    atlas = _atlases.get(key)
+    if atlas is None:
+        with _atlases_lock:
+            atlas = _atlases.get(key)
+            if atlas is None:
+                atlas = GlyphAtlas(font_path, font_size, max_glyphs)
+                _atlases[key] = atlas
+    return atlas
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+import base64
+from io import BytesIO
+from pycaptcha.utils.lazy_import import lazy_import
+
+Image = lazy_import("PIL.Image")
+
+
+class ImageEncoder:
+    """ 图片输出引擎: 输出格式, 压缩参数与调色板量化 """
+
+    _data_encoding = "utf-8"
+    _mime_types = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+    # 不支持透明通道的格式, 编码前转为 RGB
+    _opaque_formats = ("JPEG",)
+
+    def __init__(self, format: str = "PNG", quality: int = None, compress_level: int = None, optimize: bool = False,
+                 lossless: bool = False, method: int = None, colors: int = None) -> None:
+        '''
+
+        :param format: PNG / JPEG / WEBP
+        :param quality: JPEG and lossy WEBP quality 1-100
+        :param compress_level: PNG zlib level 0-9, None keeps the Pillow default (6)
+        :param optimize: PNG / JPEG extra pass for a smaller file
+        :param lossless: WEBP lossless mode
+        :param method: WEBP speed/size trade-off 0 (fast) - 6 (small)
+        :param colors: quantize to a palette of this many colors before saving (PNG only), keeps transparency
+        '''
+        self.format = format.upper()
+        if self.format not in self._mime_types:
+            raise ValueError(f"unsupported image format: {format}")
+        self.mime_type = self._mime_types[self.format]
+        self.colors = colors
+        self.save_options = dict()
+        if quality is not None:
+            self.save_options["quality"] = quality
+        if compress_level is not None:
+            self.save_options["compress_level"] = compress_level
+        if optimize:
+            self.save_options["optimize"] = True
+        if lossless:
+            self.save_options["lossless"] = True
+        if method is not None:
+            self.save_options["method"] = method
+
+    def prepare(self, image: Image) -> Image:
+        if self.format in self._opaque_formats and image.mode not in ("RGB", "L"):
+            return image.convert("RGB")
+        if self.colors and self.format == "PNG":
+            return image.quantize(self.colors, method=Image.Quantize.FASTOCTREE)
+        return image
+
+    def encode(self, image: Image) -> bytes:
+        buffer = BytesIO()
+        self.prepare(image).save(buffer, format=self.format, **self.save_options)
+        return buffer.getvalue()
+
+    def base64_encode(self, image: Image) -> str:
+        return base64.b64encode(self.encode(image)).decode(self._data_encoding)
+
+    def data_uri(self, image: Image) -> str:
+        return f"data:{self.mime_type};base64,{self.base64_encode(image)}"
+
+
+IMAGE_ENCODER_PRESETS = {
+    "png": {"format": "PNG"},
+    "png-fast": {"format": "PNG", "compress_level": 1},
+    "png-small": {"format": "PNG", "compress_level": 9, "optimize": True},
+    "png-palette": {"format": "PNG", "colors": 256},
+    "png-palette-fast": {"format": "PNG", "colors": 256, "compress_level": 1},
+    "jpeg": {"format": "JPEG", "quality": 85},
+    "jpeg-small": {"format": "JPEG", "quality": 70, "optimize": True},
+    "webp": {"format": "WEBP", "quality": 80},
+    "webp-lossless": {"format": "WEBP", "lossless": True, "method": 0},
+}
+
+_encoders = dict()
+
+
+def get_image_encoder(encoder) -> ImageEncoder:
+    """ 按预设名称或参数字典获取输出引擎, 也可以直接传入实现了相同方法的对象 """
+
+    if isinstance(encoder, str):
+        if encoder not in _encoders:
+            _encoders[encoder] = ImageEncoder(**IMAGE_ENCODER_PRESETS[encoder])
+        return _encoders[encoder]
+    if isinstance(encoder, dict):
+        return ImageEncoder(**encoder)
+    return encoder
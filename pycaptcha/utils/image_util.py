@@ -4,10 +4,16 @@ from __future__ import annotations
 
 import base64
 import os
+from functools import lru_cache
 from io import BytesIO
-from PIL import ImageFont, ImageDraw, Image
+from pycaptcha.utils.lazy_import import lazy_import
 from pycaptcha import BASE_DIR
 
+ImageChops = lazy_import("PIL.ImageChops")
+ImageFont = lazy_import("PIL.ImageFont")
+ImageDraw = lazy_import("PIL.ImageDraw")
+Image = lazy_import("PIL.Image")
+
 
 class ImageUtil:
     """ 图像处理工具类 """
@@ -24,7 +30,7 @@ class ImageUtil:
         self.height = height
 
     def set_text(self, image,  text, font_size, font_color) -> None:
-        font = ImageFont.truetype(self.font_path, font_size)
+        font = get_font(self.font_path, font_size)
         draw = ImageDraw.Draw(image)
         draw.text((0, 0), text, font=font, fill=font_color)
         return None
@@ -33,7 +39,9 @@ class ImageUtil:
         ps = rgba_image.load()
         ps[x, y] = c
 
-    def base64_encode_image(self, image):
+    def base64_encode_image(self, image, encoder=None):
+        if encoder is not None:
+            return encoder.base64_encode(image)
         # 创建一个内存缓冲区
         buffer = BytesIO()
         # 将图像保存到缓冲区
@@ -70,13 +78,39 @@ def is_opcacity(rgba_image, x, y) -> bool:
     return rgba_image.getpixel((x, y))[3] <= 125
 
 
+def opacity_mask(rgba_image: Image) -> Image:
+    """ 模板不透明区域蒙版(L), 不透明为255, 与 is_opcacity 判断一致 """
+
+    return rgba_image.getchannel("A").point(lambda a: 0 if a <= 125 else 255)
+
+
+def outline_mask(mask: Image) -> Image:
+    """ 描边蒙版(L), 与右侧或下方像素透明度不同的点为255, 最后一行与最后一列不描边 """
+
+    width, height = mask.size
+    # 越界部分crop会补0, 最后一行/列随后被清除
+    right = mask.crop((1, 0, width + 1, height))
+    bottom = mask.crop((0, 1, width, height + 1))
+    outline = ImageChops.lighter(ImageChops.difference(mask, right), ImageChops.difference(mask, bottom))
+    outline.paste(0, (width - 1, 0, width, height))
+    outline.paste(0, (0, height - 1, width, height))
+    return outline
+
+
 def get_font_path() -> str:
     return os.path.join(BASE_DIR, "resource/fonts/WenQuanZhengHei.ttf")
 
 
+@lru_cache(maxsize=32)
+def get_font(font_path: str, font_size: int) -> ImageFont.FreeTypeFont:
+    """ 字体对象缓存, 按(路径, 字号)复用已解析的TTF """
+
+    return ImageFont.truetype(font_path, font_size)
+
+
 def set_art_text(background_image: ImageUtil, word: str, font_size: int, point: dict,fill=None) -> None:
 
-    font = ImageFont.truetype(get_font_path(), font_size)
+    font = get_font(get_font_path(), font_size)
     rgba_image = ImageDraw.Draw(background_image.rgba_image)
     if fill is None:
         rgba_image.text((point.get("x"), point.get("y")), word, font=font)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+import importlib
+
+
+class LazyModule:
+    """ 首次访问属性时才导入的模块, 只做校验的进程不会导入 PIL; 并发的首次导入由 importlib 的模块锁串行化 """
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    '''
+    module imported on first attribute access, e.g. Image = lazy_import("PIL.Image")
+    '''
+    return LazyModule(name)
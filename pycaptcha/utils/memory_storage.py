@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+import heapq
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from pycaptcha.utils.storage import BaseStorage
+
+
+class _Shard:
+    __slots__ = ("lock", "entries", "expiry_heap", "max_entries")
+
+    def __init__(self, max_entries: int) -> None:
+        self.lock = threading.Lock()
+        # key -> (value, expires_at)
+        self.entries = dict()
+        # (expires_at, key), 可能包含已被覆盖或删除的旧记录, 清理时跳过
+        self.expiry_heap = []
+        self.max_entries = max_entries
+
+    def purge(self, now: float) -> None:
+        heap = self.expiry_heap
+        entries = self.entries
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            entry = entries.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del entries[key]
+        # 旧记录过多时重建堆
+        if len(heap) > 2 * len(entries) + 64:
+            self.expiry_heap = [(expires_at, key) for key, (_, expires_at) in entries.items()]
+            heapq.heapify(self.expiry_heap)
+        return None
+
+    def evict_one(self) -> bool:
+        """ 淘汰最早过期的一个 key """
+
+        heap = self.expiry_heap
+        entries = self.entries
+        while heap:
+            expires_at, key = heapq.heappop(heap)
+            entry = entries.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del entries[key]
+                return True
+        return False
+
+    def put(self, key, value: bytes, expire_time: int, now: float) -> None:
+        self.purge(now)
+        if key not in self.entries:
+            while len(self.entries) >= self.max_entries and self.evict_one():
+                pass
+        expires_at = now + expire_time
+        self.entries[key] = (value, expires_at)
+        heapq.heappush(self.expiry_heap, (expires_at, key))
+        return None
+
+    def take(self, key, now: float) -> bytes | None:
+        entry = self.entries.pop(key, None)
+        if entry is None or entry[1] <= now:
+            return None
+        return entry[0]
+
+
+class MemoryStorage(BaseStorage):
+    """ 进程内TTL存储: 按key分片加锁, 过期时间用最小堆清理, 超过容量时淘汰最早过期的key """
+
+    def __init__(self, shards: int = 16, max_entries: int = 1000000) -> None:
+        self.shards = [_Shard(max(max_entries // shards, 1)) for _ in range(shards)]
+        self._shard_count = shards
+
+    @classmethod
+    def from_url(cls, url: str) -> MemoryStorage:
+        """ memory://?shards=16&max_entries=1000000 """
+
+        query = parse_qs(urlparse(url).query)
+        options = {name: int(values[-1]) for name, values in query.items() if name in ("shards", "max_entries")}
+        return cls(**options)
+
+    def _shard(self, cache_key) -> _Shard:
+        return self.shards[hash(cache_key) % self._shard_count]
+
+    @staticmethod
+    def _encode(cache_value) -> bytes:
+        if isinstance(cache_value, dict):
+            cache_value = json.dumps(cache_value)
+        if isinstance(cache_value, str):
+            return cache_value.encode("utf-8")
+        if isinstance(cache_value, (int, float)):
+            return str(cache_value).encode("utf-8")
+        return bytes(cache_value)
+
+    def setex(self, cache_key: str, cache_value, expire_time: int) -> None:
+        value = self._encode(cache_value)
+        shard = self._shard(cache_key)
+        with shard.lock:
+            shard.put(cache_key, value, expire_time, time.monotonic())
+        return None
+
+    def set(self, cache_key: str, cache_value, expire_time: int) -> None:
+        return self.setex(cache_key, cache_value, expire_time)
+
+    def get(self, cache_key: str) -> bytes | None:
+        shard = self._shard(cache_key)
+        entry = shard.entries.get(cache_key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            with shard.lock:
+                shard.purge(time.monotonic())
+            return None
+        return entry[0]
+
+    def delete(self, cache_key) -> None:
+        self.pop(cache_key)
+        return None
+
+    def pop(self, cache_key) -> bool:
+        shard = self._shard(cache_key)
+        with shard.lock:
+            return shard.take(cache_key, time.monotonic()) is not None
+
+    def take(self, cache_key: str) -> bytes | None:
+        shard = self._shard(cache_key)
+        with shard.lock:
+            return shard.take(cache_key, time.monotonic())
+
+    def set_nx(self, cache_key: str, cache_value, expire_time: int) -> bool:
+        value = self._encode(cache_value)
+        shard = self._shard(cache_key)
+        with shard.lock:
+            now = time.monotonic()
+            entry = shard.entries.get(cache_key)
+            if entry is not None and entry[1] > now:
+                return False
+            shard.put(cache_key, value, expire_time, now)
+        return True
+
+    def incr(self, cache_key: str, amount: int = 1) -> int:
+        shard = self._shard(cache_key)
+        with shard.lock:
+            now = time.monotonic()
+            entry = shard.entries.get(cache_key)
+            if entry is not None and entry[1] > now:
+                value = int(entry[0]) + amount
+                shard.entries[cache_key] = (str(value).encode("utf-8"), entry[1])
+            else:
+                value = amount
+                shard.put(cache_key, str(value).encode("utf-8"), float("inf"), now)
+        return value
+
+    def take_tokens(self, cache_key: str, rate: float, burst: int, cost: int = 1) -> float:
+        """ 令牌桶以 (剩余令牌, 更新时间) 保存, 补满所需时间后过期, 满桶与不存在等价 """
+
+        shard = self._shard(cache_key)
+        with shard.lock:
+            now = time.monotonic()
+            entry = shard.entries.get(cache_key)
+            if entry is not None and entry[1] > now:
+                tokens, updated = entry[0]
+                tokens = min(burst, tokens + (now - updated) * rate)
+            else:
+                tokens = burst
+            if tokens < cost:
+                return (cost - tokens) / rate
+            tokens -= cost
+            shard.put(cache_key, (tokens, now), (burst - tokens) / rate + 1, now)
+        return 0.0
+
+    def consume(self, cache_key: str, next_key: str, next_value, expire_time: int) -> bytes | None:
+        shard = self._shard(cache_key)
+        with shard.lock:
+            value = shard.take(cache_key, time.monotonic())
+        # next_key 是新生成的随机id, 在写入前不会被其他请求访问, 无需与取出操作放在同一把锁内
+        if value is not None:
+            self.setex(next_key, next_value, expire_time)
+        return value
+
+    def __len__(self) -> int:
+        return sum(len(shard.entries) for shard in self.shards)
+
+    def clear(self) -> None:
+        for shard in self.shards:
+            with shard.lock:
+                shard.entries.clear()
+                shard.expiry_heap = []
+        return None
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+import bisect
+import functools
+import threading
+import time
+
+from pycaptcha.utils.storage import BaseStorage
+
+
+class NullSink:
+    """ 默认不记录, 计时代码只检查 enabled """
+
+    enabled = False
+
+    def observe(self, stage: str, seconds: float) -> None:
+        return None
+
+
+class HistogramSink(NullSink):
+    """ 进程内按阶段统计的耗时直方图 """
+
+    enabled = True
+    default_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                       2.5, 5.0)
+
+    def __init__(self, buckets: tuple = None) -> None:
+        self.buckets = tuple(sorted(buckets or self.default_buckets))
+        self._lock = threading.Lock()
+        # stage -> [各区间计数 (最后一个为 +Inf), 总耗时, 次数]
+        self._stages = dict()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+        return None
+
+    def snapshot(self) -> dict:
+        """ stage -> {count, sum, buckets: [(le, 累计次数)]} """
+
+        with self._lock:
+            stages = {stage: (list(counts), total, count) for stage, (counts, total, count) in self._stages.items()}
+        result = dict()
+        for stage, (counts, total, count) in sorted(stages.items()):
+            cumulative, buckets = 0, []
+            for le, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                buckets.append((le, cumulative))
+            result[stage] = {"count": count, "sum": total, "buckets": buckets}
+        return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages = dict()
+        return None
+
+
+class PrometheusSink(HistogramSink):
+    """ 直方图以 Prometheus 文本格式输出 """
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+    metric_name = "pycaptcha_stage_seconds"
+
+    def exposition(self) -> str:
+        name = self.metric_name
+        lines = [
+            f"# HELP {name} Latency of captcha generation, verification and storage stages.",
+            f"# TYPE {name} histogram",
+        ]
+        for stage, histogram in self.snapshot().items():
+            for le, count in histogram["buckets"]:
+                le = "+Inf" if le == float("inf") else repr(le)
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram["sum"]!r}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+_sink = NullSink()
+
+
+def set_metrics_sink(sink) -> None:
+    """ 设置进程内的计时输出, None 恢复为不记录 """
+
+    global _sink
+    _sink = sink if sink is not None else NullSink()
+    return None
+
+
+def get_metrics_sink():
+    return _sink
+
+
+def start_timer() -> float:
+    """ 未开启时返回 0, 之后的 lap 直接返回 """
+
+    return time.perf_counter() if _sink.enabled else 0.0
+
+
+def lap(stage: str, start: float) -> float:
+    """ 记录 start 到此刻的耗时, 返回此刻作为下一阶段的起点 """
+
+    if not start:
+        return 0.0
+    now = time.perf_counter()
+    _sink.observe(stage, now - start)
+    return now
+
+
+def timed(stage: str):
+    """ 记录函数耗时的装饰器 """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _sink.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _sink.observe(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class InstrumentedStorage(BaseStorage):
+    """ 记录每次存储调用耗时的代理, 其它属性透传给原存储对象 """
+
+    def __init__(self, storage) -> None:
+        self.storage = storage
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+    @timed("storage.setex")
+    def setex(self, cache_key: str, cache_value, expire_time: int) -> None:
+        return self.storage.setex(cache_key, cache_value, expire_time)
+
+    @timed("storage.set")
+    def set(self, cache_key: str, cache_value, expire_time: int) -> None:
+        return self.storage.set(cache_key, cache_value, expire_time)
+
+    @timed("storage.get")
+    def get(self, cache_key: str) -> bytes | None:
+        return self.storage.get(cache_key)
+
+    @timed("storage.delete")
+    def delete(self, cache_key) -> None:
+        return self.storage.delete(cache_key)
+
+    @timed("storage.pop")
+    def pop(self, cache_key) -> bool:
+        return self.storage.pop(cache_key)
+
+    @timed("storage.take")
+    def take(self, cache_key: str) -> bytes | None:
+        return self.storage.take(cache_key)
+
+    @timed("storage.set_nx")
+    def set_nx(self, cache_key: str, cache_value, expire_time: int) -> bool:
+        return self.storage.set_nx(cache_key, cache_value, expire_time)
+
+    @timed("storage.incr")
+    def incr(self, cache_key: str, amount: int = 1) -> int:
+        return self.storage.incr(cache_key, amount)
+
+    @timed("storage.take_tokens")
+    def take_tokens(self, cache_key: str, rate: float, burst: int, cost: int = 1) -> float:
+        return self.storage.take_tokens(cache_key, rate, burst, cost)
+
+    @timed("storage.consume")
+    def consume(self, cache_key: str, next_key: str, next_value, expire_time: int) -> bytes | None:
+        return self.storage.consume(cache_key, next_key, next_value, expire_time)
+
+    @timed("storage.pop_many")
+    def pop_many(self, cache_keys: list) -> list:
+        return self.storage.pop_many(cache_keys)
+
+    @timed("storage.consume_many")
+    def consume_many(self, items: list) -> list:
+        return self.storage.consume_many(items)
+
+    @timed("storage.delete_many")
+    def delete_many(self, cache_keys: list) -> None:
+        return self.storage.delete_many(cache_keys)
+
+    def pipeline(self) -> InstrumentedStorage:
+        return InstrumentedStorage(self.storage.pipeline())
+
+    @timed("storage.execute")
+    def execute(self) -> list:
+        return self.storage.execute()
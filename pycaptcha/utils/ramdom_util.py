@@ -1,47 +1,138 @@
 #!/usr/bin/env python
 # -*- coding:utf-8 -*-
-import time
+from __future__ import annotations
+
+import os
 import random
+import secrets
+import threading
+
+
+# 每个整数占用的字节数 -> memoryview 格式
+_int_formats = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+
+class RandomSource(random.Random):
+    """ 验证码使用的随机数生成器, 在 random.Random 基础上提供批量取值 """
+
+    def ints(self, min_value: int, max_value: int, count: int) -> list:
+        """ count 个 [min_value, max_value] 内的整数, 一次取足随机字节后按定长切分, 超出范围的值单独重抽 """
+
+        span = max_value - min_value + 1
+        if span <= 1:
+            return [min_value] * count
+        bits = (span - 1).bit_length()
+        if bits > 64:
+            return [min_value + self.randrange(span) for _ in range(count)]
+        size = 1 << ((bits - 1) // 8).bit_length()
+        mask = (1 << bits) - 1
+        values = memoryview(self.randbytes(size * count)).cast(_int_formats[size])
+        return [min_value + (value if value < span else self.randrange(span))
+                for value in (value & mask for value in values)]
+
+    def colors(self, count: int) -> list:
+        """ count 个随机 RGB 颜色 """
+
+        data = self.getrandbits(24 * count).to_bytes(3 * count, "big") if count else b""
+        it = iter(data)
+        return list(zip(it, it, it))
+
+    def randbytes(self, n: int) -> bytes:
+        """ n 个随机字节, 与 Python 3.9 的 random.randbytes 相同, 兼容 3.8 """
+
+        return self.getrandbits(n * 8).to_bytes(n, "little") if n else b""
+
+
+_local = threading.local()
+# 固定种子模式, None 表示从 secrets 取种子
+_seed = None
+# set_random_seed 或 fork 后递增, 各线程据此重建生成器
+_generation = 0
+_lock = threading.Lock()
+_thread_counter = 0
+
+
+def _reset_after_fork() -> None:
+    global _generation
+    _generation += 1
+
+
+if hasattr(os, "register_at_fork"):
+    # 子进程不能沿用父进程的随机序列
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def set_random_seed(seed=None) -> None:
+    '''
+    switch every thread to a new generator
+    :param seed: fixed seed for reproducible benchmarks and golden-image tests, None seeds from secrets
+    '''
+    global _seed, _generation, _thread_counter
+    with _lock:
+        _seed = seed
+        _thread_counter = 0
+        _generation += 1
+    return None
+
+
+def get_random() -> RandomSource:
+    """ 当前线程的随机数生成器, 首次使用时创建并只播种一次 """
+
+    source = getattr(_local, "source", None)
+    if source is not None and _local.generation == _generation:
+        return source
+    global _thread_counter
+    with _lock:
+        generation = _generation
+        if _seed is None:
+            seed = secrets.randbits(128)
+        else:
+            # 固定种子模式下按线程首次取用的顺序派生种子
+            seed = f"{_seed}:{_thread_counter}"
+            _thread_counter += 1
+    source = RandomSource(seed)
+    _local.source = source
+    _local.generation = generation
+    return source
 
 
-def generate_random_int(min_value: int, max_value: int) -> int:
+def generate_random_int(min_value: int, max_value: int, rng: RandomSource = None) -> int:
     """
     generate random int number
     :param min_value:
     :param max_value:
+    :param rng: random source, defaults to the current thread's
     :return: int
     """
 
     if (min_value >= max_value) or max_value == 0:
         return max_value
-    random.seed(time.time())
-    return random.randint(min_value, max_value)
+    return (rng or get_random()).randint(min_value, max_value)
 
 
-def generate_code(code_length: int = 6) -> str:
+def generate_code(code_length: int = 6, rng: RandomSource = None) -> str:
     """ 生成随机的code_length位数的验证码 """
 
+    rng = rng or get_random()
     code = ''
     for i in range(code_length):
-        n = random.randint(0, 9)
-        b = chr(random.randint(65, 90))
-        c = chr(random.randint(97, 122))
-        code += str(random.choice([n, b, c]))
+        n = rng.randint(0, 9)
+        b = chr(rng.randint(65, 90))
+        c = chr(rng.randint(97, 122))
+        code += str(rng.choice([n, b, c]))
     return code
 
 
-def generate_code_chr() -> str:
+def generate_code_chr(rng: RandomSource = None) -> str:
     """ 获取一个随机字符, 数字或小写字母 """
-    random_num = str(random.randint(0, 9))
-    random_low_alpha = chr(random.randint(97, 122))
-    random_char = random.choice([random_num, random_low_alpha])
+    rng = rng or get_random()
+    random_num = str(rng.randint(0, 9))
+    random_low_alpha = chr(rng.randint(97, 122))
+    random_char = rng.choice([random_num, random_low_alpha])
     return random_char
 
 
-def generate_random_background_color() -> tuple:
+def generate_random_background_color(rng: RandomSource = None) -> tuple:
     """ 生成随机的背景 """
 
-    c1 = random.randint(0, 255)
-    c2 = random.randint(0, 255)
-    c3 = random.randint(0, 255)
-    return c1, c2, c3
+    return (rng or get_random()).colors(1)[0]
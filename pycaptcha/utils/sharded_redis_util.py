@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+import bisect
+import copy
+import hashlib
+from urllib.parse import urlparse
+
+from pycaptcha.utils.redis_util import RedisUtil
+from pycaptcha.utils.storage import BaseStorage
+
+
+def get_key_tag(cache_key: str) -> str:
+    """ 与 redis cluster 相同: key 中第一对非空 {} 之间的部分参与分片, 没有时使用整个 key """
+
+    start = cache_key.find("{")
+    if start >= 0:
+        end = cache_key.find("}", start + 1)
+        if end > start + 1:
+            return cache_key[start + 1:end]
+    return cache_key
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """ 一致性哈希环: 每个节点放置 replicas 个虚拟节点, 增减节点时只有约 1/N 的 key 改变归属 """
+
+    def __init__(self, names: list, replicas: int = 160) -> None:
+        if len(set(names)) != len(names):
+            raise ValueError("shard names must be unique")
+        points = sorted((_hash(f"{name}#{replica}"), index)
+                        for index, name in enumerate(names) for replica in range(replicas))
+        self.names = list(names)
+        self._hashes = [point for point, _ in points]
+        self._nodes = [index for _, index in points]
+
+    def get_node(self, key: str) -> int:
+        """ key 所属节点的下标 """
+
+        position = bisect.bisect(self._hashes, _hash(key))
+        return self._nodes[position % len(self._nodes)]
+
+
+def get_shard_name(shard) -> str:
+    """ 分片在哈希环上的名称: host:port/db, 不含密码, 调整分片顺序不影响 key 的归属 """
+
+    if isinstance(shard, str):
+        url = urlparse(shard)
+        return f"{url.hostname}:{url.port or 6379}{url.path or '/0'}"
+    client = shard.redis if isinstance(shard, RedisUtil) else shard
+    kwargs = client.connection_pool.connection_kwargs
+    if "path" in kwargs:
+        return f"{kwargs['path']}/{kwargs.get('db', 0)}"
+    return f"{kwargs.get('host', 'localhost')}:{kwargs.get('port', 6379)}/{kwargs.get('db', 0)}"
+
+
+class ShardedRedisUtil(BaseStorage):
+    """
+    客户端分片的多个 redis: key 按 hash tag 经一致性哈希分到各分片; 同一 token 的答案、captcha_id 与图片
+    key 带有相同的 hash tag, consume 等多 key 操作总在同一分片内完成; 批量操作按分片分组, 每个分片一次往返
+    """
+
+    def __init__(self, shards: list, names: list = None, replicas: int = 160) -> None:
+        '''
+
+        :param shards: redis urls, redis clients or RedisUtil instances
+        :param names: names on the hash ring, default host:port/db of each shard
+        '''
+        if not shards:
+            raise ValueError("at least one redis shard is required")
+        self.names = list(names) if names is not None else [get_shard_name(shard) for shard in shards]
+        self.shards = [shard if isinstance(shard, RedisUtil) else
+                       RedisUtil(None, shard) if isinstance(shard, str) else RedisUtil(shard, None)
+                       for shard in shards]
+        self.ring = HashRing(self.names, replicas)
+
+    def get_shard(self, cache_key: str) -> RedisUtil:
+        return self.shards[self.ring.get_node(get_key_tag(cache_key))]
+
+    def group(self, cache_keys: list) -> dict:
+        """ 分片下标 -> 属于该分片的 cache_keys 下标 """
+
+        groups = dict()
+        for index, cache_key in enumerate(cache_keys):
+            groups.setdefault(self.ring.get_node(get_key_tag(cache_key)), []).append(index)
+        return groups
+
+    def setex(self, cache_key: str, cache_value, expire_time: int) -> None:
+        return self.get_shard(cache_key).setex(cache_key, cache_value, expire_time)
+
+    def set(self, cache_key: str, cache_value, expire_time: int) -> None:
+        return self.get_shard(cache_key).set(cache_key, cache_value, expire_time)
+
+    def get(self, cache_key: str) -> bytes | None:
+        return self.get_shard(cache_key).get(cache_key)
+
+    def delete(self, cache_key) -> None:
+        return self.get_shard(cache_key).delete(cache_key)
+
+    def pop(self, cache_key) -> bool:
+        return self.get_shard(cache_key).pop(cache_key)
+
+    def take(self, cache_key: str) -> bytes | None:
+        return self.get_shard(cache_key).take(cache_key)
+
+    def set_nx(self, cache_key: str, cache_value, expire_time: int) -> bool:
+        return self.get_shard(cache_key).set_nx(cache_key, cache_value, expire_time)
+
+    def incr(self, cache_key: str, amount: int = 1) -> int:
+        return self.get_shard(cache_key).incr(cache_key, amount)
+
+    def take_tokens(self, cache_key: str, rate: float, burst: int, cost: int = 1) -> float:
+        return self.get_shard(cache_key).take_tokens(cache_key, rate, burst, cost)
+
+    def consume(self, cache_key: str, next_key: str, next_value, expire_time: int) -> bytes | None:
+        """ next_key 需与 cache_key 在同一分片, 即带有相同的 hash tag """
+
+        return self.get_shard(cache_key).consume(cache_key, next_key, next_value, expire_time)
+
+    def pop_many(self, cache_keys: list) -> list:
+        results = [False] * len(cache_keys)
+        for shard, indexes in self.group(cache_keys).items():
+            deleted = self.shards[shard].pop_many([cache_keys[index] for index in indexes])
+            for index, value in zip(indexes, deleted):
+                results[index] = value
+        return results
+
+    def consume_many(self, items: list) -> list:
+        values = [None] * len(items)
+        for shard, indexes in self.group([item[0] for item in items]).items():
+            consumed = self.shards[shard].consume_many([items[index] for index in indexes])
+            for index, value in zip(indexes, consumed):
+                values[index] = value
+        return values
+
+    def delete_many(self, cache_keys: list) -> None:
+        for shard, indexes in self.group(cache_keys).items():
+            self.shards[shard].delete_many([cache_keys[index] for index in indexes])
+        return None
+
+    def pipeline(self) -> ShardedRedisUtil:
+        """ 每个分片一个非事务管道, 调用 execute() 依次提交 """
+
+        pipeline = copy.copy(self)
+        pipeline.shards = [shard.pipeline() for shard in self.shards]
+        return pipeline
+
+    def execute(self) -> list:
+        """ 按分片顺序拼接各管道的结果 """
+
+        results = []
+        for shard in self.shards:
+            results.extend(shard.execute())
+        return results
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+
+class BaseStorage:
+    """
+    验证码缓存存储接口, RedisUtil 与 MemoryStorage 均实现该接口
+    值以 bytes 返回, 写入 str 时按 utf-8 编码
+    """
+
+    def setex(self, cache_key: str, cache_value, expire_time: int) -> None:
+        raise NotImplementedError
+
+    def set(self, cache_key: str, cache_value, expire_time: int) -> None:
+        raise NotImplementedError
+
+    def get(self, cache_key: str) -> bytes | None:
+        raise NotImplementedError
+
+    def delete(self, cache_key) -> None:
+        raise NotImplementedError
+
+    def pop(self, cache_key) -> bool:
+        """ 删除 key, 返回删除前是否存在 """
+
+        raise NotImplementedError
+
+    def take(self, cache_key: str) -> bytes | None:
+        """ 原子地取出并删除 cache_key, 用于只能读取一次的值 """
+
+        raise NotImplementedError
+
+    def set_nx(self, cache_key: str, cache_value, expire_time: int) -> bool:
+        """ key 不存在时写入, 返回是否写入成功 """
+
+        raise NotImplementedError
+
+    def incr(self, cache_key: str, amount: int = 1) -> int:
+        """ 原子地给计数加上 amount, 返回增加后的值; key 不存在时从 0 开始, 不过期 """
+
+        raise NotImplementedError
+
+    def consume(self, cache_key: str, next_key: str, next_value, expire_time: int) -> bytes | None:
+        """ 原子地取出并删除 cache_key, 存在时同时写入 next_key, 返回取出的值 """
+
+        raise NotImplementedError
+
+    def take_tokens(self, cache_key: str, rate: float, burst: int, cost: int = 1) -> float:
+        """
+        原子地从令牌桶 cache_key 取出 cost 个令牌, 桶每秒补充 rate 个, 最多 burst 个, 不存在时为满桶;
+        cost 为负时放回令牌, 读取时仍以 burst 为上限
+        :return: 0 表示已取出; 令牌不足时不扣减, 返回需要等待的秒数
+        """
+        raise NotImplementedError
+
+    def pop_many(self, cache_keys: list) -> list:
+        return [self.pop(cache_key) for cache_key in cache_keys]
+
+    def consume_many(self, items: list) -> list:
+        """
+        :param items: [(cache_key, next_key, next_value, expire_time)]
+        :return: 按顺序返回取出的值, 不存在为 None
+        """
+        return [self.consume(*item) for item in items]
+
+    def delete_many(self, cache_keys: list) -> None:
+        for cache_key in cache_keys:
+            self.delete(cache_key)
+        return None
+
+    def pipeline(self) -> BaseStorage:
+        """ 返回批量写入对象, 调用 execute() 提交; 默认直接写入 """
+
+        return self
+
+    def execute(self) -> list:
+        return []
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+storage conformance checks shared by every BaseStorage backend
+
+    python -m pycaptcha.utils.storage_conformance
+    python -m pycaptcha.utils.storage_conformance redis://localhost:6379/15
+    python -m pycaptcha.utils.storage_conformance redis+cluster://localhost:7000 redis://host-a:6379/0,redis://host-b:6379/0
+"""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+
+from pycaptcha.utils.uuid_util import generate_uuid
+
+
+class ConformanceError(Exception):
+    """ 存储实现不符合 BaseStorage 的约定 """
+
+
+def _expect(condition: bool, message: str) -> None:
+    """ 不使用 assert, python -O 下检查仍然生效 """
+
+    if not condition:
+        raise ConformanceError(message)
+    return None
+
+
+def _key(name: str, tag: str = None) -> str:
+    """ 带 hash tag 的 key, 需要落在同一 redis 槽位/分片的 key 传入相同的 tag """
+
+    return f"conformance:{{{tag or generate_uuid()}}}:{name}:{generate_uuid()}"
+
+
+def check_set_get(storage) -> None:
+    key = _key("set")
+    _expect(storage.get(key) is None, "get of a missing key returns None")
+    storage.setex(key, "value", 60)
+    _expect(storage.get(key) == b"value", "setex str value reads back as bytes")
+    storage.set(key, b"\x01\x02", 60)
+    _expect(storage.get(key) == b"\x01\x02", "set bytes value reads back unchanged")
+    storage.setex(key, {"x": 1}, 60)
+    _expect(storage.get(key) == b'{"x": 1}', "setex dict value is stored as json")
+    storage.delete(key)
+    _expect(storage.get(key) is None, "get after delete returns None")
+
+
+def check_pop(storage) -> None:
+    key = _key("pop")
+    storage.setex(key, "1", 60)
+    _expect(storage.pop(key) is True, "pop of an existing key returns True")
+    _expect(storage.pop(key) is False, "second pop returns False")
+    _expect(storage.get(key) is None, "get after pop returns None")
+
+
+def check_consume(storage) -> None:
+    tag = generate_uuid()
+    key, next_key = _key("consume", tag), _key("next", tag)
+    _expect(storage.consume(key, next_key, "token", 60) is None, "consume of a missing key returns None")
+    _expect(storage.get(next_key) is None, "consume of a missing key does not write next_key")
+    storage.setex(key, "answer", 60)
+    _expect(storage.consume(key, next_key, "token", 60) == b"answer", "consume returns the stored value")
+    _expect(storage.get(key) is None, "consume deletes the key")
+    _expect(storage.get(next_key) == b"token", "consume writes next_key")
+    _expect(storage.consume(key, next_key, "token", 60) is None, "second consume returns None")
+    storage.delete(next_key)
+
+
+def check_take(storage) -> None:
+    key = _key("take")
+    _expect(storage.take(key) is None, "take of a missing key returns None")
+    storage.setex(key, b"\x89PNG", 60)
+    _expect(storage.take(key) == b"\x89PNG", "take returns the stored bytes")
+    _expect(storage.take(key) is None, "second take returns None")
+    _expect(storage.get(key) is None, "get after take returns None")
+
+
+def check_set_nx(storage) -> None:
+    key = _key("set_nx")
+    _expect(storage.set_nx(key, "1", 60) is True, "set_nx of a missing key returns True")
+    _expect(storage.set_nx(key, "2", 60) is False, "set_nx of an existing key returns False")
+    _expect(storage.get(key) == b"1", "set_nx does not overwrite an existing key")
+    storage.delete(key)
+    _expect(storage.set_nx(key, "3", 60) is True, "set_nx after delete returns True")
+    storage.delete(key)
+
+
+def check_incr(storage) -> None:
+    key = _key("incr")
+    _expect(storage.incr(key) == 1, "incr of a missing key starts at 0")
+    _expect(storage.incr(key, 31) == 32, "incr adds the amount")
+    _expect(storage.get(key) == b"32", "incr value reads back as a decimal string")
+    storage.delete(key)
+    _expect(storage.incr(key, 5) == 5, "incr after delete starts at 0")
+    storage.delete(key)
+
+
+def check_take_tokens(storage) -> None:
+    key = _key("tokens")
+    _expect(storage.take_tokens(key, 1, 2) == 0, "a full bucket gives a token")
+    _expect(storage.take_tokens(key, 1, 2) == 0, "a bucket of 2 gives a second token")
+    wait = storage.take_tokens(key, 1, 2)
+    _expect(0 < wait <= 1, "an empty bucket waits at most 1 / rate seconds")
+    _expect(storage.take_tokens(key, 1, 2, 3) > 0, "cost above burst is rejected")
+    key = _key("tokens")
+    _expect(storage.take_tokens(key, 1000, 5, 5) == 0, "a new bucket gives burst tokens at once")
+    time.sleep(0.01)
+    _expect(storage.take_tokens(key, 1000, 5, 5) == 0, "a drained bucket refills at rate")
+    storage.delete(key)
+    # 放回的令牌可再次取出, 但不超过 burst
+    key = _key("tokens")
+    _expect(storage.take_tokens(key, 0.01, 1) == 0, "a new bucket gives its token")
+    _expect(storage.take_tokens(key, 0.01, 1, -1) == 0, "a refund is accepted")
+    _expect(storage.take_tokens(key, 0.01, 1) == 0, "a refunded token can be taken again")
+    _expect(storage.take_tokens(key, 0.01, 1) > 0, "the bucket is empty after the refunded token is taken")
+    _expect(storage.take_tokens(key, 0.01, 1, -2) == 0, "a refund above burst is accepted")
+    _expect(storage.take_tokens(key, 0.01, 1, 2) > 0, "refunds never raise the bucket above burst")
+    storage.delete(key)
+
+
+def check_consume_once_concurrently(storage, threads: int = 16) -> None:
+    tag = generate_uuid()
+    key = _key("race", tag)
+    storage.setex(key, "answer", 60)
+    results = []
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        barrier.wait()
+        results.append(storage.consume(key, _key("race-next", tag), "token", 60))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    consumed = [value for value in results if value is not None]
+    _expect(len(consumed) == 1, "exactly one concurrent consume gets the value")
+
+
+def check_batches(storage) -> None:
+    tags = [generate_uuid() for _ in range(3)]
+    keys = [_key("batch", tag) for tag in tags]
+    next_keys = [_key("batch-next", tag) for tag in tags]
+    storage.setex(keys[0], "a", 60)
+    storage.setex(keys[2], "c", 60)
+    values = storage.consume_many([(keys[i], next_keys[i], "t", 60) for i in range(3)])
+    _expect(values == [b"a", None, b"c"], "consume_many returns values in order")
+    _expect(storage.pop_many(next_keys) == [True, False, True], "consume_many writes next_key only for consumed keys")
+    _expect(storage.pop_many([]) == [], "pop_many of no keys returns []")
+    _expect(storage.consume_many([]) == [], "consume_many of no items returns []")
+    storage.setex(keys[1], "b", 60)
+    storage.delete_many([keys[1]])
+    _expect(storage.get(keys[1]) is None, "delete_many deletes the keys")
+
+
+def check_pipeline(storage) -> None:
+    keys = [_key("pipeline") for _ in range(3)]
+    pipeline = storage.pipeline()
+    for key in keys:
+        pipeline.setex(key, "v", 60)
+    pipeline.execute()
+    _expect([storage.get(key) for key in keys] == [b"v"] * 3, "pipeline writes every key on execute")
+    storage.delete_many(keys)
+
+
+def check_expiry(storage) -> None:
+    key = _key("expiry")
+    storage.setex(key, "v", 1)
+    _expect(storage.get(key) == b"v", "a key reads back before it expires")
+    time.sleep(1.2)
+    _expect(storage.get(key) is None, "a key is gone after it expires")
+    _expect(storage.pop(key) is False, "pop of an expired key returns False")
+
+
+CHECKS = [check_set_get, check_pop, check_consume, check_take, check_set_nx, check_incr, check_take_tokens,
+          check_consume_once_concurrently, check_batches, check_pipeline, check_expiry]
+
+
+def run_conformance(storage, checks: list = None) -> list:
+    """ 对存储实现运行一致性检查, 返回失败的检查名称与原因 """
+
+    failures = []
+    for check in checks or CHECKS:
+        try:
+            check(storage)
+        except ConformanceError as e:
+            failures.append(f"{check.__name__} ({e})")
+    return failures
+
+
+def main(argv: list = None) -> int:
+    from pycaptcha.utils.memory_storage import MemoryStorage
+    from pycaptcha.utils.redis_util import RedisUtil
+    from pycaptcha.utils.sharded_redis_util import ShardedRedisUtil
+
+    argv = sys.argv[1:] if argv is None else argv
+    backends = [("memory", MemoryStorage())]
+    for url in argv:
+        if url.startswith("memory://"):
+            storage = MemoryStorage.from_url(url)
+        elif "," in url:
+            storage = ShardedRedisUtil(url.split(","))
+        else:
+            storage = RedisUtil(None, url)
+        backends.append((url, storage))
+    exit_code = 0
+    for name, storage in backends:
+        failures = run_conformance(storage)
+        print(f"{name}: {'ok' if not failures else 'FAILED ' + ', '.join(failures)}")
+        exit_code = exit_code or int(bool(failures))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
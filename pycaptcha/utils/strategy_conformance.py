@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+CaptchaStrategy checks: malformed batch items fail on their own without aborting the batch,
+token hash tags spread across redis slots / shards for plain and sealed tokens
+
+    python -m pycaptcha.utils.strategy_conformance
+    python -m pycaptcha.utils.strategy_conformance redis://localhost:6379/15
+"""
+from __future__ import annotations
+
+import sys
+
+from pycaptcha.strategy.captcha_registry import SIMPLE_CAPTCHA, BLOCK_PUZZLE_CAPTCHA, CLICK_WORD_CAPTCHA
+from pycaptcha.utils.sealed_token import TokenSealer
+from pycaptcha.utils.storage_conformance import ConformanceError, _expect
+from pycaptcha.utils.uuid_util import SEALED_TOKEN_MARKER, get_hash_tag
+
+
+def _stored(strategy, kind: str) -> tuple:
+    """ 生成并写入一个验证码, 返回 (token, 正确答案), 答案为 verify 的 params 格式 """
+
+    captcha = strategy.get_captcha_instance(kind)
+    data = captcha.render()
+    if kind == SIMPLE_CAPTCHA:
+        params = [{"code": data["data"]}]
+    elif kind == BLOCK_PUZZLE_CAPTCHA:
+        params = [dict(data["data"])]
+    else:
+        params = [dict(point) for point in data["data"]]
+    captcha.store(data)
+    return data["token"], params
+
+
+def check_verify_many_mixed_batch(strategy) -> None:
+    slider_token, slider_params = _stored(strategy, BLOCK_PUZZLE_CAPTCHA)
+    dict_token, dict_params = _stored(strategy, BLOCK_PUZZLE_CAPTCHA)
+    click_token, click_params = _stored(strategy, CLICK_WORD_CAPTCHA)
+    simple_token, simple_params = _stored(strategy, SIMPLE_CAPTCHA)
+    items = [
+        (slider_token, slider_params),
+        # 参数是字典而不是列表
+        (dict_token, dict_params[0]),
+        # 点选坐标不足
+        (click_token, click_params[:1]),
+        ("UNKNOWN-" + simple_token.partition("-")[2], simple_params),
+        (None, simple_params),
+        (1, simple_params),
+        None,
+        (simple_token,),
+        (simple_token, simple_params),
+    ]
+    results = strategy.verify_many(items)
+    _expect(len(results) == len(items), "verify_many returns one result per item")
+    _expect(results[0] is not None and results[-1] is not None, "valid items pass next to malformed ones")
+    for index in range(1, len(items) - 1):
+        _expect(results[index] is None, f"malformed item {items[index]!r} returns None")
+
+
+def check_second_verify_many_mixed_batch(strategy) -> None:
+    token, params = _stored(strategy, SIMPLE_CAPTCHA)
+    captcha_id = strategy.verify(token, params)
+    _expect(captcha_id is not None, "verify of the correct answer returns a captcha_id")
+    captcha_ids = [1, None, {"captcha_id": captcha_id}, "", "UNKNOWN-x", captcha_id]
+    results = strategy.second_verify_many(captcha_ids)
+    _expect(results == [False] * (len(captcha_ids) - 1) + [True], "only the valid captcha_id passes")
+    _expect(strategy.second_verify_many([captcha_id]) == [False], "a captcha_id passes second verify once")
+
+
+def check_hash_tag_spread(strategy, count: int = 1000) -> None:
+    sealer = TokenSealer("conformance")
+    for kind in (SIMPLE_CAPTCHA, BLOCK_PUZZLE_CAPTCHA, CLICK_WORD_CAPTCHA):
+        captcha = strategy.get_captcha_instance(kind)
+        tokens = [captcha.new_token() for _ in range(count)]
+        # 与 StatelessTokenMixin.seal 相同的格式, 不依赖是否配置了密钥
+        sealed = [f"{kind}-{SEALED_TOKEN_MARKER}{sealer.seal(1, 0, b'')}" for _ in range(count)]
+        for name, group in (("token", tokens), ("sealed token", sealed)):
+            tags = {get_hash_tag(token) for token in group}
+            _expect(len(tags) >= count * 0.9, f"{kind} {name} hash tags spread ({len(tags)} of {count} distinct)")
+        _expect(all(get_hash_tag(captcha.new_captcha_id(token)) == get_hash_tag(token) for token in tokens[:10]),
+                f"{kind} captcha_id keeps the hash tag of its token")
+
+
+CHECKS = [check_verify_many_mixed_batch, check_second_verify_many_mixed_batch, check_hash_tag_spread]
+
+
+def run_conformance(strategy, checks: list = None) -> list:
+    """ 对 CaptchaStrategy 运行检查, 返回失败的检查名称与原因 """
+
+    failures = []
+    for check in checks or CHECKS:
+        try:
+            check(strategy)
+        except ConformanceError as e:
+            failures.append(f"{check.__name__} ({e})")
+    return failures
+
+
+def main(argv: list = None) -> int:
+    from pycaptcha.strategy.captcha_strategy import CaptchaStrategy
+
+    argv = sys.argv[1:] if argv is None else argv
+    exit_code = 0
+    for url in argv or ["memory://"]:
+        failures = run_conformance(CaptchaStrategy(url.split(",") if "," in url else url))
+        print(f"{url}: {'ok' if not failures else 'FAILED ' + ', '.join(failures)}")
+        exit_code = exit_code or int(bool(failures))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
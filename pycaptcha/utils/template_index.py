@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import threading
+
+from pycaptcha import BASE_DIR
+from pycaptcha.utils.image_util import image_to_rgba, open_image, opacity_mask, outline_mask
+from pycaptcha.utils.lazy_import import lazy_import
+
+Image = lazy_import("PIL.Image")
+
+
+class TemplateEntry:
+    """ 单个滑块模板的预计算结果 """
+
+    __slots__ = ("src", "mtime_ns", "size", "width", "height", "mask", "outline", "bbox")
+
+    def __init__(self, src, mtime_ns, size, mask, outline):
+        self.src = src
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.width, self.height = mask.size
+        self.mask = mask
+        self.outline = outline
+        self.bbox = mask.getbbox()
+
+    @classmethod
+    def from_file(cls, src: str) -> TemplateEntry:
+        stat = os.stat(src)
+        mask = opacity_mask(image_to_rgba(open_image(src)))
+        return cls(src, stat.st_mtime_ns, stat.st_size, mask, outline_mask(mask))
+
+    def is_stale(self) -> bool:
+        try:
+            stat = os.stat(self.src)
+        except OSError:
+            return True
+        return stat.st_mtime_ns != self.mtime_ns or stat.st_size != self.size
+
+    def to_dict(self) -> dict:
+        # 1位模式按行打包, 每字节8个像素
+        return {
+            "mtime_ns": self.mtime_ns,
+            "size": self.size,
+            "width": self.width,
+            "height": self.height,
+            "mask": base64.b64encode(self.mask.convert("1").tobytes()).decode("ascii"),
+            "outline": base64.b64encode(self.outline.convert("1").tobytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, src: str, data: dict) -> TemplateEntry:
+        size = (data["width"], data["height"])
+        mask = Image.frombytes("1", size, base64.b64decode(data["mask"])).convert("L")
+        outline = Image.frombytes("1", size, base64.b64decode(data["outline"])).convert("L")
+        return cls(src, data["mtime_ns"], data["size"], mask, outline)
+
+
+class TemplateIndex:
+    """
+    滑块模板索引, 按文件路径缓存蒙版, 加载时文件修改时间或大小变化的条目自动重算;
+    设置了 index_path 时, 运行中新算出的条目写回索引文件, 下次启动直接加载
+    """
+
+    _version = 1
+
+    def __init__(self, index_path: str = None) -> None:
+        self.index_path = index_path
+        self.entries = dict()
+        self._lock = threading.Lock()
+
+    def load(self) -> TemplateIndex:
+        if not self.index_path or not os.path.exists(self.index_path):
+            return self
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != self._version:
+            return self
+        for src, item in data.get("templates", {}).items():
+            entry = TemplateEntry.from_dict(src, item)
+            if not entry.is_stale():
+                self.entries[src] = entry
+        return self
+
+    def save(self) -> None:
+        if not self.index_path:
+            return None
+        data = {
+            "version": self._version,
+            "templates": {src: entry.to_dict() for src, entry in self.entries.items()},
+        }
+        # 多个进程可能同时写回, 各自写临时文件后原子替换
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.index_path)
+        return None
+
+    def build(self, paths: list) -> bool:
+        """ 为指定模板计算索引, 已存在且未过期的条目直接复用, 返回是否有新算出的条目 """
+
+        changed = False
+        with self._lock:
+            for src in paths:
+                src = os.path.abspath(src)
+                entry = self.entries.get(src)
+                if entry is None or entry.is_stale():
+                    self.entries[src] = TemplateEntry.from_file(src)
+                    changed = True
+        return changed
+
+    def persist(self) -> None:
+        """ 写回索引文件, 目录不可写时只保留在内存中 """
+
+        with self._lock:
+            try:
+                self.save()
+            except OSError:
+                pass
+        return None
+
+    def get(self, src: str) -> TemplateEntry:
+        src = os.path.abspath(src)
+        entry = self.entries.get(src)
+        if entry is None:
+            missed = False
+            with self._lock:
+                entry = self.entries.get(src)
+                if entry is None:
+                    entry = TemplateEntry.from_file(src)
+                    self.entries[src] = entry
+                    missed = True
+            # 每个模板文件在每个进程中最多未命中一次
+            if missed:
+                self.persist()
+        return entry
+
+
+_indexes = dict()
+_indexes_lock = threading.Lock()
+
+
+def get_template_index(index_path: str = None) -> TemplateIndex:
+    """ 获取进程内共享的模板索引, 首次调用时从磁盘加载 """
+
+    index = _indexes.get(index_path)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(index_path)
+            if index is None:
+                index = TemplateIndex(index_path).load()
+                _indexes[index_path] = index
+    return index
+
+
+def list_templates(root: str) -> list:
+    paths = []
+    for dir_path, dirs, files in os.walk(root):
+        for file in files:
+            paths.append(os.path.join(dir_path, file))
+    return sorted(paths)
+
+
+def main(argv: list = None) -> None:
+    from pycaptcha.config import BlockPuzzleCaptchaConfig
+
+    parser = argparse.ArgumentParser(prog="python -m pycaptcha.utils.template_index",
+                                     description="rebuild the block puzzle template index")
+    parser.add_argument("--output", required=True, help="index file to write")
+    parser.add_argument("--templates",
+                        default=os.path.join(BASE_DIR, BlockPuzzleCaptchaConfig.template_image_root_path),
+                        help="template image directory")
+    parser.add_argument("--force", action="store_true", help="ignore the existing index and recompute everything")
+    args = parser.parse_args(argv)
+
+    index = TemplateIndex(args.output)
+    if not args.force:
+        index.load()
+    index.build(list_templates(args.templates))
+    index.save()
+    print(f"indexed {len(index.entries)} templates -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
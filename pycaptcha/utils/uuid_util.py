@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 # -*- coding:utf-8 -*-
+import base64
 import uuid
 
 
@@ -10,3 +11,41 @@ def generate_uuid() -> str:
     """
 
     return uuid.uuid4().hex
+
+
+# token id 开头参与 redis cluster / 分片路由的字符数
+HASH_TAG_LENGTH = 4
+# 无状态 token 的 token id: 标记 + base64(版本号 + 随机 nonce + ...)
+SEALED_TOKEN_MARKER = "s."
+# 版本号字节占 base64 的前两个字符, hash tag 从之后完全由 nonce 决定的字符开始取
+SEALED_HASH_TAG_OFFSET = len(SEALED_TOKEN_MARKER) + 2
+
+
+def generate_token_id(token_id_format: str = "hex", hash_tag: str = "") -> str:
+    """
+    generate token id
+    :param token_id_format: hex (32 chars) or base32 (26 chars)
+    :param hash_tag: replaces the leading characters, so the id lands on the same redis slot / shard as hash_tag
+    :return: str
+    """
+
+    if token_id_format == "base32":
+        token_id = base64.b32encode(uuid.uuid4().bytes).decode("ascii").rstrip("=").lower()
+    else:
+        token_id = uuid.uuid4().hex
+    return hash_tag + token_id[len(hash_tag):]
+
+
+def get_hash_tag(token: str) -> str:
+    """ "<验证码类型>-<token id>" 中 token id 的前 HASH_TAG_LENGTH 个字符, 无状态 token 跳过标记与版本号, 取 nonce 部分 """
+
+    token_id = (token or "").partition("-")[2]
+    if token_id.startswith(SEALED_TOKEN_MARKER):
+        token_id = token_id[SEALED_HASH_TAG_OFFSET:]
+    return token_id[:HASH_TAG_LENGTH]
+
+
+def get_tagged_key(prefix: str, token: str) -> str:
+    """ 缓存 key 带上 token 的 hash tag, 同一 token 的答案、captcha_id 与图片落在同一 redis 槽位/分片 """
+
+    return f"{prefix}:{{{get_hash_tag(token)}}}{token}"
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from __future__ import annotations
+
+import threading
+
+from pycaptcha.utils.image_util import get_font
+from pycaptcha.utils.ramdom_util import RandomSource, get_random
+
+
+class WordLayout:
+    """
+    点选文字的采样与布局: 字符表与字形边界框只计算一次, 无放回采样为 O(k);
+    按网格抖动放置, 每个网格最多一个字且字形完整落在网格内, 文字互不重叠
+    """
+
+    def __init__(self, text: str, font_path: str, font_size: int, spacing: int = 2) -> None:
+        self.font = get_font(font_path, font_size)
+        # 去重后保持原顺序
+        self.chars = tuple(dict.fromkeys(text))
+        # 相对绘制坐标的字形边界框 (left, top, right, bottom)
+        self.boxes = {char: self.font.getbbox(char) for char in self.chars}
+        self.spacing = spacing
+        self.cell_width = max([right - left for left, _, right, _ in self.boxes.values()] or [font_size]) + spacing
+        self.cell_height = max([bottom - top for _, top, _, bottom in self.boxes.values()] or [font_size]) + spacing
+        # 字形相对绘制坐标的最大偏移, 预留出来保证绘制坐标(即答案坐标)不为负
+        self.offset_x = max([left for left, _, _, _ in self.boxes.values()] + [0])
+        self.offset_y = max([top for _, top, _, _ in self.boxes.values()] + [0])
+
+    def sample(self, count: int, rng: RandomSource = None) -> list:
+        """ 无放回随机取 count 个不同的字 """
+
+        return (rng or get_random()).sample(self.chars, min(count, len(self.chars)))
+
+    def capacity(self, width: int, height: int) -> int:
+        return max((width - self.offset_x) // self.cell_width, 0) * max((height - self.offset_y) // self.cell_height, 0)
+
+    def get_box(self, word: str) -> tuple:
+        box = self.boxes.get(word)
+        return box if box is not None else self.font.getbbox(word)
+
+    def place(self, words: list, width: int, height: int, rng: RandomSource = None) -> list:
+        '''
+        place words on a width x height image
+        :return: draw points {'x', 'y'} in word order, at most capacity(width, height) of them
+        '''
+        rng = rng or get_random()
+        cols = max((width - self.offset_x) // self.cell_width, 1)
+        rows = max((height - self.offset_y) // self.cell_height, 1)
+        cells = rng.sample(range(cols * rows), min(len(words), cols * rows))
+        # 网格之外的剩余空间平均分到两侧
+        margin_x = self.offset_x + max(width - self.offset_x - cols * self.cell_width, 0) // 2
+        margin_y = self.offset_y + max(height - self.offset_y - rows * self.cell_height, 0) // 2
+        points = []
+        for word, cell in zip(words, cells):
+            left, top, right, bottom = self.get_box(word)
+            free_x = max(self.cell_width - self.spacing - (right - left), 0)
+            free_y = max(self.cell_height - self.spacing - (bottom - top), 0)
+            x = max(margin_x + (cell % cols) * self.cell_width + rng.randint(0, free_x) - left, 0)
+            y = max(margin_y + (cell // cols) * self.cell_height + rng.randint(0, free_y) - top, 0)
+            points.append({"x": x, "y": y})
+        return points
+
+
+_layouts = dict()
+_layouts_lock = threading.Lock()
+
+
+def get_word_layout(text: str, font_path: str, font_size: int) -> WordLayout:
+    """ 按(字符表, 字体路径, 字号)共享布局 """
+
+    key = (text, font_path, font_size)
+    layout = _layouts.get(key)
+    if layout is None:
+        with _layouts_lock:
+            layout = _layouts.get(key)
+            if layout is None:
+                layout = WordLayout(text, font_path, font_size)
+                _layouts[key] = layout
+    return layout